@@ -13,6 +13,7 @@ from flask_migrate import Migrate
 from flask_moment import Moment
 from dotenv import load_dotenv
 from flask_wtf.csrf import CSRFProtect
+from werkzeug.middleware.proxy_fix import ProxyFix
 
 # Local application imports
 from extensions import db, login_manager
@@ -21,6 +22,17 @@ from models import (
     Product, Article, Testimonial, Affiliate, AdsenseConfig
 )
 from utils import slugify
+from services.shared_cache import shared_cache
+from services.click_counter import click_counter
+from services.affiliate_redirects import affiliate_redirects
+from services.click_log import click_log
+from services.click_filter import click_filter
+from services.site_context import site_context
+from services.sitemap import sitemaps
+from services.compression import compression
+from services.page_cache import page_cache
+from services.jobs import jobs
+import services.background_tasks  # Registers the background job tasks
 
 # For currency formatting
 from babel.numbers import format_currency as babel_format_currency
@@ -36,10 +48,18 @@ def get_application_locale():
     return request.accept_languages.best_match(['es', 'en']) or 'es'
 
 # -------------------- INJECT GLOBAL DATA --------------------
-def inject_social_media_links():
-    # Injects social media links into the Jinja2 context
-    links = SocialMediaLink.query.filter_by(is_visible=True).order_by(SocialMediaLink.order_num).all()
-    return dict(social_media_links=links)
+def inject_site_context():
+    # Injects social media links and the AdSense configuration into the Jinja2 context.
+    # Both come from the shared site context cache, so rendering costs no queries.
+    context = site_context.get()
+    return dict(
+        social_media_links=context['social_media_links'],
+        adsense_client_id=context['adsense_client_id'],
+        adsense_slot_header=context['adsense_slot_header'],
+        adsense_slot_sidebar=context['adsense_slot_sidebar'],
+        adsense_slot_article_top=context['adsense_slot_article_top'],
+        adsense_slot_article_bottom=context['adsense_slot_article_bottom']
+    )
 
 # -------------------- MAIN APPLICATION FACTORY --------------------
 def create_app():
@@ -51,6 +71,92 @@ def create_app():
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['BABEL_DEFAULT_LOCALE'] = 'es'
 
+    # ----------- REVERSE PROXY -----------
+    # Number of proxies in front of the app (Render/Heroku add one) whose X-Forwarded-For and
+    # X-Forwarded-Proto are trusted. request.remote_addr is then the client address as seen by
+    # the outermost trusted proxy, which a client can't forge by sending its own header.
+    app.config['TRUSTED_PROXY_HOPS'] = int(os.getenv('TRUSTED_PROXY_HOPS', '1'))
+    if app.config['TRUSTED_PROXY_HOPS'] > 0:
+        hops = app.config['TRUSTED_PROXY_HOPS']
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops)
+
+    # ----------- AFFILIATE CLICK TRACKING -----------
+    # Clicks are buffered in memory and flushed every CLICK_FLUSH_INTERVAL seconds
+    # or as soon as CLICK_FLUSH_THRESHOLD clicks are pending.
+    app.config['CLICK_FLUSH_INTERVAL'] = float(os.getenv('CLICK_FLUSH_INTERVAL', '5'))
+    app.config['CLICK_FLUSH_THRESHOLD'] = int(os.getenv('CLICK_FLUSH_THRESHOLD', '500'))
+    # The /ref/<id> redirect table is reloaded on every affiliate commit and,
+    # to pick up changes made by other workers, at most every AFFILIATE_TABLE_TTL seconds.
+    app.config['AFFILIATE_TABLE_TTL'] = int(os.getenv('AFFILIATE_TABLE_TTL', '60'))
+    # When enabled, every click is appended to a segmented JSONL log (timestamp, referrer,
+    # user agent, product) and closed segments are rolled up into AffiliateStatistic.
+    app.config['CLICK_LOG_ENABLED'] = os.getenv('CLICK_LOG_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+    if os.getenv('CLICK_LOG_DIR'):
+        app.config['CLICK_LOG_DIR'] = os.getenv('CLICK_LOG_DIR')
+    # Repeated clicks from the same visitor within this many seconds are not counted
+    app.config['CLICK_DEDUPE_WINDOW'] = float(os.getenv('CLICK_DEDUPE_WINDOW', '30'))
+
+    # ----------- CACHING -----------
+    # Social links, AdSense config and active ads are cached for this many seconds
+    # (and dropped as soon as an admin commits a change to them).
+    app.config['SITE_CONTEXT_TTL'] = int(os.getenv('SITE_CONTEXT_TTL', '300'))
+    # Cached pages, sitemaps and compressed responses are kept in one store shared by
+    # all the workers of the host: 'sqlite' (a WAL-mode file at CACHE_PATH) or
+    # 'memory' (one copy per process). Invalidations reach the other workers within
+    # CACHE_INVALIDATION_POLL seconds.
+    app.config['CACHE_BACKEND'] = os.getenv('CACHE_BACKEND', 'sqlite')
+    if os.getenv('CACHE_PATH'):
+        app.config['CACHE_PATH'] = os.getenv('CACHE_PATH')
+    app.config['CACHE_MAX_BYTES'] = int(os.getenv('CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+    app.config['CACHE_INVALIDATION_POLL'] = float(os.getenv('CACHE_INVALIDATION_POLL', '1'))
+
+    # ----------- PAGINATION -----------
+    # Listings are paginated with cursors and show no total by default. When enabled,
+    # an "about N results" total is shown, counted up to PAGINATION_TOTAL_CAP rows.
+    app.config['PAGINATION_APPROXIMATE_TOTAL'] = os.getenv('PAGINATION_APPROXIMATE_TOTAL', 'false').lower() in ('1', 'true', 'yes')
+    app.config['PAGINATION_TOTAL_CAP'] = int(os.getenv('PAGINATION_TOTAL_CAP', '1000'))
+
+    # ----------- API -----------
+    # List endpoints return API_DEFAULT_LIMIT items unless ?limit= asks for more (up to
+    # API_MAX_LIMIT); NDJSON exports are read and streamed in blocks of API_STREAM_CHUNK_SIZE.
+    app.config['API_DEFAULT_LIMIT'] = int(os.getenv('API_DEFAULT_LIMIT', '100'))
+    app.config['API_MAX_LIMIT'] = int(os.getenv('API_MAX_LIMIT', '1000'))
+    app.config['API_STREAM_CHUNK_SIZE'] = int(os.getenv('API_STREAM_CHUNK_SIZE', '500'))
+    # Maximum number of ids or slugs in one batch lookup (?ids= / ?slugs=)
+    app.config['API_BATCH_MAX_KEYS'] = int(os.getenv('API_BATCH_MAX_KEYS', '500'))
+
+    # ----------- PRODUCT SYNC -----------
+    # Feed items are matched and written in chunks of this many products, one commit per chunk
+    app.config['PRODUCT_SYNC_CHUNK_SIZE'] = int(os.getenv('PRODUCT_SYNC_CHUNK_SIZE', '1000'))
+    # Failed feed requests (connection errors, 429 and 5xx) are retried this many times,
+    # waiting PRODUCT_SYNC_BACKOFF * 2^n seconds between attempts
+    app.config['PRODUCT_SYNC_RETRIES'] = int(os.getenv('PRODUCT_SYNC_RETRIES', '3'))
+    app.config['PRODUCT_SYNC_BACKOFF'] = float(os.getenv('PRODUCT_SYNC_BACKOFF', '0.5'))
+
+    # ----------- COMPRESSION -----------
+    # Responses of at least COMPRESS_MIN_SIZE bytes are sent with brotli (if the
+    # 'brotli' package is installed) or gzip. Compressed copies of responses with a
+    # strong ETag (API, static files, cached pages) are kept in the shared cache.
+    app.config['COMPRESS_ENABLED'] = os.getenv('COMPRESS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    app.config['COMPRESS_MIN_SIZE'] = int(os.getenv('COMPRESS_MIN_SIZE', '500'))
+
+    # ----------- FULL-PAGE CACHE -----------
+    # Public pages rendered for anonymous visitors are kept for PAGE_CACHE_TTL seconds
+    # and purged when the data they show is committed.
+    app.config['PAGE_CACHE_ENABLED'] = os.getenv('PAGE_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    app.config['PAGE_CACHE_TTL'] = int(os.getenv('PAGE_CACHE_TTL', '300'))
+
+    # ----------- BACKGROUND JOBS -----------
+    # Long admin operations (feed syncs, click rollups, exports, link checks) are queued in
+    # the jobs table and run by JOB_WORKERS threads per worker process. With JOB_WORKERS=0
+    # they only run in a dedicated `flask run-jobs` process.
+    app.config['JOB_WORKERS'] = int(os.getenv('JOB_WORKERS', '1'))
+    app.config['JOB_POLL_INTERVAL'] = float(os.getenv('JOB_POLL_INTERVAL', '2'))
+    # A running job whose process stopped heartbeating this many seconds ago is marked failed
+    app.config['JOB_STALE_AFTER'] = int(os.getenv('JOB_STALE_AFTER', '60'))
+    if os.getenv('JOB_EXPORT_DIR'):
+        app.config['JOB_EXPORT_DIR'] = os.getenv('JOB_EXPORT_DIR')
+
     # ----------- EXTENSIONS -----------
     db.init_app(app)
     login_manager.init_app(app)
@@ -58,6 +164,16 @@ def create_app():
     Babel(app, locale_selector=get_application_locale)
     Moment(app)
     CSRFProtect(app)
+    shared_cache.init_app(app)
+    click_counter.init_app(app)
+    affiliate_redirects.init_app(app)
+    click_log.init_app(app)
+    click_filter.init_app(app)
+    site_context.init_app(app)
+    sitemaps.init_app(app)
+    compression.init_app(app)
+    page_cache.init_app(app, locale_selector=get_application_locale)
+    jobs.init_app(app)
 
     login_manager.login_view = 'admin.admin_login'
     login_manager.login_message = _l('Please log in to access this page.')
@@ -100,29 +216,7 @@ def create_app():
     app.register_blueprint(api_bp)
 
     # ----------- GLOBAL CONTEXT INJECTION -----------
-    app.context_processor(inject_social_media_links)
-
-    @app.context_processor
-    def inject_adsense_config():
-        try:
-            config = AdsenseConfig.query.first()
-            if config:
-                return dict(
-                    adsense_client_id=config.adsense_client_id,
-                    adsense_slot_header=config.adsense_slot_header,
-                    adsense_slot_sidebar=config.adsense_slot_sidebar,
-                    adsense_slot_article_top=config.adsense_slot_article_top,
-                    adsense_slot_article_bottom=config.adsense_slot_article_bottom
-                )
-        except Exception:
-            pass
-        return dict(
-            adsense_client_id='',
-            adsense_slot_header='',
-            adsense_slot_sidebar='',
-            adsense_slot_article_top='',
-            adsense_slot_article_bottom=''
-        )
+    app.context_processor(inject_site_context)
 
     @app.context_processor
     def inject_now():
@@ -252,6 +346,22 @@ def create_app():
         db.session.commit()
         print("✅ Initial data created.")
 
+    @app.cli.command('rollup-clicks')
+    @click.with_appcontext
+    def rollup_clicks():
+        """Folds the closed click log segments into the affiliate statistics."""
+        click_log.sync()
+        folded = click_log.rollup()
+        print(f"✅ {folded} clics consolidados en las estadísticas de afiliados.")
+
+    @app.cli.command('run-jobs')
+    @click.option('--workers', default=1, show_default=True, help='Jobs run at the same time.')
+    @click.with_appcontext
+    def run_jobs(workers):
+        """Runs the queued background jobs in this process until interrupted."""
+        print(f"✅ Ejecutando tareas en segundo plano con {workers} hilo(s). Ctrl+C para detener.")
+        jobs.serve(workers)
+
     # ----------- LOGIN MANAGER -----------
     @login_manager.user_loader
     def load_user(user_id):
@@ -0,0 +1,48 @@
+"""Unique affiliate statistic per affiliate and day
+
+Revision ID: 7db83f8583bb
+Revises: a83e70198752
+Create Date: 2026-10-16 09:12:04.318220
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7db83f8583bb'
+down_revision = 'a83e70198752'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Duplicated (affiliate_id, date) rows are merged into the oldest one before
+    # the unique constraint is created.
+    op.execute("""
+        UPDATE affiliate_statistics SET
+            clicks = (SELECT SUM(s2.clicks) FROM affiliate_statistics s2
+                      WHERE s2.affiliate_id = affiliate_statistics.affiliate_id AND s2.date = affiliate_statistics.date),
+            signups = (SELECT SUM(s2.signups) FROM affiliate_statistics s2
+                       WHERE s2.affiliate_id = affiliate_statistics.affiliate_id AND s2.date = affiliate_statistics.date),
+            sales = (SELECT SUM(s2.sales) FROM affiliate_statistics s2
+                     WHERE s2.affiliate_id = affiliate_statistics.affiliate_id AND s2.date = affiliate_statistics.date),
+            commission_generated = (SELECT SUM(s2.commission_generated) FROM affiliate_statistics s2
+                                    WHERE s2.affiliate_id = affiliate_statistics.affiliate_id AND s2.date = affiliate_statistics.date)
+        WHERE id IN (
+            SELECT MIN(id) FROM affiliate_statistics GROUP BY affiliate_id, date HAVING COUNT(*) > 1
+        )
+    """)
+    op.execute("""
+        DELETE FROM affiliate_statistics WHERE id NOT IN (
+            SELECT keep_id FROM (SELECT MIN(id) AS keep_id FROM affiliate_statistics GROUP BY affiliate_id, date) AS keep
+        )
+    """)
+
+    with op.batch_alter_table('affiliate_statistics', schema=None) as batch_op:
+        batch_op.create_unique_constraint('uq_affiliate_statistics_affiliate_date', ['affiliate_id', 'date'])
+
+
+def downgrade():
+    with op.batch_alter_table('affiliate_statistics', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_affiliate_statistics_affiliate_date', type_='unique')
@@ -0,0 +1,92 @@
+"""Full-text search index for products and articles
+
+Revision ID: 91f1d1286f4f
+Revises: 651183904e14
+Create Date: 2026-10-16 13:05:41.518220
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '91f1d1286f4f'
+down_revision = '651183904e14'
+branch_labels = None
+depends_on = None
+
+# SQLite: one FTS5 table for both kinds, rowid = id * 2 + (0 product, 1 article),
+# kept up to date by triggers so bulk and raw SQL writes are indexed too.
+SQLITE_UPGRADE = [
+    "CREATE VIRTUAL TABLE search_index USING fts5(title, body, tokenize = 'unicode61 remove_diacritics 2')",
+
+    "CREATE TRIGGER products_search_insert AFTER INSERT ON products BEGIN "
+    "INSERT INTO search_index (rowid, title, body) VALUES (new.id * 2, new.name, coalesce(new.description, '')); "
+    "END",
+    "CREATE TRIGGER products_search_update AFTER UPDATE OF name, description ON products BEGIN "
+    "DELETE FROM search_index WHERE rowid = old.id * 2; "
+    "INSERT INTO search_index (rowid, title, body) VALUES (new.id * 2, new.name, coalesce(new.description, '')); "
+    "END",
+    "CREATE TRIGGER products_search_delete AFTER DELETE ON products BEGIN "
+    "DELETE FROM search_index WHERE rowid = old.id * 2; "
+    "END",
+
+    "CREATE TRIGGER articles_search_insert AFTER INSERT ON articles BEGIN "
+    "INSERT INTO search_index (rowid, title, body) VALUES (new.id * 2 + 1, new.title, new.content); "
+    "END",
+    "CREATE TRIGGER articles_search_update AFTER UPDATE OF title, content ON articles BEGIN "
+    "DELETE FROM search_index WHERE rowid = old.id * 2 + 1; "
+    "INSERT INTO search_index (rowid, title, body) VALUES (new.id * 2 + 1, new.title, new.content); "
+    "END",
+    "CREATE TRIGGER articles_search_delete AFTER DELETE ON articles BEGIN "
+    "DELETE FROM search_index WHERE rowid = old.id * 2 + 1; "
+    "END",
+
+    "INSERT INTO search_index (rowid, title, body) "
+    "SELECT id * 2, name, coalesce(description, '') FROM products",
+    "INSERT INTO search_index (rowid, title, body) "
+    "SELECT id * 2 + 1, title, content FROM articles",
+]
+
+SQLITE_DOWNGRADE = [
+    "DROP TRIGGER IF EXISTS products_search_insert",
+    "DROP TRIGGER IF EXISTS products_search_update",
+    "DROP TRIGGER IF EXISTS products_search_delete",
+    "DROP TRIGGER IF EXISTS articles_search_insert",
+    "DROP TRIGGER IF EXISTS articles_search_update",
+    "DROP TRIGGER IF EXISTS articles_search_delete",
+    "DROP TABLE IF EXISTS search_index",
+]
+
+# PostgreSQL: generated tsvector columns (name/title weighted A, body B) with GIN indexes
+POSTGRESQL_UPGRADE = [
+    "ALTER TABLE products ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(description, '')), 'B')) STORED",
+    "CREATE INDEX ix_products_search_vector ON products USING gin (search_vector)",
+    "ALTER TABLE articles ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(content, '')), 'B')) STORED",
+    "CREATE INDEX ix_articles_search_vector ON articles USING gin (search_vector)",
+]
+
+POSTGRESQL_DOWNGRADE = [
+    "DROP INDEX IF EXISTS ix_products_search_vector",
+    "ALTER TABLE products DROP COLUMN IF EXISTS search_vector",
+    "DROP INDEX IF EXISTS ix_articles_search_vector",
+    "ALTER TABLE articles DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def _run(statements_by_dialect):
+    bind = op.get_bind()
+    for statement in statements_by_dialect.get(bind.dialect.name, []):
+        op.execute(sa.text(statement))
+
+
+def upgrade():
+    _run({'sqlite': SQLITE_UPGRADE, 'postgresql': POSTGRESQL_UPGRADE})
+
+
+def downgrade():
+    _run({'sqlite': SQLITE_DOWNGRADE, 'postgresql': POSTGRESQL_DOWNGRADE})
@@ -2,6 +2,7 @@ from extensions import db
 from flask_login import UserMixin
 from datetime import datetime, timezone, date
 from werkzeug.security import generate_password_hash, check_password_hash
+from services.hyperloglog import HyperLogLog
 
 
 # --- Application Models ---
@@ -53,6 +54,13 @@ class Subcategory(db.Model):
 class Product(db.Model):
     """Model for affiliate products."""
     __tablename__ = 'products'
+    # Keyset pagination of the listings, newest first
+    __table_args__ = (
+        db.Index('ix_products_created_at_id', 'created_at', 'id'),
+        db.Index('ix_products_subcategory_created_at_id', 'subcategory_id', 'created_at', 'id'),
+        # Delta sync, in change order
+        db.Index('ix_products_change_seq_id', 'change_seq', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200), nullable=False)
     slug = db.Column(db.String(200), unique=True, nullable=False)
@@ -64,14 +72,35 @@ class Product(db.Model):
     external_id = db.Column(db.String(100), unique=True, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.now(timezone.utc))
     updated_at = db.Column(db.DateTime, default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc))
+    # Version of the products table in the transaction that last created or updated the row (delta sync)
+    change_seq = db.Column(db.BigInteger, nullable=True)
+    # Fingerprint of the feed item the row was last synced from, and that feed's URL
+    content_hash = db.Column(db.String(32), nullable=True)
+    source_feed = db.Column(db.String(255), nullable=True, index=True)
 
     def __repr__(self):
         return f'<Product {self.name}>'
 
+# ---
+class ProductTombstone(db.Model):
+    """Record of a deleted product, so delta sync clients can remove it too."""
+    __tablename__ = 'product_tombstones'
+    product_id = db.Column(db.Integer, primary_key=True)
+    slug = db.Column(db.String(200), nullable=True)
+    external_id = db.Column(db.String(100), nullable=True)
+    change_seq = db.Column(db.BigInteger, nullable=False, index=True)
+    deleted_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<ProductTombstone {self.product_id}>'
+
 # ---
 class Article(db.Model):
     """Model for blog articles."""
     __tablename__ = 'articles'
+    __table_args__ = (
+        db.Index('ix_articles_date_posted_id', 'date_posted', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     slug = db.Column(db.String(200), unique=True, nullable=False)
@@ -91,10 +120,52 @@ class SyncInfo(db.Model):
     last_sync_time = db.Column(db.DateTime, nullable=False, default=datetime.now(timezone.utc))
     last_sync_count = db.Column(db.Integer, nullable=False)
     last_synced_api_url = db.Column(db.String(255), nullable=True)
+    # Breakdown of the last sync; last_sync_count is inserted + updated
+    last_inserted_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    last_updated_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    last_unchanged_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    last_removed_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     def __repr__(self):
         return f'<SyncInfo {self.last_sync_time}>'
 
+# ---
+class FeedFetchState(db.Model):
+    """HTTP validators of the last complete sync of a product feed, for conditional requests."""
+    __tablename__ = 'feed_fetch_states'
+    id = db.Column(db.Integer, primary_key=True)
+    url = db.Column(db.String(255), unique=True, nullable=False)
+    etag = db.Column(db.String(255), nullable=True)
+    last_modified = db.Column(db.String(64), nullable=True)
+    last_fetched_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<FeedFetchState {self.url}>'
+
+# ---
+class Job(db.Model):
+    """Background job (product syncs, click rollups, exports, link checks) run off the request path."""
+    __tablename__ = 'jobs'
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    params = db.Column(db.Text, nullable=True)  # JSON
+    # queued -> running -> succeeded | failed | cancelled
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)
+    progress = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer, nullable=True)  # None while the amount of work is unknown
+    message = db.Column(db.String(255), nullable=True)
+    result = db.Column(db.Text, nullable=True)  # JSON
+    error = db.Column(db.Text, nullable=True)
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    worker = db.Column(db.String(64), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc).replace(tzinfo=None))
+    started_at = db.Column(db.DateTime, nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.kind} {self.status}>'
+
 # ---
 class SocialMediaLink(db.Model):
     """Model for social media links."""
@@ -183,6 +254,10 @@ class Affiliate(db.Model):
 class AffiliateStatistic(db.Model):
     """Model for affiliate statistics."""
     __tablename__ = 'affiliate_statistics'
+    # One row per affiliate and day, so clicks can be added with an atomic upsert
+    __table_args__ = (
+        db.UniqueConstraint('affiliate_id', 'date', name='uq_affiliate_statistics_affiliate_date'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     affiliate_id = db.Column(db.Integer, db.ForeignKey('affiliates.id'), nullable=False)
     date = db.Column(db.Date, default=date.today)
@@ -191,8 +266,19 @@ class AffiliateStatistic(db.Model):
     sales = db.Column(db.Integer, default=0)
     commission_generated = db.Column(db.Float, default=0.0)
     is_paid = db.Column(db.Boolean, default=False)
+    # HyperLogLog sketch of the day's visitors (see services/hyperloglog.py)
+    unique_visitors_sketch = db.Column(db.LargeBinary, nullable=True)
 
-    affiliate = db.relationship('Affiliate', backref='statistics', lazy=True)
+    # The statistics of an affiliate are deleted with it (affiliate_id can't be NULL)
+    affiliate = db.relationship('Affiliate', backref=db.backref('statistics', cascade='all, delete-orphan'),
+                                lazy=True)
+
+    @property
+    def unique_visitors(self):
+        """Approximate number of distinct visitors that day."""
+        if not self.unique_visitors_sketch:
+            return 0
+        return HyperLogLog.from_bytes(self.unique_visitors_sketch).count()
 
     def __repr__(self):
         return f'<AffiliateStatistic Affiliate: {self.affiliate_id}, Date: {self.date}>'
@@ -212,4 +298,14 @@ class AdsenseConfig(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc))
 
     def __repr__(self):
-        return f"<AdsenseConfig {self.adsense_client_id}>"
\ No newline at end of file
+        return f"<AdsenseConfig {self.adsense_client_id}>"
+# ---
+class TableVersion(db.Model):
+    """Change counter per table, bumped in the same transaction as the change. Used for API ETags."""
+    __tablename__ = 'table_versions'
+    table_name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+    changed_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<TableVersion {self.table_name}: {self.version}>'
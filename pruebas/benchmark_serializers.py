@@ -0,0 +1,53 @@
+"""
+Compara el serializador compilado de services.serializers con la forma
+anterior de la API (un diccionario por objeto con getattr y json.dumps),
+sobre 100.000 productos sintéticos. No usa la base de datos.
+
+    python -m pruebas.benchmark_serializers [número de productos]
+"""
+import json
+import sys
+import time
+from datetime import date, datetime
+from types import SimpleNamespace
+
+from services.serializers import PRODUCT, dumps, orjson
+
+
+def _rows(count):
+    created = datetime(2024, 1, 1, 12, 30)
+    for i in range(count):
+        yield (i, f'Producto {i}', f'producto-{i}', 19.99 + i % 100,
+               'Descripción del producto ' * 8, f'img/{i}.jpg', f'https://example.com/p/{i}',
+               i % 40, f'ext-{i}', created, created)
+
+
+def _old_serialize(p):
+    data = {}
+    for field in PRODUCT.fields:
+        value = getattr(p, field)
+        data[field] = value.isoformat() if isinstance(value, (datetime, date)) else value
+    return data
+
+
+def _measure(label, count, run):
+    start = time.perf_counter()
+    run()
+    elapsed = time.perf_counter() - start
+    print(f'{label:<36} {elapsed:8.3f} s  {count / elapsed:12,.0f} filas/s')
+
+
+def main(count=100000):
+    rows = list(_rows(count))
+    objects = [SimpleNamespace(**dict(zip(PRODUCT.fields, row))) for row in rows]
+    serialize = PRODUCT.serializer()
+
+    print(f'{count} productos, orjson {"disponible" if orjson else "no instalado"}')
+    _measure('getattr + json.dumps (anterior)', count, lambda: json.dumps(
+        [_old_serialize(p) for p in objects], ensure_ascii=False, separators=(',', ':')))
+    _measure('serializador compilado + dumps', count, lambda: dumps([serialize(row) for row in rows]))
+    _measure('NDJSON: dumps por fila', count, lambda: b'\n'.join(dumps(serialize(row)) for row in rows))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,31 @@
+import pytest
+from flask import Flask
+
+from extensions import db
+# Registers the commit hooks the services rely on (change_seq stamping, table versions)
+import services.product_changes  # noqa: F401
+import services.table_versions  # noqa: F401
+
+
+@pytest.fixture
+def app():
+    """Minimal application on an in-memory SQLite database, for the services that need one."""
+    app = Flask(__name__)
+    app.config.update(
+        TESTING=True,
+        SECRET_KEY='test',
+        SQLALCHEMY_DATABASE_URI='sqlite://',
+        API_DEFAULT_LIMIT=100,
+        API_MAX_LIMIT=1000,
+        API_STREAM_CHUNK_SIZE=500,
+        API_BATCH_MAX_KEYS=500,
+        PRODUCT_SYNC_CHUNK_SIZE=1000,
+        PRODUCT_SYNC_RETRIES=0,
+        PRODUCT_SYNC_BACKOFF=0,
+    )
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
@@ -0,0 +1,76 @@
+from collections import OrderedDict
+from datetime import date
+
+import pytest
+
+from extensions import db
+from models import Affiliate, AffiliateStatistic
+from routes.public import bp
+from services.affiliate_redirects import affiliate_redirects
+from services.click_counter import click_counter
+from services.click_filter import click_filter
+from services.shared_cache import shared_cache
+
+BROWSER = 'Mozilla/5.0 (X11; Linux x86_64; rv:128.0) Gecko/20100101 Firefox/128.0'
+
+
+def _affiliate(name='Ana', **overrides):
+    affiliate = Affiliate(name=name, email=f'{name.lower()}@example.com',
+                          referral_link=f'https://merchant.example/?ref={name.lower()}', **overrides)
+    db.session.add(affiliate)
+    db.session.commit()
+    return affiliate
+
+
+@pytest.fixture
+def client(app, monkeypatch):
+    # Clicks remembered by earlier tests would be filtered as duplicates
+    monkeypatch.setattr(click_filter, '_seen', OrderedDict())
+    app.config.update(CACHE_BACKEND='memory', CACHE_INVALIDATION_POLL=0, CLICK_WRITE_BEHIND=False)
+    shared_cache.init_app(app)
+    click_counter.init_app(app)
+    affiliate_redirects.init_app(app)
+    app.register_blueprint(bp)
+    return app.test_client()
+
+
+def _follow(client, affiliate_id):
+    return client.get(f'/ref/{affiliate_id}', headers={'User-Agent': BROWSER})
+
+
+def test_redirects_follow_affiliate_commits(client):
+    assert _follow(client, 1).status_code == 404
+
+    affiliate = _affiliate()
+    response = _follow(client, affiliate.id)
+    assert response.status_code == 302
+    assert response.headers['Location'] == 'https://merchant.example/?ref=ana'
+
+    affiliate.referral_link = 'https://merchant.example/?ref=ana-2'
+    db.session.commit()
+    assert _follow(client, affiliate.id).headers['Location'] == 'https://merchant.example/?ref=ana-2'
+
+    affiliate.is_active = False
+    db.session.commit()
+    assert _follow(client, affiliate.id).status_code == 410
+
+    db.session.delete(affiliate)
+    db.session.commit()
+    assert _follow(client, affiliate.id).status_code == 404
+
+
+def test_redirect_counts_the_click(client):
+    affiliate = _affiliate()
+    _follow(client, affiliate.id)
+    assert AffiliateStatistic.query.filter_by(affiliate_id=affiliate.id).one().clicks == 1
+
+
+def test_deleting_an_affiliate_deletes_its_statistics(app):
+    affiliate = _affiliate()
+    db.session.add(AffiliateStatistic(affiliate_id=affiliate.id, date=date(2026, 10, 1), clicks=3))
+    db.session.commit()
+
+    db.session.delete(affiliate)
+    db.session.commit()
+    assert Affiliate.query.count() == 0
+    assert AffiliateStatistic.query.count() == 0
@@ -0,0 +1,49 @@
+from datetime import date
+
+import pytest
+
+from extensions import db
+from models import Affiliate, AffiliateStatistic
+from services import affiliate_stats
+from services.affiliate_stats import increment_clicks, merge_visitor_sketches
+from services.hyperloglog import HyperLogLog
+
+DAY = date(2026, 10, 1)
+
+
+def _sketch(*visitors):
+    sketch = HyperLogLog()
+    for visitor in visitors:
+        sketch.add(visitor)
+    return sketch
+
+
+@pytest.fixture(params=['upsert', 'update-then-insert'])
+def affiliate(app, request, monkeypatch):
+    if request.param == 'update-then-insert':
+        # As on a database without INSERT ... ON CONFLICT
+        monkeypatch.setattr(affiliate_stats, '_UPSERT_DIALECTS', {})
+    affiliate = Affiliate(name='Ana', email='ana@example.com', referral_link='https://merchant.example/?ref=ana')
+    db.session.add(affiliate)
+    db.session.commit()
+    return affiliate
+
+
+def test_increments_of_the_same_day_add_up_in_one_row(affiliate):
+    key = (affiliate.id, DAY)
+    for clicks, sketch in ((3, _sketch('a', 'b')), (2, _sketch('b', 'c'))):
+        increment_clicks({key: clicks})
+        merge_visitor_sketches({key: sketch})
+        db.session.commit()
+
+    db.session.expire_all()
+    statistic = AffiliateStatistic.query.filter_by(affiliate_id=affiliate.id).one()
+    assert statistic.clicks == 5
+    assert HyperLogLog.from_bytes(statistic.unique_visitors_sketch).count() == 3
+
+
+def test_each_day_gets_its_own_row(affiliate):
+    increment_clicks({(affiliate.id, DAY): 1, (affiliate.id, date(2026, 10, 2)): 4})
+    db.session.commit()
+    rows = AffiliateStatistic.query.order_by(AffiliateStatistic.date).all()
+    assert [(row.date, row.clicks) for row in rows] == [(DAY, 1), (date(2026, 10, 2), 4)]
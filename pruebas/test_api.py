@@ -0,0 +1,128 @@
+import base64
+import json
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event
+
+import models
+from extensions import db
+from routes.api import bp
+
+
+@pytest.fixture
+def client(app):
+    app.register_blueprint(bp)
+    db.session.add_all([
+        models.Testimonial(author='Ana', content='Muy útil', date_posted=datetime(2024, 5, 1), is_visible=True),
+        models.Testimonial(author='Luis', content='Recomendado', date_posted=datetime(2024, 5, 2), is_visible=True),
+    ])
+    db.session.commit()
+    return app.test_client()
+
+
+def _raw_cursor(direction, key):
+    payload = json.dumps([direction, key]).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+
+def test_cursor_pages_through_the_list(client):
+    first = client.get('/api/testimonials?limit=1')
+    assert first.status_code == 200
+    assert [t['author'] for t in first.get_json()] == ['Luis']
+
+    second = client.get(f"/api/testimonials?limit=1&cursor={first.headers['X-Next-Cursor']}")
+    assert [t['author'] for t in second.get_json()] == ['Ana']
+
+
+@pytest.mark.parametrize('key', [['no-es-fecha', 1], ['2024-05-02T00:00:00', 'uno'], [1]])
+def test_tampered_cursor_is_rejected(client, key):
+    response = client.get(f"/api/testimonials?cursor={_raw_cursor('n', key)}")
+    assert response.status_code == 400
+    assert response.get_json() == {"mensaje": "Cursor inválido"}
+
+
+def test_json_etag_does_not_validate_the_ndjson_representation(client):
+    json_response = client.get('/api/testimonials')
+    etag = json_response.headers['ETag']
+    assert 'Accept' in json_response.headers['Vary']
+    assert client.get('/api/testimonials', headers={'If-None-Match': etag}).status_code == 304
+
+    ndjson = client.get('/api/testimonials', headers={'Accept': 'application/x-ndjson', 'If-None-Match': etag})
+    assert ndjson.status_code == 200
+    assert ndjson.mimetype == 'application/x-ndjson'
+    assert ndjson.headers['ETag'] != etag
+    assert 'Accept' in ndjson.headers['Vary']
+
+
+@pytest.fixture
+def catalog(app):
+    category = models.Category(name='Audio', slug='audio')
+    db.session.add(category)
+    db.session.flush()
+    subcategory = models.Subcategory(name='Auriculares', slug='auriculares', category_id=category.id)
+    db.session.add(subcategory)
+    db.session.flush()
+    products = [
+        models.Product(name=f'Producto {i}', slug=f'producto-{i}', price=10.0 + i,
+                       link=f'https://example.com/{i}', subcategory_id=subcategory.id)
+        for i in range(5)
+    ]
+    db.session.add_all(products)
+    db.session.commit()
+    return [product.id for product in products]
+
+
+def test_batch_lookup_returns_items_in_order_and_missing_keys(client, catalog):
+    first, second = catalog[0], catalog[1]
+    response = client.get(f'/api/products?ids={second},999,{first},{second}')
+    assert response.status_code == 200
+    body = response.get_json()
+    assert [item['id'] for item in body['items']] == [second, first]
+    assert body['missing'] == [999]
+
+    by_slug = client.get('/api/products/by-slug?slugs=producto-1,no-existe').get_json()
+    assert [item['slug'] for item in by_slug['items']] == ['producto-1']
+    assert by_slug['missing'] == ['no-existe']
+
+
+@pytest.mark.parametrize('query', ['ids=1,dos', 'ids=,', 'ids=' + ','.join(str(i) for i in range(501))])
+def test_batch_lookup_rejects_invalid_key_lists(client, catalog, query):
+    assert client.get(f'/api/products?{query}').status_code == 400
+
+
+def test_fields_selects_the_returned_keys(client, catalog):
+    body = client.get(f'/api/products/{catalog[0]}?fields=name,price').get_json()
+    assert body == {'name': 'Producto 0', 'price': 10.0}
+
+
+@pytest.mark.parametrize('query', ['fields=name,precio', 'fields=', 'include=fabricante'])
+def test_unknown_fields_and_includes_are_rejected(client, catalog, query):
+    response = client.get(f'/api/products?{query}')
+    assert response.status_code == 400
+    assert 'mensaje' in response.get_json()
+
+
+def test_include_embeds_relations_without_a_query_per_item(client, catalog):
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', count)
+    try:
+        one = client.get(f'/api/products?ids={catalog[0]}&include=category,subcategory')
+        queries_for_one = len(statements)
+        statements.clear()
+        every = client.get(f"/api/products?ids={','.join(map(str, catalog))}&include=category,subcategory")
+        queries_for_every = len(statements)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count)
+
+    items = every.get_json()['items']
+    assert len(items) == 5
+    assert all(item['category'] == {'id': items[0]['category']['id'], 'name': 'Audio', 'slug': 'audio'}
+               for item in items)
+    assert items[0]['subcategory']['slug'] == 'auriculares'
+    assert one.get_json()['items'][0]['category']['slug'] == 'audio'
+    assert queries_for_every == queries_for_one
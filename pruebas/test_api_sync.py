@@ -0,0 +1,264 @@
+import io
+import json
+from datetime import datetime
+
+import pytest
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from sqlalchemy import select
+
+from extensions import db
+from models import Category, Subcategory, Product, Advertisement, ProductTombstone, FeedFetchState
+import services.api_sync
+from services.api_sync import fetch_and_update_products_from_external_api, sync_products
+
+FEED = 'https://merchant.example/feed.json'
+
+
+@pytest.fixture(autouse=True)
+def subcategory(app):
+    category = Category(name='General', slug='general')
+    db.session.add(category)
+    db.session.flush()
+    subcategory = Subcategory(name='Varios', slug='varios', category_id=category.id)
+    db.session.add(subcategory)
+    db.session.commit()
+    return subcategory
+
+
+def _item(external_id, name=None, price='10.00', **overrides):
+    item = {
+        'external_id': external_id,
+        'name': name or f'Producto {external_id}',
+        'external_price': price,
+        'external_description': 'Descripción',
+        'external_image': f'https://merchant.example/{external_id}.jpg',
+        'external_link': f'https://merchant.example/p/{external_id}',
+    }
+    item.update(overrides)
+    return item
+
+
+def _product(external_id):
+    db.session.expire_all()
+    return Product.query.filter_by(external_id=external_id).first()
+
+
+def test_inserts_then_updates_by_external_id(app):
+    assert sync_products([_item('a'), _item('b')], source_feed=FEED).inserted == 2
+
+    result = sync_products([_item('a', price='12.50'), _item('b')], source_feed=FEED)
+    assert (result.inserted, result.updated, result.unchanged) == (0, 1, 1)
+    assert _product('a').price == 12.5
+
+
+def test_last_repeated_external_id_wins(app):
+    result = sync_products([_item('a', name='Primero'), _item('a', name='Segundo')], source_feed=FEED)
+    assert result.inserted == 1
+    assert _product('a').name == 'Segundo'
+
+
+def test_each_chunk_is_committed_on_its_own(app):
+    def stop_after_first_chunk(done):
+        raise RuntimeError('stop')
+
+    with pytest.raises(RuntimeError):
+        sync_products([_item(str(i)) for i in range(5)], source_feed=FEED, chunk_size=2,
+                      progress=stop_after_first_chunk)
+    db.session.rollback()
+    assert Product.query.count() == 2
+
+
+def test_bulk_writes_stamp_change_seq_and_updated_at(app):
+    sync_products([_item('a')], source_feed=FEED)
+    before = _product('a')
+    seq_before, updated_before = before.change_seq, before.updated_at
+    assert seq_before is not None
+
+    sync_products([_item('a', price='99.00')], source_feed=FEED)
+    after = _product('a')
+    assert after.change_seq > seq_before
+    assert after.updated_at >= updated_before
+    assert after.updated_at.year == datetime.utcnow().year
+
+
+def test_repeated_names_get_unique_slugs(app):
+    result = sync_products([_item('a', name='Auriculares'), _item('b', name='Auriculares')],
+                           source_feed=FEED, chunk_size=1)
+    assert result.inserted == 2
+    result = sync_products([_item(external_id, name='Auriculares') for external_id in 'abcd'], source_feed=FEED)
+    assert (result.inserted, result.unchanged) == (2, 2)
+
+    slugs = db.session.execute(select(Product.slug).order_by(Product.external_id)).scalars().all()
+    assert slugs[0] == 'auriculares'
+    assert len(set(slugs)) == 4
+
+
+def test_suffixed_slug_is_kept_on_update(app):
+    sync_products([_item('a', name='Auriculares'), _item('b', name='Auriculares')], source_feed=FEED)
+    slug = _product('b').slug
+    assert slug != 'auriculares'
+
+    sync_products([_item('a', name='Auriculares'), _item('b', name='Auriculares', price='5.00')], source_feed=FEED)
+    assert _product('b').slug == slug
+
+
+def test_renamed_product_gets_the_slug_of_its_new_name(app):
+    sync_products([_item('a', name='Zapatilla Roja')], source_feed=FEED)
+    assert _product('a').slug == 'zapatilla-roja'
+
+    sync_products([_item('a', name='Zapatilla')], source_feed=FEED)
+    assert _product('a').slug == 'zapatilla'
+
+
+def test_unchanged_items_are_not_written(app):
+    sync_products([_item('a')], source_feed=FEED)
+    before = _product('a')
+    seq_before, updated_before = before.change_seq, before.updated_at
+
+    result = sync_products([_item('a')], source_feed=FEED)
+    assert (result.inserted, result.updated, result.unchanged) == (0, 0, 1)
+    after = _product('a')
+    assert (after.change_seq, after.updated_at) == (seq_before, updated_before)
+
+
+def test_products_edited_by_hand_are_written_again(app):
+    sync_products([_item('a')], source_feed=FEED)
+    product = _product('a')
+    product.name = 'Nombre cambiado a mano'
+    db.session.commit()
+    assert _product('a').content_hash is None
+
+    result = sync_products([_item('a')], source_feed=FEED)
+    assert result.updated == 1
+    assert _product('a').name == 'Producto a'
+    assert _product('a').content_hash is not None
+
+
+def test_products_missing_from_the_feed_are_removed(app):
+    sync_products([_item('a'), _item('b')], source_feed=FEED)
+    removed_id = _product('b').id
+    db.session.add(Advertisement(type='product', title='Oferta', product_id=removed_id))
+    db.session.commit()
+
+    result = sync_products([_item('a')], source_feed=FEED)
+    assert result.removed == 1
+    assert _product('b') is None
+    assert Advertisement.query.one().product_id is None
+    tombstone = db.session.get(ProductTombstone, removed_id)
+    assert tombstone is not None and tombstone.external_id == 'b'
+
+
+def test_only_products_of_the_same_feed_are_removed(app):
+    sync_products([_item('a')], source_feed='https://other.example/feed.json')
+    db.session.add(Product(name='Manual', slug='manual', price=1.0, link='https://example.com'))
+    db.session.commit()
+    sync_products([_item('b')], source_feed=FEED)
+
+    result = sync_products([_item('c')], source_feed=FEED)
+    assert result.removed == 1
+    assert _product('a') is not None
+    assert Product.query.filter_by(slug='manual', source_feed=None).one() is not None
+
+
+def test_empty_feed_removes_nothing(app):
+    sync_products([_item('a'), _item('b')], source_feed=FEED)
+    assert sync_products([], source_feed=FEED).removed == 0
+    assert Product.query.count() == 2
+
+
+def test_cancelled_sync_removes_nothing(app):
+    sync_products([_item(str(i)) for i in range(4)], source_feed=FEED)
+
+    class Cancelled(Exception):
+        pass
+
+    def cancel(done):
+        raise Cancelled()
+
+    with pytest.raises(Cancelled):
+        sync_products([_item('0'), _item('1')], source_feed=FEED, chunk_size=1, progress=cancel)
+    db.session.rollback()
+    assert Product.query.count() == 4
+
+
+class _FeedAdapter(BaseAdapter):
+    """Answers every request with the next of `responses` ((status, headers, body)) and keeps the requests."""
+
+    def __init__(self, *responses):
+        super().__init__()
+        self.responses = list(responses)
+        self.requests = []
+
+    def send(self, request, **kwargs):
+        self.requests.append(request)
+        status, headers, body = self.responses.pop(0)
+        response = requests.Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict(headers)
+        response.raw = io.BytesIO(body)
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def feed(monkeypatch):
+    """Installs a _FeedAdapter as the HTTP session of the sync; call it with the responses to give."""
+    def install(*responses):
+        adapter = _FeedAdapter(*responses)
+        session = requests.Session()
+        session.mount('https://', adapter)
+        monkeypatch.setattr(services.api_sync, '_http_session', session)
+        return adapter
+    return install
+
+
+def _body(*items):
+    return json.dumps(list(items)).encode('utf-8')
+
+
+def test_fetch_sends_the_stored_validators(app, feed):
+    adapter = feed(
+        (200, {'ETag': '"v1"', 'Last-Modified': 'Wed, 14 Oct 2026 10:00:00 GMT'}, _body(_item('a'))),
+        (304, {'ETag': '"v1"'}, b''),
+    )
+    fetch_and_update_products_from_external_api(FEED)
+    assert 'If-None-Match' not in adapter.requests[0].headers
+    assert FeedFetchState.query.filter_by(url=FEED).one().etag == '"v1"'
+
+    fetch_and_update_products_from_external_api(FEED)
+    assert adapter.requests[1].headers['If-None-Match'] == '"v1"'
+    assert adapter.requests[1].headers['If-Modified-Since'] == 'Wed, 14 Oct 2026 10:00:00 GMT'
+
+
+def test_not_modified_feed_writes_nothing(app, feed):
+    feed((200, {'ETag': '"v1"'}, _body(_item('a'))), (304, {}, b''))
+    fetch_and_update_products_from_external_api(FEED)
+    before = _product('a')
+    seq_before, updated_before = before.change_seq, before.updated_at
+
+    result = fetch_and_update_products_from_external_api(FEED)
+    assert result.not_modified
+    assert result.written == 0 and result.unchanged == 0
+    after = _product('a')
+    assert (after.change_seq, after.updated_at) == (seq_before, updated_before)
+
+
+def test_validators_are_only_stored_after_a_complete_sync(app, feed):
+    truncated = _body(_item('a'), _item('b'))[:-20]
+    feed((200, {'ETag': '"v1"'}, truncated), (500, {}, b''))
+
+    with pytest.raises(ValueError):
+        fetch_and_update_products_from_external_api(FEED)
+    db.session.rollback()
+    assert FeedFetchState.query.filter_by(url=FEED).first() is None
+
+    with pytest.raises(RuntimeError):
+        fetch_and_update_products_from_external_api(FEED)
+    db.session.rollback()
+    assert FeedFetchState.query.filter_by(url=FEED).first() is None
@@ -0,0 +1,68 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from extensions import db
+from models import Affiliate, AffiliateStatistic
+from services import click_counter as click_counter_module
+from services.click_counter import ClickCounter
+
+DAY = date(2026, 10, 1)
+
+
+@pytest.fixture
+def counter(app):
+    db.session.execute(text('PRAGMA foreign_keys=ON'))
+    app.config.update(CLICK_WRITE_BEHIND=True, CLICK_FLUSH_THRESHOLD=1000)
+    counter = ClickCounter(app)
+    counter._ensure_worker = lambda: None  # Flushed by the tests
+    return counter
+
+
+@pytest.fixture
+def affiliate(app):
+    affiliate = Affiliate(name='Ana', email='ana@example.com', referral_link='https://merchant.example/?ref=ana')
+    db.session.add(affiliate)
+    db.session.commit()
+    return affiliate
+
+
+def _clicks(affiliate_id):
+    db.session.expire_all()
+    return [statistic.clicks for statistic in AffiliateStatistic.query.filter_by(affiliate_id=affiliate_id)]
+
+
+def test_buffered_clicks_are_written_on_flush(counter, affiliate):
+    for visitor in (1, 2, 2):
+        counter.record(affiliate.id, day=DAY, visitor=visitor)
+    assert _clicks(affiliate.id) == []
+
+    assert counter.flush() == 3
+    assert counter.pending == 0
+    assert _clicks(affiliate.id) == [3]
+
+
+def test_rejected_keys_are_dropped_without_blocking_the_others(counter, affiliate):
+    counter.record(affiliate.id, day=DAY, count=2)
+    counter.record(affiliate.id + 1, day=DAY, count=5)  # No such affiliate: violates the foreign key
+
+    assert counter.flush() == 2
+    assert counter.pending == 0
+    assert _clicks(affiliate.id) == [2]
+    assert AffiliateStatistic.query.count() == 1
+
+
+def test_batch_is_put_back_when_the_database_fails(counter, affiliate, monkeypatch):
+    def unavailable(batch, visitors):
+        raise OperationalError('INSERT', {}, Exception('database is locked'))
+
+    counter.record(affiliate.id, day=DAY, count=4, visitor=7)
+    monkeypatch.setattr(click_counter_module, '_write_click_batch', unavailable)
+    assert counter.flush() == 0
+    assert counter.pending == 4
+
+    monkeypatch.undo()
+    assert counter.flush() == 4
+    assert _clicks(affiliate.id) == [4]
@@ -0,0 +1,51 @@
+import pytest
+
+from services.click_filter import ClickFilter, is_bot, visitor_fingerprint
+
+BROWSER = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36'
+VISITOR = visitor_fingerprint('203.0.113.7', BROWSER)
+
+
+@pytest.fixture
+def click_filter():
+    click_filter = ClickFilter()
+    click_filter.window = 30.0
+    click_filter.max_entries = 3
+    return click_filter
+
+
+@pytest.mark.parametrize('user_agent', [
+    '', 'Googlebot/2.1 (+http://www.google.com/bot.html)', 'facebookexternalhit/1.1',
+    'curl/8.4.0', 'python-requests/2.31.0', 'Mozilla/5.0 (compatible; AhrefsBot/7.0)',
+])
+def test_bots_are_rejected(click_filter, user_agent):
+    assert is_bot(user_agent)
+    assert not click_filter.accept(1, user_agent, VISITOR, now=0)
+    assert click_filter.filtered_counts(1) == {'bot': 1}
+
+
+def test_browsers_are_accepted(click_filter):
+    assert not is_bot(BROWSER)
+    assert click_filter.accept(1, BROWSER, VISITOR, now=0)
+
+
+def test_repeated_click_inside_the_window_counts_once(click_filter):
+    assert click_filter.accept(1, BROWSER, VISITOR, now=0)
+    assert not click_filter.accept(1, BROWSER, VISITOR, now=29.9)
+    assert click_filter.accept(2, BROWSER, VISITOR, now=29.9)  # Another affiliate
+    assert click_filter.filtered_counts() == {'duplicate': 1}
+
+
+def test_repeated_click_after_the_window_counts_again(click_filter):
+    assert click_filter.accept(1, BROWSER, VISITOR, now=0)
+    assert click_filter.accept(1, BROWSER, VISITOR, now=30)
+    assert not click_filter.accept(1, BROWSER, VISITOR, now=31)
+
+
+def test_window_keeps_at_most_max_entries(click_filter):
+    for visitor in range(10):
+        assert click_filter.accept(1, BROWSER, visitor, now=visitor * 0.1)
+        assert len(click_filter._seen) <= click_filter.max_entries
+    # The oldest visitors were evicted and count again; the newest are still remembered
+    assert click_filter.accept(1, BROWSER, 0, now=1)
+    assert not click_filter.accept(1, BROWSER, 9, now=1)
@@ -0,0 +1,71 @@
+import os
+from datetime import datetime
+
+import pytest
+
+from extensions import db
+from models import Affiliate, AffiliateStatistic
+from services.click_filter import visitor_fingerprint
+from services.click_log import ClickEventLog
+from services.hyperloglog import HyperLogLog
+
+TIMESTAMP = datetime(2026, 10, 1, 12, 0).timestamp()
+
+
+@pytest.fixture
+def affiliate(app):
+    affiliate = Affiliate(name='Ana', email='ana@example.com', referral_link='https://merchant.example/?ref=ana')
+    db.session.add(affiliate)
+    db.session.commit()
+    return affiliate
+
+
+@pytest.fixture
+def click_log(app, tmp_path):
+    app.config.update(CLICK_LOG_ENABLED=True, CLICK_LOG_DIR=str(tmp_path / 'click_log'))
+    click_log = ClickEventLog(app)
+    click_log._ensure_worker = lambda: None  # Segments are closed and rolled up by the tests
+    return click_log
+
+
+def _segments(click_log, *parts):
+    return sorted(os.listdir(os.path.join(click_log.directory, *parts)))
+
+
+def _statistic(affiliate_id):
+    db.session.expire_all()
+    return AffiliateStatistic.query.filter_by(affiliate_id=affiliate_id).one()
+
+
+def test_rollup_folds_each_segment_once_and_archives_it(click_log, affiliate):
+    for address in ('203.0.113.1', '203.0.113.2', '203.0.113.1'):
+        click_log.append(affiliate.id, visitor=visitor_fingerprint(address, 'Firefox'), timestamp=TIMESTAMP)
+    assert click_log.rollup() == 0  # The segment is still open
+
+    click_log.close()
+    assert click_log.rollup() == 3
+    assert click_log.rollup() == 0
+    statistic = _statistic(affiliate.id)
+    assert statistic.date == datetime.fromtimestamp(TIMESTAMP).date()
+    assert statistic.clicks == 3
+    assert HyperLogLog.from_bytes(statistic.unique_visitors_sketch).count() == 2
+
+    assert [name for name in _segments(click_log) if name != 'archive'] == []
+    assert len(_segments(click_log, 'archive')) == 1
+    assert [event['a'] for event in click_log.iter_events()] == [affiliate.id] * 3
+
+
+def test_failed_rollup_leaves_the_segment_to_retry(click_log, affiliate, monkeypatch):
+    click_log.append(affiliate.id, timestamp=TIMESTAMP)
+    click_log.close()
+
+    def unavailable(counts):
+        raise RuntimeError('database unavailable')
+
+    monkeypatch.setattr('services.click_log.increment_clicks', unavailable)
+    assert click_log.rollup() == 0
+    assert _segments(click_log, 'archive') == []
+
+    monkeypatch.undo()
+    assert click_log.rollup() == 1
+    assert _statistic(affiliate.id).clicks == 1
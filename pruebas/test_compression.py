@@ -0,0 +1,41 @@
+import gzip
+
+import pytest
+from flask import Flask, Response, request
+
+from services.compression import compression
+from services.shared_cache import shared_cache
+
+BODY = 'contenido comprimible ' * 200
+
+
+@pytest.fixture
+def client(tmp_path):
+    app = Flask(__name__, instance_path=str(tmp_path))
+    app.config.update(CACHE_BACKEND='memory', CACHE_INVALIDATION_POLL=0)
+    shared_cache.init_app(app)
+    compression.init_app(app)
+
+    @app.route('/datos')
+    def datos():
+        response = Response(BODY, mimetype='text/plain')
+        response.set_etag('abc')
+        return response.make_conditional(request)
+
+    return app.test_client()
+
+
+def test_each_encoding_gets_its_own_etag(client):
+    plain = client.get('/datos')
+    gzipped = client.get('/datos', headers={'Accept-Encoding': 'gzip'})
+    assert plain.headers['ETag'] == '"abc"'
+    assert gzipped.headers['Content-Encoding'] == 'gzip'
+    assert gzipped.headers['ETag'] == '"abc-gzip"'
+    assert gzip.decompress(gzipped.data).decode() == BODY
+
+
+def test_compressed_etag_validates_its_variant(client):
+    response = client.get('/datos', headers={'Accept-Encoding': 'gzip', 'If-None-Match': '"abc-gzip"'})
+    assert response.status_code == 304
+    assert response.headers['ETag'] == '"abc-gzip"'
+    assert client.get('/datos', headers={'If-None-Match': '"abc"'}).status_code == 304
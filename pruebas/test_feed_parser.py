@@ -0,0 +1,89 @@
+import gzip
+import json
+
+import pytest
+from services.feed_parser import FeedFormatError, decompressed, iter_json_array
+
+
+def _chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+ITEMS = [
+    {"external_id": f"EXT{i:04d}", "name": f"Producto ñ {i}", "external_price": "$1,299.50", "n": i * 1.5}
+    for i in range(300)
+] + [12345, "texto", None, [1, 2]]
+
+
+@pytest.mark.parametrize("size", [1, 7, 64, 100000])
+def test_items_are_parsed_across_chunk_boundaries(size):
+    data = json.dumps(ITEMS, ensure_ascii=False, indent=1).encode('utf-8')
+    assert list(iter_json_array(_chunked(data, size))) == ITEMS
+
+
+def test_gzip_feeds_are_decompressed_on_the_fly():
+    data = gzip.compress(json.dumps(ITEMS).encode('utf-8'))
+    assert list(iter_json_array(decompressed(_chunked(data, 10)))) == ITEMS
+
+
+def test_plain_feeds_pass_through_unchanged():
+    data = json.dumps(ITEMS).encode('utf-8')
+    assert b''.join(decompressed(_chunked(data, 1))) == data
+
+
+def test_empty_array():
+    assert list(iter_json_array([b' [ ', b'] '])) == []
+
+
+def test_rejects_documents_that_are_not_arrays():
+    with pytest.raises(FeedFormatError):
+        list(iter_json_array([b'{"products": []}']))
+
+
+def test_rejects_truncated_feeds():
+    with pytest.raises(ValueError):
+        list(iter_json_array([b'[{"a": 1}, {"b": ']))
+
+
+def _counting(chunks, consumed):
+    for chunk in chunks:
+        consumed.append(chunk)
+        yield chunk
+
+
+def test_malformed_element_fails_without_reading_the_rest_of_the_feed():
+    data = b'[{"a": x}, ' + json.dumps(ITEMS * 20).encode('utf-8')[1:]
+    chunks = _chunked(data, 1024)
+    consumed = []
+    with pytest.raises(json.JSONDecodeError):
+        list(iter_json_array(_counting(chunks, consumed)))
+    assert len(consumed) <= 2 < len(chunks)
+
+
+def test_oversized_element_is_rejected(monkeypatch):
+    monkeypatch.setattr('services.feed_parser.MAX_ELEMENT_SIZE', 4096)
+    chunks = _chunked(b'["' + b'x' * 100000 + b'"]', 1024)
+    consumed = []
+    with pytest.raises(FeedFormatError):
+        list(iter_json_array(_counting(chunks, consumed)))
+    assert len(consumed) <= 6
+
+
+@pytest.mark.parametrize("ensure_ascii", [True, False])
+def test_literals_and_escapes_cut_by_chunk_boundaries(ensure_ascii):
+    items = [{"a": "ñ\\\"x", "t": True, "f": False, "n": None, "neg": -12.5e-3}] * 5
+    data = json.dumps(items, ensure_ascii=ensure_ascii).encode('utf-8')
+    for size in range(1, 40):
+        assert list(iter_json_array(_chunked(data, size))) == items
+
+
+def test_numbers_cut_at_every_offset():
+    items = [{"price": 19.99}, 5.5, -0.25, 1e-7, 12345, -3.5E+12]
+    data = json.dumps(items).encode('utf-8')
+    for offset in range(1, len(data)):
+        assert list(iter_json_array([data[:offset], data[offset:]])) == items
+
+
+def test_number_followed_by_garbage_at_the_end_of_the_feed_is_rejected():
+    with pytest.raises(FeedFormatError):
+        list(iter_json_array([b'[1, 5', b'.']))
@@ -0,0 +1,45 @@
+import pytest
+from services.hyperloglog import HyperLogLog
+
+
+def _sketch(items):
+    sketch = HyperLogLog()
+    for item in items:
+        sketch.add(item)
+    return sketch
+
+
+def test_empty_sketch_counts_zero():
+    assert HyperLogLog().count() == 0
+
+
+def test_count_is_close_to_cardinality():
+    # Con precisión 12 el error estándar es ~1.6%; se deja margen de 5%
+    for n in (10, 1000, 50000):
+        estimate = _sketch(f"visitor-{i}" for i in range(n)).count()
+        assert abs(estimate - n) <= max(1, n * 0.05)
+
+
+def test_duplicates_do_not_increase_count():
+    sketch = _sketch(["same-visitor"] * 1000)
+    assert sketch.count() == 1
+
+
+def test_merge_counts_union_once():
+    week = HyperLogLog.union([
+        _sketch(f"visitor-{i}" for i in range(0, 20000)),
+        _sketch(f"visitor-{i}" for i in range(10000, 30000)),
+    ])
+    assert abs(week.count() - 30000) <= 30000 * 0.05
+
+
+def test_serialization_round_trip_has_fixed_size():
+    sketch = _sketch(f"visitor-{i}" for i in range(5000))
+    data = sketch.to_bytes()
+    assert len(data) == 4096
+    assert HyperLogLog.from_bytes(data).count() == sketch.count()
+
+
+def test_rejects_invalid_sketch_size():
+    with pytest.raises(ValueError):
+        HyperLogLog.from_bytes(b"\x00" * 100)
@@ -0,0 +1,171 @@
+import json
+from datetime import timedelta
+
+import pytest
+from flask import Flask
+from flask_login import login_user
+from werkzeug.exceptions import NotFound
+
+from extensions import db, login_manager
+from models import Job, User
+from routes.admin import admin_download_job
+from services.jobs import JobRunner, QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED, _utcnow
+
+
+@pytest.fixture
+def app(tmp_path):
+    # A database file: the runner writes on connections of its own, outside the session
+    app = Flask(__name__, instance_path=str(tmp_path))
+    app.config.update(TESTING=True, SECRET_KEY='test',
+                      SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'jobs.db'}",
+                      JOB_WORKERS=0, JOB_PROGRESS_INTERVAL=0, JOB_EXPORT_DIR=str(tmp_path / 'exports'))
+    db.init_app(app)
+    login_manager.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def runner(app):
+    runner = JobRunner(app)
+
+    @runner.task('echo')
+    def echo(job, **params):
+        job.message = 'hecho'
+        return params
+
+    @runner.task('steps')
+    def steps(job, count):
+        for done in range(1, count + 1):
+            job.progress(done, count)
+        return {'steps': count}
+
+    return runner
+
+
+def _job(job_id):
+    db.session.expire_all()
+    return db.session.get(Job, job_id)
+
+
+def _run_next(runner):
+    claimed = runner._claim()
+    assert claimed is not None
+    runner._execute(*claimed)
+    return claimed[0]
+
+
+def test_enqueued_job_is_claimed_and_succeeds(runner):
+    job = runner.enqueue('echo', {'valor': 1})
+    assert _job(job.id).status == QUEUED
+
+    assert _run_next(runner) == job.id
+    job = _job(job.id)
+    assert job.status == SUCCEEDED
+    assert json.loads(job.result) == {'valor': 1}
+    assert job.message == 'hecho'
+    assert job.started_at is not None and job.finished_at is not None
+    assert runner._claim() is None
+
+
+def test_unknown_kind_is_rejected(runner):
+    with pytest.raises(ValueError):
+        runner.enqueue('desconocido')
+
+
+def test_unique_returns_the_pending_job(runner):
+    first = runner.enqueue('echo', {'valor': 1}, unique=True)
+    assert runner.enqueue('echo', {'valor': 1}, unique=True).id == first.id
+    assert runner.enqueue('echo', {'valor': 2}, unique=True).id != first.id
+    assert runner.enqueue('echo', {'valor': 1}).id != first.id
+
+    _run_next(runner)
+    assert runner.enqueue('echo', {'valor': 1}, unique=True).id != first.id
+
+
+def test_cancelling_a_queued_job_never_runs_it(runner):
+    job = runner.enqueue('echo')
+    assert runner.cancel(job.id)
+    assert _job(job.id).status == CANCELLED
+    assert runner._claim() is None
+    assert not runner.cancel(job.id)
+
+
+def test_cancelling_a_running_job_stops_it_at_its_next_progress(runner):
+    job = runner.enqueue('steps', {'count': 3})
+    claimed = runner._claim()
+    assert runner.cancel(job.id)
+    assert _job(job.id).status == RUNNING
+
+    runner._execute(*claimed)
+    job = _job(job.id)
+    assert job.status == CANCELLED
+    assert job.progress == 1
+    assert job.result is None
+
+
+def test_stale_running_jobs_are_failed(app, runner):
+    stale = runner.enqueue('echo')
+    alive = runner.enqueue('echo')
+    runner._claim()
+    runner._claim()
+    long_ago = _utcnow() - timedelta(seconds=app.config['JOB_STALE_AFTER'] + 1)
+    runner._update(stale.id, heartbeat_at=long_ago)
+
+    runner._beat()
+    assert _job(stale.id).status == FAILED
+    assert _job(stale.id).error is not None
+    assert _job(alive.id).status == RUNNING
+
+
+def test_heartbeat_keeps_the_jobs_of_this_process_alive(app, runner):
+    job = runner.enqueue('echo')
+    runner._claim()
+    runner._running.add(job.id)
+    runner._update(job.id, heartbeat_at=_utcnow() - timedelta(seconds=app.config['JOB_STALE_AFTER'] + 1))
+
+    runner._beat()
+    assert _job(job.id).status == RUNNING
+
+
+@pytest.fixture
+def admin(app):
+    user = User(username='admin', is_admin=True)
+    user.set_password('secreto')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def _download(app, admin, job):
+    db.session.add(job)
+    db.session.commit()
+    with app.test_request_context():
+        login_user(admin)
+        return admin_download_job(job.id)
+
+
+@pytest.mark.parametrize('kind, status, result', [
+    ('product_sync', SUCCEEDED, {'file': 'productos-1.ndjson'}),
+    ('product_export', RUNNING, None),
+    ('product_export', FAILED, {'file': 'productos-1.ndjson'}),
+    ('product_export', SUCCEEDED, {'products': 0}),
+], ids=['otro-tipo', 'sin-terminar', 'fallido', 'sin-fichero'])
+def test_download_refuses_jobs_without_an_export(app, admin, kind, status, result):
+    job = Job(kind=kind, status=status, result=json.dumps(result) if result else None)
+    with pytest.raises(NotFound):
+        _download(app, admin, job)
+
+
+def test_download_sends_the_export(app, admin, tmp_path):
+    (tmp_path / 'exports').mkdir()
+    (tmp_path / 'exports' / 'productos-1.ndjson').write_bytes(b'{"id": 1}\n')
+    job = Job(kind='product_export', status=SUCCEEDED, result=json.dumps({'file': 'productos-1.ndjson'}))
+
+    response = _download(app, admin, job)
+    response.direct_passthrough = False
+    assert response.status_code == 200
+    assert response.get_data() == b'{"id": 1}\n'
@@ -0,0 +1,113 @@
+import pytest
+from flask import abort, flash, make_response, session
+
+from extensions import db
+from models import Product, Article
+from services.page_cache import page_cache
+from services.shared_cache import shared_cache
+from services.site_context import site_context
+
+
+@pytest.fixture
+def client(app):
+    app.config.update(CACHE_BACKEND='memory', CACHE_INVALIDATION_POLL=0)
+    shared_cache.init_app(app)
+    site_context.init_app(app)
+    page_cache.init_app(app)
+
+    @app.route('/productos')
+    @page_cache.cached('product')
+    def productos():
+        return f'{Product.query.count()} productos'
+
+    @app.route('/guias')
+    @page_cache.cached('article')
+    def guias():
+        return f'{Article.query.count()} guías'
+
+    @app.route('/con-cookie')
+    @page_cache.cached()
+    def con_cookie():
+        response = make_response('hola')
+        response.set_cookie('preferencia', 'oscuro')
+        return response
+
+    @app.route('/con-sesion')
+    @page_cache.cached()
+    def con_sesion():
+        session['visto'] = True
+        return 'hola'
+
+    @app.route('/con-flash')
+    @page_cache.cached()
+    def con_flash():
+        flash('Guardado')
+        return 'hola'
+
+    @app.route('/no-existe')
+    @page_cache.cached()
+    def no_existe():
+        abort(404)
+
+    return app.test_client()
+
+
+def _get(client, path):
+    response = client.get(path)
+    return response.headers['X-Page-Cache'], response.get_data(as_text=True)
+
+
+def _add_product(name):
+    db.session.add(Product(name=name, slug=name, price=1.0, link='https://example.com'))
+    db.session.commit()
+
+
+def test_anonymous_pages_are_served_from_the_cache(client):
+    assert _get(client, '/productos') == ('MISS', '0 productos')
+    assert _get(client, '/productos') == ('HIT', '0 productos')
+    # The query string is part of the key
+    assert _get(client, '/productos?page=2')[0] == 'MISS'
+
+
+def test_cached_page_answers_conditional_requests(client):
+    etag = client.get('/productos').headers['ETag']
+    response = client.get('/productos', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+
+
+@pytest.mark.parametrize('key, value', [('_user_id', '1'), ('_flashes', [('info', 'Hola')])])
+def test_logged_in_users_and_pending_flashes_bypass_the_cache(client, key, value):
+    _get(client, '/productos')
+    assert _get(client, '/productos')[0] == 'HIT'
+    with client.session_transaction() as stored:
+        stored[key] = value
+    response = client.get('/productos')
+    assert 'X-Page-Cache' not in response.headers
+
+
+@pytest.mark.parametrize('path', ['/con-cookie', '/con-sesion', '/con-flash'])
+def test_responses_that_set_cookies_or_touch_the_session_are_not_stored(client, path):
+    # A new client each time, without the cookie or session of the first response
+    assert _get(client.application.test_client(), path)[0] == 'MISS'
+    assert _get(client.application.test_client(), path)[0] == 'MISS'
+
+
+def test_error_responses_are_not_stored(client):
+    assert client.get('/no-existe').status_code == 404
+    response = client.get('/no-existe')
+    assert response.status_code == 404
+    assert response.headers.get('X-Page-Cache') != 'HIT'
+
+
+def test_commits_invalidate_only_the_pages_with_matching_tags(client):
+    _get(client, '/productos')
+    _get(client, '/guias')
+
+    db.session.add(Article(title='Guía', slug='guia', content='texto', author='Equipo'))
+    db.session.commit()
+    assert _get(client, '/productos') == ('HIT', '0 productos')
+    assert _get(client, '/guias') == ('MISS', '1 guías')
+
+    _add_product('nuevo')
+    assert _get(client, '/productos') == ('MISS', '1 productos')
+    assert _get(client, '/guias') == ('HIT', '1 guías')
@@ -0,0 +1,58 @@
+import base64
+import json
+from datetime import datetime, timedelta
+
+from extensions import db
+import models
+from services.pagination import NEXT, decode_cursor, encode_cursor, keyset_paginate
+
+KEY_COLUMNS = (models.Testimonial.date_posted, models.Testimonial.id)
+
+
+def _raw_cursor(direction, key):
+    # A cursor forged by hand: valid base64 JSON, but not made by encode_cursor()
+    payload = json.dumps([direction, key]).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+
+def test_valid_cursor_is_loaded_with_the_column_types():
+    posted = datetime(2024, 5, 1, 12, 30)
+    direction, key = decode_cursor(encode_cursor(NEXT, (posted, 7)), KEY_COLUMNS)
+    assert direction == NEXT
+    assert key == (posted, 7)
+
+
+def test_tampered_cursor_values_are_invalid():
+    for key in (['ayer', 7], [20240501, 7], ['2024-05-01T12:30:00', '7'], ['2024-05-01T12:30:00', True],
+                ['2024-05-01T12:30:00'], ['2024-05-01T12:30:00', 7, 1], [None, 7]):
+        assert decode_cursor(_raw_cursor(NEXT, key), KEY_COLUMNS) is None, key
+
+
+def test_tampered_cursor_falls_back_to_the_first_page(app):
+    now = datetime(2024, 5, 1)
+    for i in range(3):
+        db.session.add(models.Testimonial(author=f'Autor {i}', content='Contenido', date_posted=now + timedelta(days=i)))
+    db.session.commit()
+
+    page = keyset_paginate(models.Testimonial.query, KEY_COLUMNS, _raw_cursor(NEXT, ['no-es-fecha', 'x']), per_page=2)
+    assert [item.author for item in page.items] == ['Autor 2', 'Autor 1']
+    assert page.prev_cursor is None
+
+
+def test_rows_with_a_null_key_are_left_out_of_every_page(app):
+    now = datetime(2024, 5, 1)
+    for i in range(4):
+        db.session.add(models.Testimonial(author=f'Autor {i}', content='Contenido', date_posted=now + timedelta(days=i)))
+    db.session.add(models.Testimonial(author='Sin fecha', content='Contenido', date_posted=None))
+    db.session.commit()
+    models.Testimonial.query.filter_by(author='Sin fecha').update({'date_posted': None})
+    db.session.commit()
+
+    authors, cursor = [], None
+    while True:
+        page = keyset_paginate(models.Testimonial.query, KEY_COLUMNS, cursor, per_page=2)
+        authors += [item.author for item in page.items]
+        if page.next_cursor is None:
+            break
+        cursor = page.next_cursor
+    assert authors == ['Autor 3', 'Autor 2', 'Autor 1', 'Autor 0']
@@ -0,0 +1,72 @@
+import pytest
+
+from extensions import db
+from models import Product
+from services.product_changes import InvalidChangeToken, product_changes
+
+
+def _add(*names):
+    products = [Product(name=name, slug=name, price=1.0, link=f'https://example.com/{name}') for name in names]
+    db.session.add_all(products)
+    db.session.commit()
+    return [product.id for product in products]
+
+
+def _changes(since=None, limit=500):
+    db.session.expire_all()
+    return product_changes(db.session, since=since, limit=limit)
+
+
+def test_deleted_product_appears_as_a_tombstone(app):
+    _, second_id = _add('uno', 'dos')
+    _, _, token, _ = _changes()
+
+    db.session.delete(db.session.get(Product, second_id))
+    db.session.commit()
+    changed, deleted, _, has_more = _changes(token)
+    assert changed == []
+    assert [(t.product_id, t.slug) for t in deleted] == [(second_id, 'dos')]
+    assert not has_more
+
+
+def test_updated_product_appears_once_with_a_newer_change_seq(app):
+    first_id, _ = _add('uno', 'dos')
+    changed, _, token, _ = _changes()
+    seq_before = {p.id: p.change_seq for p in changed}[first_id]
+
+    product = db.session.get(Product, first_id)
+    product.price = 2.0
+    db.session.commit()
+    product.price = 3.0
+    db.session.commit()
+    changed, deleted, token, _ = _changes(token)
+    assert [p.id for p in changed] == [first_id]
+    assert changed[0].change_seq > seq_before
+    assert deleted == []
+    assert _changes(token)[:2] == ([], [])
+
+
+def test_paging_with_a_limit_neither_skips_nor_repeats(app):
+    ids = _add(*(f'p{i}' for i in range(5)))
+    db.session.delete(db.session.get(Product, ids[1]))
+    db.session.commit()
+    later_ids = _add('p5', 'p6')
+    db.session.get(Product, ids[0]).price = 9.0
+    db.session.commit()
+
+    seen, token, has_more = [], None, True
+    while has_more:
+        changed, deleted, token, has_more = _changes(token, limit=2)
+        assert len(changed) + len(deleted) <= 2
+        seen += [('changed', p.id) for p in changed] + [('deleted', t.product_id) for t in deleted]
+
+    assert len(seen) == len(set(seen))
+    assert set(seen) == {('changed', product_id) for product_id in ids[2:] + later_ids + [ids[0]]} \
+        | {('deleted', ids[1])}
+    # The last change comes last
+    assert seen[-1] == ('changed', ids[0])
+
+
+def test_malformed_token_is_rejected(app):
+    with pytest.raises(InvalidChangeToken):
+        _changes('no-es-un-token')
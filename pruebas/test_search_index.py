@@ -0,0 +1,95 @@
+import importlib.util
+from pathlib import Path
+
+import pytest
+from sqlalchemy import text
+
+from extensions import db
+from models import Product, Article
+from services.search_index import PRODUCT, ARTICLE, search
+
+_MIGRATION = Path(__file__).resolve().parent.parent / 'migrations' / 'versions' / '91f1d1286f4f_full_text_search_index.py'
+
+
+@pytest.fixture(autouse=True)
+def search_index(app):
+    # The FTS5 table and its triggers, as created by the migration
+    spec = importlib.util.spec_from_file_location('full_text_search_index', _MIGRATION)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+    for statement in migration.SQLITE_UPGRADE:
+        db.session.execute(text(statement))
+    db.session.commit()
+
+
+def _product(name, description='', slug=None):
+    product = Product(name=name, slug=slug or name.lower().replace(' ', '-'), price=1.0,
+                      description=description, link='https://example.com')
+    db.session.add(product)
+    db.session.commit()
+    return product
+
+
+def _article(title, content):
+    article = Article(title=title, slug=title.lower().replace(' ', '-'), content=content, author='Equipo')
+    db.session.add(article)
+    db.session.commit()
+    return article
+
+
+def _found(query, **kwargs):
+    return [(hit.kind, hit.item.id) for hit in search(query, **kwargs).items]
+
+
+def test_matches_in_the_name_rank_above_matches_in_the_description(app):
+    in_description = _product('Funda de viaje', 'Funda acolchada para auriculares inalámbricos')
+    in_name = _product('Auriculares Z2', 'Sonido envolvente')
+    guide = _article('Cómo elegir auriculares', 'Guía de compra')
+
+    found = _found('auriculares')
+    assert found.index((PRODUCT, in_name.id)) < found.index((PRODUCT, in_description.id))
+    assert found.index((ARTICLE, guide.id)) < found.index((PRODUCT, in_description.id))
+
+
+def test_every_word_must_match_as_a_word_or_prefix(app):
+    both = _product('Teclado mecánico RGB')
+    _product('Teclado de membrana')
+    assert _found('tecl mecanico') == [(PRODUCT, both.id)]
+    assert _found('"OR" teclado') == []
+
+
+def test_index_follows_inserts_updates_and_deletes(app):
+    product = _product('Monitor curvo')
+    article = _article('Monitores para oficina', 'Qué mirar')
+    assert _found('curvo') == [(PRODUCT, product.id)]
+
+    product.name = 'Pantalla panorámica'
+    db.session.commit()
+    assert _found('curvo') == []
+    assert _found('panoramica') == [(PRODUCT, product.id)]
+
+    db.session.delete(product)
+    db.session.delete(article)
+    db.session.commit()
+    assert _found('panoramica') == []
+    assert _found('oficina') == []
+
+
+def test_cursors_page_through_every_hit_once(app):
+    for i in range(7):
+        _product(f'Cable USB {i}', 'cable ' * i)
+    for i in range(3):
+        _article(f'Guía de cables {i}', 'cable')
+
+    seen, cursor = [], None
+    while True:
+        page = search('cable', cursor=cursor, per_page=3)
+        seen += [(hit.kind, hit.item.id) for hit in page.items]
+        if page.next_cursor is None:
+            break
+        cursor = page.next_cursor
+    assert len(seen) == len(set(seen)) == 10
+    assert seen == _found('cable', per_page=10)
+
+    previous = search('cable', cursor=page.prev_cursor, per_page=3)
+    assert [(hit.kind, hit.item.id) for hit in previous.items] == seen[6:9]
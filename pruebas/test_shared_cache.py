@@ -0,0 +1,70 @@
+import time
+
+import pytest
+from services.shared_cache import SharedCache
+
+
+class _App:
+    def __init__(self, instance_path, **config):
+        self.instance_path = instance_path
+        self.config = config
+        self.extensions = {}
+
+    def before_request(self, callback):
+        pass
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def cache(request, tmp_path):
+    return SharedCache(_App(str(tmp_path), CACHE_BACKEND=request.param, CACHE_MAX_BYTES=1000,
+                            CACHE_INVALIDATION_POLL=0))
+
+
+def test_get_returns_what_was_set(cache):
+    cache.set('a', b'valor')
+    assert cache.get('a') == b'valor'
+    assert cache.get('missing') is None
+
+
+def test_entries_expire_after_ttl(cache):
+    cache.set('a', b'valor', ttl=0.01)
+    time.sleep(0.02)
+    assert cache.get('a') is None
+
+
+def test_size_cap_evicts_entries(cache):
+    for i in range(5):
+        cache.set(f'k{i}', bytes(400))
+    assert sum(cache.get(f'k{i}') is not None for i in range(5)) <= 2
+    assert cache.get('k4') is not None
+
+
+def test_invalidating_a_tag_drops_only_its_entries(cache):
+    cache.set('page', b'html', tags=('product',))
+    cache.set('other', b'html', tags=('article',))
+    cache.invalidate('product')
+    assert cache.get('page') is None
+    assert cache.get('other') == b'html'
+
+
+def test_value_built_before_an_invalidation_is_not_stored(cache):
+    generations = cache.generations('product')
+    cache.invalidate('product')
+    cache.set('page', b'stale', tags=('product',), generations=generations)
+    assert cache.get('page') is None
+
+
+def test_subscribers_run_for_invalidations_from_other_workers(tmp_path):
+    path = str(tmp_path / 'cache.sqlite3')
+    worker, other_worker = (SharedCache(_App(str(tmp_path), CACHE_PATH=path, CACHE_INVALIDATION_POLL=0))
+                            for _ in range(2))
+    calls = []
+    worker.subscribe('ads', lambda: calls.append('ads'))
+
+    worker.invalidate('ads')  # Its own invalidation: the caller already updated its state
+    worker.poll()
+    assert calls == []
+
+    other_worker.invalidate('ads')
+    worker.poll()
+    assert calls == ['ads']
@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import insert
+
+from extensions import db
+from models import Advertisement, SocialMediaLink
+from services import site_context as site_context_module
+from services.shared_cache import shared_cache
+from services.site_context import site_context
+
+NOW = datetime(2026, 10, 1, 12, 0, tzinfo=timezone.utc)
+
+
+class _Clock(datetime):
+    current = NOW
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.current
+
+
+@pytest.fixture
+def clock(app, monkeypatch):
+    app.config.update(CACHE_BACKEND='memory', CACHE_INVALIDATION_POLL=0, SITE_CONTEXT_TTL=300)
+    shared_cache.init_app(app)
+    site_context.init_app(app)
+    site_context.invalidate()
+    monkeypatch.setattr(_Clock, 'current', NOW)
+    monkeypatch.setattr(site_context_module, 'datetime', _Clock)
+    return _Clock
+
+
+def _ad(title, start=None, end=None):
+    db.session.add(Advertisement(type='banner', title=title, start_date=start, end_date=end))
+    db.session.commit()
+
+
+def _add_without_commit_hooks(title):
+    # Written outside the ORM session, so only the schedule can make the cache notice it
+    with db.engine.begin() as connection:
+        connection.execute(insert(Advertisement).values(type='banner', title=title, is_active=True))
+
+
+def _active_titles():
+    return sorted(ad.title for ad in site_context.get()['active_advertisements'])
+
+
+def test_ads_are_served_from_memory_until_the_next_end_date(clock):
+    naive_now = NOW.replace(tzinfo=None)
+    _ad('Oferta', end=naive_now + timedelta(hours=1))
+    assert _active_titles() == ['Oferta']
+    assert site_context.seconds_until_ads_change() == pytest.approx(3600, abs=1)
+
+    _add_without_commit_hooks('Nueva')
+    clock.current = NOW + timedelta(minutes=59)
+    assert _active_titles() == ['Oferta']
+
+    clock.current = NOW + timedelta(hours=1, seconds=1)
+    assert _active_titles() == ['Nueva']
+    assert site_context.seconds_until_ads_change() is None
+
+
+def test_scheduled_ads_switch_on_at_their_start_date(clock):
+    naive_now = NOW.replace(tzinfo=None)
+    _ad('Navidad', start=naive_now + timedelta(days=1), end=naive_now + timedelta(days=2))
+    assert _active_titles() == []
+    assert site_context.seconds_until_ads_change() == pytest.approx(86400, abs=1)
+
+    clock.current = NOW + timedelta(days=1, seconds=1)
+    assert _active_titles() == ['Navidad']
+    assert site_context.seconds_until_ads_change() == pytest.approx(86400 - 1, abs=1)
+
+
+def test_commits_drop_the_cached_context(clock):
+    assert site_context.get()['social_media_links'] == []
+    db.session.add(SocialMediaLink(platform='Instagram', url='https://instagram.com/tienda'))
+    db.session.commit()
+    assert [link.platform for link in site_context.get()['social_media_links']] == ['Instagram']
+
+    _ad('Oferta')
+    assert _active_titles() == ['Oferta']
@@ -0,0 +1,66 @@
+import gzip
+import re
+
+import pytest
+
+from extensions import db
+from models import Product, Article
+from routes.public import bp
+from services.shared_cache import shared_cache
+from services.sitemap import STATIC_PAGES, sitemaps
+
+
+@pytest.fixture
+def client(app):
+    app.config.update(CACHE_BACKEND='memory', CACHE_INVALIDATION_POLL=0, SITEMAP_MAX_URLS=50000)
+    shared_cache.init_app(app)
+    sitemaps.init_app(app)
+    app.register_blueprint(bp)
+    for i in range(7):
+        db.session.add(Product(name=f'Producto {i}', slug=f'producto-{i}', price=1.0, link='https://example.com'))
+    db.session.add(Article(title='Guía', slug='guia', content='texto', author='Equipo'))
+    db.session.commit()
+    return app.test_client()
+
+
+def _locs(body):
+    return re.findall(r'<loc>([^<]*)</loc>', body.decode('utf-8') if isinstance(body, bytes) else body)
+
+
+def test_small_catalog_is_a_single_urlset(client):
+    response = client.get('/sitemap.xml')
+    assert response.status_code == 200
+    locs = _locs(response.get_data())
+    assert len(locs) == len(STATIC_PAGES) + 8
+    assert 'http://localhost/product/producto-0' in locs
+    assert client.get('/sitemap-products-1.xml').status_code == 404
+
+
+def test_large_catalog_is_split_into_shards(app, client):
+    app.config['SITEMAP_MAX_URLS'] = 5
+    index = client.get('/sitemap.xml').get_data(as_text=True)
+    assert '<sitemapindex' in index
+    assert [loc.rsplit('/', 1)[1] for loc in _locs(index)] == [
+        'sitemap-pages.xml', 'sitemap-products-1.xml', 'sitemap-products-2.xml', 'sitemap-guides-1.xml'
+    ]
+
+    first, second = (_locs(client.get(f'/sitemap-products-{n}.xml').get_data()) for n in (1, 2))
+    assert len(first) == 5 and len(second) == 2
+    assert not set(first) & set(second)
+    assert len(_locs(client.get('/sitemap-pages.xml').get_data())) == len(STATIC_PAGES)
+    assert client.get('/sitemap-products-3.xml').status_code == 404
+    assert client.get('/sitemap-otros-1.xml').status_code == 404
+
+
+def test_gzip_variant_matches_the_plain_document_and_is_cached(client):
+    plain = client.get('/sitemap.xml').get_data()
+    gzipped = client.get('/sitemap.xml', headers={'Accept-Encoding': 'gzip'})
+    assert gzipped.headers['Content-Encoding'] == 'gzip'
+    assert gzipped.headers['Vary'] == 'Accept-Encoding'
+    assert gzip.decompress(gzipped.get_data()) == plain
+
+    # Served from the cache until products change
+    assert client.get('/sitemap.xml').get_data() == plain
+    db.session.add(Product(name='Nuevo', slug='nuevo', price=1.0, link='https://example.com'))
+    db.session.commit()
+    assert len(_locs(client.get('/sitemap.xml').get_data())) == len(_locs(plain)) + 1
@@ -1,26 +1,33 @@
 # Importaciones de bibliotecas estándar
 import functools
-from datetime import datetime, timezone
+import json
+from datetime import datetime, timezone, date, timedelta
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import joinedload
 from werkzeug.security import check_password_hash
 
 # Importaciones de bibliotecas de terceros
-from flask import Blueprint, render_template, flash, redirect, url_for, request
+from flask import (
+    Blueprint, render_template, flash, redirect, url_for, request, jsonify, current_app,
+    send_from_directory, abort
+)
 from flask_login import login_user, logout_user, login_required, current_user
 
 # Importaciones de aplicaciones locales
 from models import (
     User, Product, Category, Subcategory, Article, SyncInfo,
     SocialMediaLink, ContactMessage, Testimonial as Testimonio,
-    Affiliate, AffiliateStatistic, db
+    Affiliate, AffiliateStatistic, Job, db
 )
 from forms import (
     LoginForm, ProductForm, CategoryForm, SubCategoryForm, ArticleForm,
-    ApiSyncForm, SocialMediaForm, ContactMessageAdminForm, TestimonialForm
+    ApiSyncForm, SocialMediaForm, ContactMessageAdminForm, TestimonialForm,
+    AffiliateForm
 )
 from utils import slugify
-from services.api_sync import fetch_and_update_products_from_external_api
+from services.jobs import jobs, FINISHED, SUCCEEDED
+from services.affiliate_stats import summarize_by_period
+from services.click_filter import click_filter
 
 bp = Blueprint('admin', __name__, url_prefix='/admin')
 
@@ -380,10 +387,13 @@ def admin_api_products():
         db.session.add(sync_info)
         db.session.commit()
     form = ApiSyncForm()
+    last_job = Job.query.filter_by(kind='product_sync').order_by(Job.id.desc()).first()
     return render_template('admin/admin_api_products.html',
                            last_sync_time=sync_info.last_sync_time,
                            last_sync_count=sync_info.last_sync_count,
                            last_synced_api_url=sync_info.last_synced_api_url,
+                           sync_info=sync_info,
+                           last_sync_job=_job_status(last_job) if last_job else None,
                            form=form)
 
 @bp.route('/api_products/sync', methods=['POST'])
@@ -391,28 +401,122 @@ def admin_api_products():
 def admin_sync_api_products():
     form = ApiSyncForm()
     if form.validate_on_submit():
-        api_url = form.api_url.data
-        sync_info = SyncInfo.query.first()
-        if not sync_info:
-            sync_info = SyncInfo(last_sync_time="N/A", last_sync_count=0, last_synced_api_url="N/A")
-            db.session.add(sync_info)
-            db.session.commit()
+        # La sincronización se ejecuta en segundo plano; la página de la tarea muestra su progreso
         try:
-            updated_count = fetch_and_update_products_from_external_api(api_url)
-            sync_info.last_sync_time = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
-            sync_info.last_sync_count = updated_count
-            sync_info.last_synced_api_url = api_url
-            db.session.commit()
-            flash(f'Sincronización API completada. Se actualizaron/añadieron {updated_count} productos.', 'success')
+            job = jobs.enqueue('product_sync', {'api_url': form.api_url.data}, unique=True)
         except Exception as e:
-            flash(f'Error durante la sincronización API. Detalles: {str(e)}', 'danger')
             db.session.rollback()
+            flash(f'Error al iniciar la sincronización API. Detalles: {str(e)}', 'danger')
+            return redirect(url_for('admin.admin_api_products'))
+        return redirect(url_for('admin.admin_job', job_id=job.id))
     else:
         for field, errors in form.errors.items():
             for error in errors:
                 flash(f"Error en {getattr(form, field).label.text}: {error}", 'danger')
     return redirect(url_for('admin.admin_api_products'))
 
+# --- Tareas en Segundo Plano ---
+JOB_LABELS = {
+    'product_sync': 'Sincronización de productos',
+    'click_rollup': 'Consolidación de clics',
+    'product_export': 'Exportación de productos',
+    'link_check': 'Comprobación de enlaces',
+}
+# Tareas que se lanzan desde la lista de tareas (la sincronización necesita una URL y se lanza desde su página)
+LAUNCHABLE_JOBS = ('click_rollup', 'product_export', 'link_check')
+# Estado -> (etiqueta, color de Bootstrap)
+JOB_STATUSES = {
+    'queued': ('En cola', 'secondary'),
+    'running': ('En curso', 'primary'),
+    'succeeded': ('Completada', 'success'),
+    'failed': ('Fallida', 'danger'),
+    'cancelled': ('Cancelada', 'warning'),
+}
+
+def _job_status(job):
+    """Estado de una tarea tal como lo consulta la página de la tarea."""
+    label, style = JOB_STATUSES.get(job.status, (job.status, 'secondary'))
+    if job.status == SUCCEEDED:
+        percent = 100
+    elif job.total:
+        percent = min(100, int(job.progress * 100 / job.total))
+    else:
+        percent = None  # Progreso desconocido: barra indeterminada
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'label': JOB_LABELS.get(job.kind, job.kind),
+        'status': job.status,
+        'status_label': label,
+        'status_style': style,
+        'finished': job.status in FINISHED,
+        'cancel_requested': job.cancel_requested,
+        'progress': job.progress,
+        'total': job.total,
+        'percent': percent,
+        'message': job.message,
+        'error': job.error,
+        'result': json.loads(job.result) if job.result else None,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+@bp.route('/jobs')
+@admin_required
+def admin_jobs():
+    recent_jobs = Job.query.order_by(Job.id.desc()).limit(50).all()
+    return render_template('admin/admin_jobs.html',
+                           jobs=[_job_status(job) for job in recent_jobs],
+                           job_labels=JOB_LABELS,
+                           launchable_jobs=LAUNCHABLE_JOBS)
+
+@bp.route('/jobs/start/<kind>', methods=['POST'])
+@admin_required
+def admin_start_job(kind):
+    if kind not in LAUNCHABLE_JOBS:
+        flash('Tarea desconocida.', 'danger')
+        return redirect(url_for('admin.admin_jobs'))
+    try:
+        job = jobs.enqueue(kind, unique=True)
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error al iniciar la tarea: {e}', 'danger')
+        return redirect(url_for('admin.admin_jobs'))
+    return redirect(url_for('admin.admin_job', job_id=job.id))
+
+@bp.route('/jobs/<int:job_id>')
+@admin_required
+def admin_job(job_id):
+    job = Job.query.get_or_404(job_id)
+    return render_template('admin/admin_job_detail.html', job=_job_status(job))
+
+@bp.route('/jobs/<int:job_id>/status')
+@admin_required
+def admin_job_status(job_id):
+    job = Job.query.get_or_404(job_id)
+    return jsonify(_job_status(job))
+
+@bp.route('/jobs/<int:job_id>/cancel', methods=['POST'])
+@admin_required
+def admin_cancel_job(job_id):
+    Job.query.get_or_404(job_id)
+    if jobs.cancel(job_id):
+        flash('Cancelación solicitada: la tarea se detendrá en su próximo punto de control.', 'success')
+    else:
+        flash('La tarea ya había terminado.', 'warning')
+    return redirect(url_for('admin.admin_job', job_id=job_id))
+
+@bp.route('/jobs/<int:job_id>/download')
+@admin_required
+def admin_download_job(job_id):
+    job = Job.query.get_or_404(job_id)
+    result = json.loads(job.result) if job.result else {}
+    if job.kind != 'product_export' or job.status != SUCCEEDED or not result.get('file'):
+        abort(404)
+    return send_from_directory(current_app.config['JOB_EXPORT_DIR'], result['file'],
+                               as_attachment=True, mimetype='application/x-ndjson')
+
 PLATFORM_ICONS = {
     'Facebook': 'fab fa-facebook-f',
     'Twitter': 'fab fa-x-twitter',
@@ -712,4 +816,86 @@ def listar_afiliados():
 @admin_required
 def detalle_afiliado(id):
     afiliado = Affiliate.query.get_or_404(id)
-    return render_template('admin/afiliado_detalle.html', afiliado=afiliado)
\ No newline at end of file
+    return render_template('admin/afiliado_detalle.html', afiliado=afiliado)
+
+@bp.route('/affiliates')
+@admin_required
+def admin_affiliates():
+    affiliates = Affiliate.query.order_by(Affiliate.id.desc()).all()
+    return render_template('admin/admin_affiliates.html', affiliates=affiliates)
+
+# La tabla de redirecciones de /ref/<id> se recarga automáticamente
+# después de cada commit que modifica afiliados (ver services/affiliate_redirects.py)
+@bp.route('/affiliates/add', methods=['GET', 'POST'])
+@admin_required
+def admin_add_affiliate():
+    form = AffiliateForm()
+    if form.validate_on_submit():
+        new_affiliate = Affiliate(
+            name=form.name.data,
+            email=form.email.data,
+            referral_link=form.referral_link.data,
+            is_active=form.is_active.data
+        )
+        try:
+            db.session.add(new_affiliate)
+            db.session.commit()
+            flash('Afiliado añadido exitosamente!', 'success')
+            return redirect(url_for('admin.admin_affiliates'))
+        except IntegrityError:
+            db.session.rollback()
+            flash('Error: Ya existe un afiliado con ese email o enlace de referido.', 'danger')
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Error al añadir afiliado: {e}', 'danger')
+    return render_template('admin/admin_add_edit_affiliate.html', form=form)
+
+@bp.route('/affiliates/edit/<int:affiliate_id>', methods=['GET', 'POST'])
+@admin_required
+def admin_edit_affiliate(affiliate_id):
+    affiliate = Affiliate.query.get_or_404(affiliate_id)
+    form = AffiliateForm(obj=affiliate)
+    if form.validate_on_submit():
+        form.populate_obj(affiliate)
+        try:
+            db.session.commit()
+            flash('Afiliado actualizado exitosamente!', 'success')
+            return redirect(url_for('admin.admin_affiliates'))
+        except IntegrityError:
+            db.session.rollback()
+            flash('Error: Ya existe un afiliado con ese email o enlace de referido.', 'danger')
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Error al actualizar afiliado: {e}', 'danger')
+    return render_template('admin/admin_add_edit_affiliate.html', form=form, affiliate=affiliate)
+
+@bp.route('/affiliates/delete/<int:affiliate_id>', methods=['POST'])
+@admin_required
+def admin_delete_affiliate(affiliate_id):
+    affiliate = Affiliate.query.get_or_404(affiliate_id)
+    try:
+        db.session.delete(affiliate)
+        db.session.commit()
+        flash('Afiliado eliminado exitosamente!', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error al eliminar afiliado: {e}', 'danger')
+    return redirect(url_for('admin.admin_affiliates'))
+
+@bp.route('/affiliates/<int:affiliate_id>/stats')
+@admin_required
+def admin_affiliate_stats(affiliate_id):
+    affiliate = Affiliate.query.get_or_404(affiliate_id)
+    days = min(request.args.get('days', 90, type=int), 366)
+    stats = AffiliateStatistic.query.filter(
+        AffiliateStatistic.affiliate_id == affiliate.id,
+        AffiliateStatistic.date >= date.today() - timedelta(days=days)
+    ).order_by(AffiliateStatistic.date.desc()).all()
+    # Los visitantes únicos semanales y mensuales se obtienen fusionando los sketches diarios
+    return render_template('admin/admin_affiliate_stats.html',
+                           affiliate=affiliate,
+                           stats=stats,
+                           days=days,
+                           weekly_stats=summarize_by_period(stats, 'week'),
+                           monthly_stats=summarize_by_period(stats, 'month'),
+                           filtered_clicks=click_filter.filtered_counts(affiliate.id))
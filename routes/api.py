@@ -1,201 +1,325 @@
 # C:\Users\joran\OneDrive\data\Documentos\LMSGI\afiliados_app\routes\api.py
 
-from flask import Blueprint, jsonify
+from flask import Blueprint, Response, abort, current_app, jsonify, request, stream_with_context, url_for
+from extensions import db
 from models import Product, Category, Subcategory, Article, Testimonial # Asegúrate de importar el modelo Testimonial
-from sqlalchemy.orm import joinedload
 
-# Se define el Blueprint para la API con el prefijo /api
+from services.pagination import NEXT, decode_cursor, keyset_paginate, keyset_query
+from services.table_versions import conditional_get
+from services.product_changes import InvalidChangeToken, product_changes
+from services.serializers import ARTICLE, CATEGORY, PRODUCT, SUBCATEGORY, TESTIMONIAL, dumps, json_response
+
+# Se define el Blueprint para la API con el prefijo /api.
+# Todas las respuestas GET llevan ETag y Last-Modified (ver conditional_get)
+# y responden 304 si el cliente ya tiene la versión actual.
 bp = Blueprint('api', __name__, url_prefix='/api')
 
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+# ----------- PAGINACIÓN Y STREAMING -----------
+
+def _list_response(query, key_columns, serialize, descending=False):
+    """
+    Respuesta de un endpoint de listado, paginada por cursor.
+
+    Sin parámetros devuelve los primeros API_DEFAULT_LIMIT elementos; `limit`
+    (hasta API_MAX_LIMIT) y `cursor` seleccionan la página. El cuerpo sigue
+    siendo un array JSON; el cursor de la página siguiente va en la cabecera
+    X-Next-Cursor y en Link (rel="next"/"prev").
+
+    Con ?format=ndjson (o Accept: application/x-ndjson) se emiten todos los
+    elementos desde el cursor, uno por línea, leídos en bloques con un cursor
+    del lado del servidor: las exportaciones completas usan memoria constante.
+    """
+    cursor = request.args.get('cursor')
+    # El cursor debe tener un valor del tipo de cada columna de la clave
+    decoded = decode_cursor(cursor, key_columns)
+    if cursor and decoded is None:
+        return jsonify({"mensaje": "Cursor inválido"}), 400
+    limit = request.args.get('limit', type=int)
+    if limit is not None and limit < 1:
+        return jsonify({"mensaje": "El parámetro limit debe ser un entero positivo"}), 400
+
+    if _wants_ndjson():
+        if decoded and decoded[0] != NEXT:
+            return jsonify({"mensaje": "El streaming NDJSON solo avanza con cursores de página siguiente"}), 400
+        query = keyset_query(query, key_columns, NEXT, decoded[1] if decoded else None, descending)
+        if limit is not None:
+            query = query.limit(limit)
+        return Response(stream_with_context(_ndjson_lines(query, serialize)), mimetype=NDJSON_MIMETYPE)
+
+    limit = min(limit or current_app.config['API_DEFAULT_LIMIT'], current_app.config['API_MAX_LIMIT'])
+    page = keyset_paginate(query, key_columns, cursor, limit, descending=descending)
+    response = json_response([serialize(row) for row in page.items])
+    links = []
+    if page.next_cursor:
+        response.headers['X-Next-Cursor'] = page.next_cursor
+        links.append(f'<{_page_url(page.next_cursor)}>; rel="next"')
+    if page.prev_cursor:
+        links.append(f'<{_page_url(page.prev_cursor)}>; rel="prev"')
+    if links:
+        response.headers['Link'] = ', '.join(links)
+    return response
+
+
+def _wants_ndjson():
+    if request.args.get('format') == 'ndjson':
+        return True
+    return request.accept_mimetypes.best == NDJSON_MIMETYPE
+
+
+def _representation():
+    # Los listados negocian JSON o NDJSON: cada formato tiene su propio ETag
+    return 'ndjson' if _wants_ndjson() else 'json'
+
+
+def _page_url(cursor):
+    args = request.args.to_dict()
+    args['cursor'] = cursor
+    return url_for(request.endpoint, _external=True, **(request.view_args or {}), **args)
+
+
+def _ndjson_lines(query, serialize):
+    chunk_size = current_app.config['API_STREAM_CHUNK_SIZE']
+    lines = []
+    for row in query.yield_per(chunk_size):
+        lines.append(dumps(serialize(row)))
+        if len(lines) >= chunk_size:
+            yield b'\n'.join(lines) + b'\n'
+            lines = []
+    if lines:
+        yield b'\n'.join(lines) + b'\n'
+
+# ----------- CONSULTAS POR LOTES -----------
+
+def _batch_response(query, column, raw_keys, serialize, parse=str):
+    """
+    Resuelve una lista de claves separadas por comas (ids o slugs) con una sola
+    consulta IN. Devuelve {"items": [...], "missing": [...]}, con los
+    elementos en el orden pedido y las claves que no existen en `missing`.
+    """
+    try:
+        keys = list(dict.fromkeys(parse(key.strip()) for key in raw_keys.split(',') if key.strip()))
+    except ValueError:
+        return jsonify({"mensaje": "Lista de claves inválida"}), 400
+    max_keys = current_app.config['API_BATCH_MAX_KEYS']
+    if not keys:
+        return jsonify({"mensaje": "La lista de claves está vacía"}), 400
+    if len(keys) > max_keys:
+        return jsonify({"mensaje": f"Se pueden pedir como máximo {max_keys} claves por consulta"}), 400
+
+    found = {getattr(row, column.key): row for row in query.filter(column.in_(keys))}
+    return json_response({
+        "items": [serialize(found[key]) for key in keys if key in found],
+        "missing": [key for key in keys if key not in found]
+    })
+
+# ----------- SERIALIZACIÓN Y PROYECCIONES -----------
+
+# Campos que se pueden pedir con ?fields= (por defecto, todos)
+PRODUCT_FIELDS = PRODUCT.fields
+ARTICLE_FIELDS = ARTICLE.fields
+# Relaciones que se pueden incrustar en los productos con ?include=
+PRODUCT_INCLUDES = tuple(PRODUCT.relations)
+# Campos de los productos incrustados en el detalle de una subcategoría
+SUBCATEGORY_PRODUCT_FIELDS = ('id', 'name', 'slug', 'price', 'image', 'link')
+
+
+def _bad_request(mensaje):
+    response = jsonify({"mensaje": mensaje})
+    response.status_code = 400
+    abort(response)
+
+
+def _requested(param, allowed, default):
+    """Lista de valores de un parámetro separado por comas, validada contra `allowed`."""
+    raw = request.args.get(param)
+    if raw is None:
+        return default
+    values = tuple(dict.fromkeys(value.strip() for value in raw.split(',') if value.strip()))
+    unknown = [value for value in values if value not in allowed]
+    if not values or unknown:
+        _bad_request(f"Valores no válidos para {param}: {', '.join(unknown)}. Permitidos: {', '.join(allowed)}")
+    return values
+
+
+def _product_projection(*required):
+    """
+    Consulta y serializador para ?fields= y ?include=.
+
+    Solo se seleccionan las columnas pedidas (más el id y `required`, p. ej.
+    las claves de paginación), sin crear instancias del ORM: cada fila se
+    convierte en diccionario con el serializador compilado de PRODUCT. Las
+    relaciones incluidas se leen con JOIN en la misma consulta.
+    """
+    fields = _requested('fields', PRODUCT_FIELDS, PRODUCT_FIELDS)
+    include = _requested('include', PRODUCT_INCLUDES, ())
+    return PRODUCT.select(fields, include, extra=(Product.id, *required)), PRODUCT.serializer(fields, include)
+
+
+def _article_projection(*required):
+    """Como _product_projection() para los artículos (solo ?fields=)."""
+    fields = _requested('fields', ARTICLE_FIELDS, ARTICLE_FIELDS)
+    return ARTICLE.select(fields, extra=(Article.id, *required)), ARTICLE.serializer(fields)
+
 # ----------- RUTAS DE PRODUCTOS -----------
 
-# Obtener todos los productos
+# Obtener los productos, paginados por cursor (o en streaming NDJSON), o un lote por ids
 @bp.route('/products', methods=['GET'])
+@conditional_get(Product, representation=_representation)
 def api_products():
-    products = Product.query.all()
-    products_data = [{
-        "id": p.id,
-        "name": p.name,
-        "slug": p.slug,
-        "price": p.price,
-        "description": p.description,
-        "image": p.image,
-        "link": p.link,
-        "subcategory_id": p.subcategory_id,
-        "external_id": p.external_id,
-        "created_at": p.created_at.isoformat() if p.created_at else None,
-        "updated_at": p.updated_at.isoformat() if p.updated_at else None
-    } for p in products]
-    return jsonify(products_data)
+    # ?ids=1,2,3 devuelve esos productos en una sola consulta
+    query, serialize = _product_projection()
+    if request.args.get('ids') is not None:
+        return _batch_response(query, Product.id, request.args['ids'], serialize, parse=int)
+    return _list_response(query, (Product.id,), serialize)
+
+# Obtener varios productos por slug (?slugs=a,b,c) en una sola consulta
+@bp.route('/products/by-slug', methods=['GET'])
+@conditional_get(Product)
+def api_products_by_slug():
+    query, serialize = _product_projection(Product.slug)
+    return _batch_response(query, Product.slug, request.args.get('slugs', ''), serialize)
+
+# Sincronización incremental: productos creados, modificados o eliminados desde un token
+@bp.route('/products/changes', methods=['GET'])
+@conditional_get(Product)
+def api_product_changes():
+    """
+    Devuelve los cambios del catálogo posteriores a `since` (o todos si no se
+    indica), como máximo `limit` (hasta API_MAX_LIMIT). Los productos
+    eliminados aparecen en `deleted`. El cliente guarda `next_since` y lo envía
+    en la siguiente llamada; si `has_more` es true, debe llamar de nuevo ya.
+    """
+    limit = request.args.get('limit', current_app.config['API_MAX_LIMIT'], type=int)
+    if limit < 1:
+        return jsonify({"mensaje": "El parámetro limit debe ser un entero positivo"}), 400
+    query, serialize = _product_projection(Product.change_seq)
+    try:
+        changed, deleted, next_since, has_more = product_changes(
+            db.session, request.args.get('since'), min(limit, current_app.config['API_MAX_LIMIT']), query
+        )
+    except InvalidChangeToken:
+        return jsonify({"mensaje": "Token de sincronización inválido"}), 400
+    return json_response({
+        "changed": [serialize(row) for row in changed],
+        "deleted": [{
+            "id": t.product_id,
+            "slug": t.slug,
+            "external_id": t.external_id,
+            "deleted_at": t.deleted_at.isoformat()
+        } for t in deleted],
+        "next_since": next_since,
+        "has_more": has_more
+    })
 
 # Obtener un producto por ID
 @bp.route('/products/<int:product_id>', methods=['GET'])
+@conditional_get(Product)
 def api_product_by_id(product_id):
-    product = Product.query.get(product_id)
-    if product:
-        return jsonify({
-            "id": product.id,
-            "name": product.name,
-            "slug": product.slug,
-            "price": product.price,
-            "description": product.description,
-            "image": product.image,
-            "link": product.link,
-            "subcategory_id": product.subcategory_id,
-            "external_id": product.external_id,
-            "created_at": product.created_at.isoformat() if product.created_at else None,
-            "updated_at": product.updated_at.isoformat() if product.updated_at else None
-        })
+    query, serialize = _product_projection()
+    row = query.filter(Product.id == product_id).first()
+    if row:
+        return json_response(serialize(row))
     return jsonify({"mensaje": "Producto no encontrado"}), 404
 
 # ----------- RUTAS DE CATEGORÍAS -----------
 
-# Obtener todas las categorías
+# Obtener las categorías, paginadas por cursor
 @bp.route('/categories', methods=['GET'])
+@conditional_get(Category, representation=_representation)
 def api_categories():
-    categories = Category.query.all()
-    categories_data = [{
-        "id": c.id,
-        "name": c.name,
-        "slug": c.slug
-    } for c in categories]
-    return jsonify(categories_data)
+    return _list_response(CATEGORY.select(), (Category.id,), CATEGORY.serializer())
 
 # Obtener una categoría por ID con sus subcategorías
 @bp.route('/categories/<int:category_id>', methods=['GET'])
+@conditional_get(Category, Subcategory)
 def api_category_by_id(category_id):
-    # Usamos joinedload para prevenir el problema de N+1 consultas para las subcategorías
-    category = Category.query.options(joinedload(Category.subcategories)).get(category_id)
-    if category:
-        subcategories_data = [{
-            "id": sc.id,
-            "name": sc.name,
-            "slug": sc.slug,
-            "category_id": sc.category_id
-        } for sc in category.subcategories]
-        return jsonify({
-            "id": category.id,
-            "name": category.name,
-            "slug": category.slug,
-            "subcategories": subcategories_data
-        })
+    row = CATEGORY.select().filter(Category.id == category_id).first()
+    if row:
+        # Las subcategorías se leen con una sola consulta adicional
+        serialize_subcategory = SUBCATEGORY.serializer()
+        subcategories = SUBCATEGORY.select().filter(Subcategory.category_id == category_id).order_by(Subcategory.id)
+        data = CATEGORY.serialize(row)
+        data["subcategories"] = [serialize_subcategory(sc) for sc in subcategories]
+        return json_response(data)
     return jsonify({"mensaje": "Categoría no encontrada"}), 404
 
 # ----------- RUTAS DE SUBCATEGORÍAS -----------
 
-# Obtener todas las subcategorías
+# Obtener las subcategorías, paginadas por cursor
 @bp.route('/subcategories', methods=['GET'])
+@conditional_get(Subcategory, representation=_representation)
 def api_subcategories():
-    subcategories = Subcategory.query.all()
-    subcategories_data = [{
-        "id": sc.id,
-        "name": sc.name,
-        "slug": sc.slug,
-        "category_id": sc.category_id
-    } for sc in subcategories]
-    return jsonify(subcategories_data)
+    return _list_response(SUBCATEGORY.select(), (Subcategory.id,), SUBCATEGORY.serializer())
 
 # Obtener una subcategoría por ID con sus productos
 @bp.route('/subcategories/<int:subcategory_id>', methods=['GET'])
+@conditional_get(Subcategory, Product)
 def api_subcategory_by_id(subcategory_id):
-    subcategory = Subcategory.query.options(joinedload(Subcategory.products)).get(subcategory_id)
-    if subcategory:
-        products_data = [{
-            "id": p.id,
-            "name": p.name,
-            "slug": p.slug,
-            "price": p.price,
-            "image": p.image,
-            "link": p.link
-        } for p in subcategory.products]
-        return jsonify({
-            "id": subcategory.id,
-            "name": subcategory.name,
-            "slug": subcategory.slug,
-            "category_id": subcategory.category_id,
-            "products": products_data
-        })
+    row = SUBCATEGORY.select().filter(Subcategory.id == subcategory_id).first()
+    if row:
+        serialize_product = PRODUCT.serializer(SUBCATEGORY_PRODUCT_FIELDS)
+        products = PRODUCT.select(SUBCATEGORY_PRODUCT_FIELDS) \
+            .filter(Product.subcategory_id == subcategory_id).order_by(Product.id)
+        data = SUBCATEGORY.serialize(row)
+        data["products"] = [serialize_product(p) for p in products]
+        return json_response(data)
     return jsonify({"mensaje": "Subcategoría no encontrada"}), 404
 
 # ----------- RUTAS DE ARTÍCULOS -----------
 
-# Obtener todos los artículos
+# Obtener los artículos, paginados por cursor (o en streaming NDJSON), o un lote por ids
 @bp.route('/articles', methods=['GET'])
+@conditional_get(Article, representation=_representation)
 def api_articles():
-    articles = Article.query.all()
-    articles_data = [{
-        "id": a.id,
-        "title": a.title,
-        "slug": a.slug,
-        "content": a.content,
-        "author": a.author,
-        "date_posted": a.date_posted.isoformat() if a.date_posted else None,
-        "image": a.image
-    } for a in articles]
-    return jsonify(articles_data)
+    # ?ids=1,2,3 devuelve esos artículos en una sola consulta
+    query, serialize = _article_projection()
+    if request.args.get('ids') is not None:
+        return _batch_response(query, Article.id, request.args['ids'], serialize, parse=int)
+    return _list_response(query, (Article.id,), serialize)
+
+# Obtener varios artículos por slug (?slugs=a,b,c) en una sola consulta
+@bp.route('/articles/by-slug', methods=['GET'])
+@conditional_get(Article)
+def api_articles_by_slug():
+    query, serialize = _article_projection(Article.slug)
+    return _batch_response(query, Article.slug, request.args.get('slugs', ''), serialize)
 
 # Obtener un artículo por ID
 @bp.route('/articles/<int:article_id>', methods=['GET'])
+@conditional_get(Article)
 def api_article_by_id(article_id):
-    article = Article.query.get(article_id)
-    if article:
-        return jsonify({
-            "id": article.id,
-            "title": article.title,
-            "slug": article.slug,
-            "content": article.content,
-            "author": article.author,
-            "date_posted": article.date_posted.isoformat() if article.date_posted else None,
-            "image": article.image
-        })
+    query, serialize = _article_projection()
+    row = query.filter(Article.id == article_id).first()
+    if row:
+        return json_response(serialize(row))
     return jsonify({"mensaje": "Artículo no encontrado"}), 404
     
 # Nuevo: Obtener un artículo por su slug
 @bp.route('/articles/slug/<string:article_slug>', methods=['GET'])
+@conditional_get(Article)
 def api_article_by_slug(article_slug):
-    article = Article.query.filter_by(slug=article_slug).first()
-    if article:
-        return jsonify({
-            "id": article.id,
-            "title": article.title,
-            "slug": article.slug,
-            "content": article.content,
-            "author": article.author,
-            "date_posted": article.date_posted.isoformat() if article.date_posted else None,
-            "image": article.image
-        })
+    query, serialize = _article_projection()
+    row = query.filter(Article.slug == article_slug).first()
+    if row:
+        return json_response(serialize(row))
     return jsonify({"mensaje": "Artículo no encontrado"}), 404
 
 # ----------- RUTAS DE TESTIMONIOS -----------
 
-# Nuevo: Obtener todos los testimonios
+# Nuevo: Obtener los testimonios visibles, del más reciente al más antiguo, paginados por cursor
 @bp.route('/testimonials', methods=['GET'])
+@conditional_get(Testimonial, representation=_representation)
 def api_testimonials():
-    # Obtener solo los testimonios visibles, ordenados por fecha
-    testimonials = Testimonial.query.filter_by(is_visible=True).order_by(Testimonial.date_posted.desc()).all()
-    testimonials_data = [{
-        "id": t.id,
-        "author": t.author,
-        "content": t.content,
-        "date_posted": t.date_posted.isoformat() if t.date_posted else None,
-        "likes": t.likes,
-        "dislikes": t.dislikes
-    } for t in testimonials]
-    return jsonify(testimonials_data)
+    return _list_response(TESTIMONIAL.select().filter(Testimonial.is_visible.is_(True)),
+                          (Testimonial.date_posted, Testimonial.id), TESTIMONIAL.serializer(), descending=True)
 
 # Nuevo: Obtener un testimonio por ID
 @bp.route('/testimonials/<int:testimonial_id>', methods=['GET'])
+@conditional_get(Testimonial)
 def api_testimonial_by_id(testimonial_id):
-    testimonial = Testimonial.query.get(testimonial_id)
-    # Corrección: Uso de 'if' y 'and' en lugar de 'si' y 'y'
-    if testimonial and testimonial.is_visible:
-        # Corrección: Nombres de variables del modelo en inglés
-        return jsonify({
-            "id": testimonial.id,
-            "author": testimonial.author,
-            "content": testimonial.content,
-            "date_posted": testimonial.date_posted.isoformat() if testimonial.date_posted else None,
-            "likes": testimonial.likes,
-            "dislikes": testimonial.dislikes
-        })
-    return jsonify({"mensaje": "Testimonio no encontrado o no visible"}), 404
\ No newline at end of file
+    row = TESTIMONIAL.select().filter(Testimonial.id == testimonial_id, Testimonial.is_visible.is_(True)).first()
+    if row:
+        return json_response(TESTIMONIAL.serialize(row))
+    return jsonify({"mensaje": "Testimonio no encontrado o no visible"}), 404
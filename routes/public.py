@@ -5,17 +5,26 @@ from datetime import datetime, date, timezone
 # Importaciones de terceros
 from openai import OpenAI
 from dotenv import load_dotenv
-from flask import Blueprint, render_template, flash, redirect, url_for, request
+from flask import Blueprint, render_template, flash, redirect, url_for, request, abort
 from sqlalchemy import func
-from sqlalchemy.orm import joinedload
 
 # Importaciones de aplicaciones locales
 from models import (
     Product, Category, Subcategory, Article, ContactMessage,
-    Testimonial, Advertisement, Affiliate, AffiliateStatistic, AdsenseConfig
+    Testimonial
 )
 from forms import PublicTestimonialForm
 from extensions import db
+from services.click_counter import click_counter
+from services.affiliate_redirects import affiliate_redirects
+from services.click_log import click_log
+from services.click_filter import click_filter, visitor_fingerprint
+from services.site_context import site_context
+from services.search_index import search
+from services.pagination import keyset_paginate
+from services.sitemap import sitemaps
+from services.serializers import PRODUCT
+from services.page_cache import page_cache
 
 # Cargar variables de entorno lo antes posible
 load_dotenv()
@@ -45,6 +54,9 @@ except Exception as e:
 
 # --- Funciones auxiliares para herramientas del chatbot ---
 # Estas funciones interactúan con la base de datos y preparan los datos para el chatbot.
+# Usan el mismo serializador compilado que la API, leyendo solo estas columnas.
+
+CHATBOT_PRODUCT_FIELDS = ('id', 'name', 'price', 'description', 'link')
 
 def get_all_products_for_chatbot():
     """
@@ -53,17 +65,8 @@ def get_all_products_for_chatbot():
     el precio, la descripción y el enlace. Maneja posibles errores de base de datos.
     """
     try:
-        products = Product.query.all()
-        products_data = []
-        for p in products:
-            products_data.append({
-                "id": p.id,
-                "name": p.name,
-                "price": p.price,
-                "description": p.description,
-                "link": p.link
-            })
-        return products_data
+        serialize = PRODUCT.serializer(CHATBOT_PRODUCT_FIELDS)
+        return [serialize(row) for row in PRODUCT.select(CHATBOT_PRODUCT_FIELDS)]
     except Exception as e:
         print(f"Error al obtener productos para chatbot: {e}")
         return []
@@ -76,15 +79,10 @@ def get_product_by_name_for_chatbot(product_name):
     o si ocurre un error.
     """
     try:
-        product = Product.query.filter(func.lower(Product.name) == func.lower(product_name)).first()
-        if product:
-            return {
-                "id": product.id,
-                "name": product.name,
-                "price": product.price,
-                "description": product.description,
-                "link": product.link
-            }
+        row = PRODUCT.select(CHATBOT_PRODUCT_FIELDS) \
+            .filter(func.lower(Product.name) == func.lower(product_name)).first()
+        if row:
+            return PRODUCT.serialize(row, CHATBOT_PRODUCT_FIELDS)
         return {"message": f"Producto '{product_name}' no encontrado."}
     except Exception as e:
         print(f"Error al obtener producto por nombre para chatbot: {e}")
@@ -131,55 +129,25 @@ def get_general_help_info():
 def inject_active_advertisements():
     """
     Inyecta una lista de anuncios activos en el contexto de la plantilla.
-    Los anuncios se filtran por is_active=True y por fechas de inicio/fin si están definidas.
+    Los anuncios se filtran por is_active=True y por fechas de inicio/fin si están definidas,
+    y se sirven desde la caché compartida del contexto del sitio.
+    La configuración de AdSense la inyecta la aplicación (app.py) desde la misma caché.
     """
-    now_utc = datetime.now(timezone.utc)
-    active_ads = Advertisement.query.options(joinedload(Advertisement.product)).filter(
-        Advertisement.is_active,
-        (Advertisement.start_date.is_(None)) | (Advertisement.start_date <= now_utc),
-        (Advertisement.end_date.is_(None)) | (Advertisement.end_date >= now_utc)
-    ).all()
-    return dict(active_advertisements=active_ads)
-
-@bp.context_processor
-def inject_adsense_config():
-    """
-    Inyecta la configuración global de AdSense en el contexto de la plantilla,
-    obteniendo los datos de la base de datos.
-    """
-    adsense_config_db = AdsenseConfig.query.first()
-    if adsense_config_db:
-        return dict(
-            adsense_client_id=adsense_config_db.adsense_client_id,
-            adsense_slot_header=adsense_config_db.adsense_slot_header,
-            adsense_slot_sidebar=adsense_config_db.adsense_slot_sidebar,
-            adsense_slot_article_top=adsense_config_db.adsense_slot_article_top,
-            adsense_slot_article_bottom=adsense_config_db.adsense_slot_article_bottom
-        )
-    else:
-        # Se devuelven diccionarios vacíos si no hay configuración para evitar errores
-        # en las plantillas.
-        return dict(
-            adsense_client_id='',
-            adsense_slot_header='',
-            adsense_slot_sidebar='',
-            adsense_slot_article_top='',
-            adsense_slot_article_bottom=''
-        )
+    return dict(active_advertisements=site_context.get()['active_advertisements'])
 
 # --- Rutas Públicas ---
 
 @bp.route('/')
+@page_cache.cached('product')
 def index():
-    """Renderiza la página de inicio principal con productos paginados."""
-    page = request.args.get('page', 1, type=int)
+    """Renderiza la página de inicio principal con productos paginados por cursor."""
+    cursor = request.args.get('cursor')
     per_page = 9
-    products_pagination = Product.query.order_by(Product.created_at.desc()).paginate(page=page, per_page=per_page, error_out=False)
-    products = products_pagination.items
-    total_pages = products_pagination.pages
-    return render_template('index.html', products=products, page=page, total_pages=total_pages)
+    pagination = keyset_paginate(Product.query, (Product.created_at, Product.id), cursor, per_page)
+    return render_template('index.html', products=pagination.items, pagination=pagination)
 
 @bp.route('/product/<slug>')
+@page_cache.cached('product', 'category')
 def product_detail(slug):
     """Renderiza la página de detalles de un producto específico basado en su slug."""
     product = Product.query.filter_by(slug=slug).first()
@@ -189,6 +157,7 @@ def product_detail(slug):
     return redirect(url_for('public.index'))
 
 @bp.route('/categories')
+@page_cache.cached('category', 'product')
 def show_categories():
     """Renderiza la página de categorías, mostrando todas las categorías y el recuento
     de productos por subcategoría.
@@ -214,29 +183,27 @@ def products_by_slug(slug):
     """
     subcat = Subcategory.query.filter_by(slug=slug).first()
     if subcat:
-        page = request.args.get('page', 1, type=int)
+        cursor = request.args.get('cursor')
         per_page = 9
-        products_pagination = Product.query.filter_by(subcategory_id=subcat.id).paginate(page=page, per_page=per_page, error_out=False)
-        products_in_subcat = products_pagination.items
-        total_pages = products_pagination.pages
+        pagination = keyset_paginate(Product.query.filter_by(subcategory_id=subcat.id),
+                                     (Product.created_at, Product.id), cursor, per_page)
         return render_template('productos_por_subcategoria.html',
                                subcat_name=subcat.name,
-                               products=products_in_subcat,
-                               page=page,
-                               total_pages=total_pages)
+                               subcat_slug=subcat.slug,
+                               products=pagination.items,
+                               pagination=pagination)
     flash('Subcategoría no encontrada.', 'danger')
     return redirect(url_for('public.show_categories'))
 
 @bp.route('/guides')
+@page_cache.cached('article')
 def guides():
-    """Renderiza la página de guías con artículos paginados."""
-    page = request.args.get('page', 1, type=int)
+    """Renderiza la página de guías con artículos paginados por cursor."""
+    cursor = request.args.get('cursor')
     per_page = 6
-    articles_pagination = Article.query.order_by(Article.date_posted.desc()).paginate(page=page, per_page=per_page, error_out=False)
-    articles_db = articles_pagination.items
-    total_pages = articles_pagination.pages
+    pagination = keyset_paginate(Article.query, (Article.date_posted, Article.id), cursor, per_page)
     articles = []
-    for art in articles_db:
+    for art in pagination.items:
         # Normalizar la fecha a datetime con timezone
         date_dt = art.date_posted
         if isinstance(art.date_posted, date) and not isinstance(art.date_posted, datetime):
@@ -251,9 +218,10 @@ def guides():
             "date_iso": date_dt.strftime("%Y-%m-%d") if date_dt else "",
             "formatted_date": date_dt.strftime("%d %b %Y") if date_dt else "",
         })
-    return render_template('guias.html', articles=articles, page=page, total_pages=total_pages)
+    return render_template('guias.html', articles=articles, pagination=pagination)
 
 @bp.route('/guide/<slug>')
+@page_cache.cached('article')
 def guide_detail(slug):
     """Renderiza la página de detalles de un artículo específico basado en su slug."""
     article = Article.query.filter_by(slug=slug).first()
@@ -343,47 +311,32 @@ def contact():
     return render_template('contact.html', success=success, errors=errors)
 
 @bp.route('/privacy-policy')
+@page_cache.cached()
 def privacy_policy():
     """Renderiza la página de la política de privacidad."""
     return render_template('privacy_policy.html')
 
 @bp.route('/terms-conditions')
+@page_cache.cached()
 def terms_conditions():
     """Renderiza la página de términos y condiciones."""
     return render_template('terms_conditions.html')
 
 @bp.route('/cookie-policy')
+@page_cache.cached()
 def cookie_policy():
     """Renderiza la página de la política de cookies."""
     return render_template('cookie_policy.html')
 
 @bp.route('/sitemap.xml')
 def sitemap():
-    """Genera y sirve el archivo sitemap.xml para SEO."""
-    base_url = request.url_root.rstrip('/')
-    urls = [
-        {"loc": base_url + url_for('public.index'), "changefreq": "daily", "priority": "1.0"},
-        {"loc": base_url + url_for('public.show_categories'), "changefreq": "weekly", "priority": "0.8"},
-        {"loc": base_url + url_for('public.about'), "changefreq": "monthly", "priority": "0.7"},
-        {"loc": base_url + url_for('public.contact'), "changefreq": "monthly", "priority": "0.6"},
-        {"loc": base_url + url_for('public.guides'), "changefreq": "weekly", "priority": "0.9"},
-        {"loc": base_url + url_for('public.privacy_policy'), "changefreq": "monthly", "priority": "0.5"},
-        {"loc": base_url + url_for('public.terms_conditions'), "changefreq": "monthly", "priority": "0.5"},
-        {"loc": base_url + url_for('public.cookie_policy'), "changefreq": "monthly", "priority": "0.5"},
-    ]
-    for product in Product.query.all():
-        urls.append({
-            "loc": f"{base_url}{url_for('public.product_detail', slug=product.slug)}",
-            "changefreq": "weekly",
-            "priority": "0.8"
-        })
-    for article in Article.query.all():
-        urls.append({
-            "loc": f"{base_url}{url_for('public.guide_detail', slug=article.slug)}",
-            "changefreq": "weekly",
-            "priority": "0.8"
-        })
-    return render_template('sitemap.xml', urls=urls, today=datetime.now().strftime("%Y-%m-%d"))
+    """Sirve el sitemap para SEO: un único urlset o, en catálogos grandes, un índice de sitemaps."""
+    return sitemaps.response()
+
+@bp.route('/sitemap-<name>.xml')
+def sitemap_part(name):
+    """Sirve una de las partes del índice de sitemaps (páginas, productos-N o guías-N)."""
+    return sitemaps.response(name)
 
 @bp.route('/robots.txt')
 def robots_txt():
@@ -397,45 +350,19 @@ def robots_txt():
 @bp.route('/search')
 def search_results():
     """
-    Renderiza la página de resultados de búsqueda, buscando tanto productos como artículos.
+    Renderiza la página de resultados de búsqueda: productos y artículos en una
+    sola lista ordenada por relevancia, usando el índice de texto completo.
     """
     query = request.args.get('q', '').strip()
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     per_page = 9
 
-    products_found = []
-    articles_found = []
-    
-    total_products_pages = 0
-    total_articles_pages = 0
-    total_pages = 1
-
-    if query:
-        products_query = Product.query.filter(
-            (Product.name.ilike(f'%{query}%')) |
-            (Product.description.ilike(f'%{query}%'))
-        )
-        articles_query = Article.query.filter(
-            (Article.title.ilike(f'%{query}%')) |
-            (Article.content.ilike(f'%{query}%'))
-        )
-
-        products_pagination = products_query.paginate(page=page, per_page=per_page, error_out=False)
-        products_found = products_pagination.items
-        total_products_pages = products_pagination.pages
-
-        articles_pagination = articles_query.paginate(page=page, per_page=per_page, error_out=False)
-        articles_found = articles_pagination.items
-        total_articles_pages = articles_pagination.pages
-
-        total_pages = max(total_products_pages, total_articles_pages) if products_found or articles_found else 1
+    pagination = search(query, cursor=cursor, per_page=per_page)
 
     return render_template('search_results.html',
                            query=query,
-                           products=products_found,
-                           articles=articles_found,
-                           page=page,
-                           total_pages=total_pages)
+                           results=pagination.items,
+                           pagination=pagination)
 
 # --- Interfaz de usuario de afiliados y rutas API ---
 
@@ -444,28 +371,36 @@ def register_click(affiliate_id):
     """
     Registra un clic para un afiliado y lo redirige a su enlace.
     """
-    affiliate = Affiliate.query.get_or_404(affiliate_id)
-
-    # Busca si ya existe una estadística para este afiliado en el día de hoy
-    statistic = AffiliateStatistic.query.filter_by(
-        affiliate_id=affiliate.id,
-        date=date.today()
-    ).first()
-
-    if statistic:
-        # Si existe, incrementa el contador de clics
-        statistic.clicks += 1
-    else:
-        # Si no existe, crea una nueva entrada
-        statistic = AffiliateStatistic(
-            affiliate_id=affiliate.id,
-            clicks=1,
-            date=date.today()
+    # El enlace se obtiene de la tabla en memoria, sin consultar la base de datos
+    affiliate_redirect = affiliate_redirects.get(affiliate_id)
+    if affiliate_redirect is None:
+        abort(404)
+    if not affiliate_redirect.is_active:
+        # El afiliado existió pero ya no está activo
+        abort(410)
+
+    # Los bots y los clics repetidos se redirigen igualmente, pero no se cuentan
+    # remote_addr ya viene resuelta por ProxyFix con los proxies de confianza: una cabecera
+    # X-Forwarded-For inventada por el cliente no cambia el visitante
+    user_agent = request.user_agent.string
+    visitor = visitor_fingerprint(request.remote_addr, user_agent)
+    if not click_filter.accept(affiliate_id, user_agent, visitor):
+        return redirect(affiliate_redirect.referral_link)
+
+    if click_log.enabled:
+        # El clic completo se añade al registro de eventos; un proceso de consolidación
+        # lo suma después a las estadísticas diarias
+        click_log.append(
+            affiliate_id,
+            product_id=request.args.get('product', type=int),
+            referrer=request.referrer,
+            user_agent=user_agent,
+            visitor=visitor
         )
-        db.session.add(statistic)
-
-    # Guarda los cambios en la base de datos
-    db.session.commit()
+    else:
+        # El clic se acumula en memoria y se escribe en lote en segundo plano,
+        # así la redirección no espera a la base de datos
+        click_counter.record(affiliate_id, visitor=visitor)
 
     # Redirige al usuario al enlace del afiliado
-    return redirect(affiliate.referral_link)
\ No newline at end of file
+    return redirect(affiliate_redirect.referral_link)
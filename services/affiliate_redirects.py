@@ -0,0 +1,90 @@
+import threading
+import time
+from collections import namedtuple
+
+from sqlalchemy import select
+
+from extensions import db
+from models import Affiliate
+from services.change_tracking import on_commit
+from services.shared_cache import shared_cache
+
+AffiliateRedirect = namedtuple('AffiliateRedirect', ['referral_link', 'is_active'])
+_CACHE_TAG = 'affiliate-redirects'
+
+
+class AffiliateRedirectTable:
+    """
+    Process-local map of affiliate id -> (referral_link, is_active).
+
+    The table is loaded when the application starts and reloaded right after
+    any commit that touches the affiliates table, so /ref/<id> can redirect
+    without reading the database. The other gunicorn workers are told through
+    the shared cache's invalidation channel and refresh their copy in a
+    background thread; entries older than AFFILIATE_TABLE_TTL seconds are
+    refreshed the same way, in case a notification was missed.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._redirects = {}
+        self._loaded_at = 0.0
+        self._refresh_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('AFFILIATE_TABLE_TTL', 60)
+        self.app = app
+        app.extensions['affiliate_redirects'] = self
+        on_commit(Affiliate)(self._on_affiliates_committed)
+        shared_cache.subscribe(_CACHE_TAG, self._refresh_in_background)
+        with app.app_context():
+            try:
+                self.reload()
+            except Exception as e:
+                # The table may not exist yet (before migrations); it is loaded on the next refresh
+                print(f"Could not load the affiliate redirect table: {e}")
+
+    def get(self, affiliate_id):
+        """Returns the AffiliateRedirect for an affiliate, or None if it doesn't exist."""
+        if time.monotonic() - self._loaded_at > self.app.config['AFFILIATE_TABLE_TTL']:
+            self._refresh_in_background()
+        return self._redirects.get(affiliate_id)
+
+    def reload(self):
+        """Reloads every affiliate using a dedicated connection, outside the ORM session."""
+        with db.engine.connect() as connection:
+            rows = connection.execute(
+                select(Affiliate.id, Affiliate.referral_link, Affiliate.is_active)
+            ).all()
+        # Affiliates created before the is_active column existed have NULL and are treated as active
+        self._redirects = {
+            row.id: AffiliateRedirect(row.referral_link, row.is_active is not False)
+            for row in rows
+        }
+        self._loaded_at = time.monotonic()
+
+    def _on_affiliates_committed(self, changed_tables):
+        self.reload()
+        shared_cache.invalidate(_CACHE_TAG)
+
+    def _refresh_in_background(self):
+        if not self._refresh_lock.acquire(blocking=False):
+            return  # A refresh is already running
+
+        def refresh():
+            try:
+                with self.app.app_context():
+                    self.reload()
+            except Exception as e:
+                print(f"Error refreshing the affiliate redirect table: {e}")
+                # Avoid retrying on every request while the database is unavailable
+                self._loaded_at = time.monotonic()
+            finally:
+                self._refresh_lock.release()
+
+        threading.Thread(target=refresh, name='affiliate-table-refresh', daemon=True).start()
+
+
+affiliate_redirects = AffiliateRedirectTable()
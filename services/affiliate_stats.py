@@ -0,0 +1,112 @@
+from sqlalchemy import bindparam, func, select, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from extensions import db
+from models import AffiliateStatistic
+from services.hyperloglog import HyperLogLog
+
+_UPSERT_DIALECTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+
+def increment_clicks(counts):
+    """
+    Adds clicks to the daily AffiliateStatistic rows.
+
+    `counts` maps (affiliate_id, day) to the number of clicks to add. On
+    PostgreSQL and SQLite every row is written with a single
+    INSERT ... ON CONFLICT (affiliate_id, date) DO UPDATE SET clicks = clicks + n
+    statement, so no row is read first and concurrent writers can neither
+    create duplicates nor lose increments. The caller is responsible for committing.
+    """
+    if not counts:
+        return
+    rows = [
+        {'affiliate_id': affiliate_id, 'date': day, 'clicks': clicks}
+        for (affiliate_id, day), clicks in counts.items()
+    ]
+    table = AffiliateStatistic.__table__
+    insert = _UPSERT_DIALECTS.get(db.session.get_bind().dialect.name)
+
+    if insert is not None:
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.affiliate_id, table.c.date],
+            set_={'clicks': func.coalesce(table.c.clicks, 0) + stmt.excluded.clicks}
+        )
+        db.session.execute(stmt, rows)
+        return
+
+    # Other databases: increment in SQL and insert only the rows that didn't exist yet
+    for row in rows:
+        result = db.session.execute(
+            update(table)
+            .where(table.c.affiliate_id == row['affiliate_id'], table.c.date == row['date'])
+            .values(clicks=func.coalesce(table.c.clicks, 0) + row['clicks'])
+        )
+        if result.rowcount == 0:
+            db.session.execute(table.insert(), row)
+
+
+def merge_visitor_sketches(sketches):
+    """
+    Merges HyperLogLog sketches of visitors into the daily AffiliateStatistic rows.
+
+    `sketches` maps (affiliate_id, day) to a HyperLogLog. The rows must already
+    exist, so this is called after increment_clicks() in the same transaction.
+    Existing sketches are read with a single query (locked on PostgreSQL) and
+    written back with one executemany UPDATE.
+    """
+    if not sketches:
+        return
+    table = AffiliateStatistic.__table__
+    rows = db.session.execute(
+        select(table.c.id, table.c.affiliate_id, table.c.date, table.c.unique_visitors_sketch)
+        .where(tuple_(table.c.affiliate_id, table.c.date).in_(list(sketches)))
+        .with_for_update()
+    ).all()
+
+    updates = []
+    for row in rows:
+        merged = HyperLogLog.from_bytes(row.unique_visitors_sketch) if row.unique_visitors_sketch else HyperLogLog()
+        merged.merge(sketches[(row.affiliate_id, row.date)])
+        updates.append({'row_id': row.id, 'sketch': merged.to_bytes()})
+    if updates:
+        db.session.execute(
+            update(table)
+            .where(table.c.id == bindparam('row_id'))
+            .values(unique_visitors_sketch=bindparam('sketch')),
+            updates
+        )
+
+
+def summarize_by_period(statistics, period):
+    """
+    Groups daily AffiliateStatistic rows by 'week' (ISO week) or 'month'.
+
+    Clicks are added up and the daily visitor sketches are merged, so unique
+    visitors are counted over the whole period (a visitor seen on several days
+    counts once) without rescanning raw events. Returns a list of dicts with
+    'period', 'clicks' and 'unique_visitors', newest period first.
+    """
+    groups = {}
+    for statistic in statistics:
+        if period == 'week':
+            year, week, _ = statistic.date.isocalendar()
+            key = f'{year}-W{week:02d}'
+        else:
+            key = statistic.date.strftime('%Y-%m')
+        group = groups.setdefault(key, {'clicks': 0, 'sketches': []})
+        group['clicks'] += statistic.clicks or 0
+        if statistic.unique_visitors_sketch:
+            group['sketches'].append(HyperLogLog.from_bytes(statistic.unique_visitors_sketch))
+    return [
+        {
+            'period': key,
+            'clicks': group['clicks'],
+            'unique_visitors': HyperLogLog.union(group['sketches']).count(),
+        }
+        for key, group in sorted(groups.items(), reverse=True)
+    ]
@@ -1,32 +1,126 @@
+import hashlib
+import json
+import re
+import threading
+from collections import Counter, namedtuple
+from datetime import datetime, timezone
+
 import requests
-from app import db
-from models import Product, Subcategory
+from flask import current_app
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from sqlalchemy import delete, event, insert, select, update
+from sqlalchemy.orm import Session
+
+from extensions import db
+from models import Product, Subcategory, Advertisement, FeedFetchState
+from services.change_tracking import mark_changed
+from services.feed_parser import FeedFormatError, decompressed, iter_json_array
+from services.product_changes import record_deleted
 from utils import slugify
 
-def fetch_and_update_products_from_external_api(api_url):
+# Bytes read from the feed at a time while it is parsed
+FEED_READ_SIZE = 64 * 1024
+# Product columns written from a feed item; a change in any of them changes its fingerprint
+_FINGERPRINT_FIELDS = ('name', 'slug', 'price', 'description', 'image', 'link')
+
+# One pooled HTTP session per process, so repeated syncs reuse connections
+_http_session = None
+_http_session_lock = threading.Lock()
+
+
+def fetch_and_update_products_from_external_api(api_url, progress=None):
     """
     Fetches and updates products from an external API.
-    Handles both existing product updates and new product additions.
+    Handles both existing product updates and new product additions
+    (see sync_products). Returns a SyncResult with the number of products
+    inserted, updated, unchanged and removed.
+
+    The feed (a JSON array, optionally gzipped) is parsed as it downloads and
+    its items flow straight into the chunked writer, so memory use doesn't
+    depend on the size of the feed.
+
+    The ETag and Last-Modified of the last complete sync of each feed URL are
+    sent back as If-None-Match and If-Modified-Since; if the merchant answers
+    304 Not Modified, nothing is read or written and the result has
+    not_modified set.
+
+    `progress` is passed on to sync_products.
     """
+    simulated_products = _simulated_products(api_url)
+    if simulated_products is not None:
+        return sync_products(simulated_products, source_feed=api_url, progress=progress)
+
+    state = FeedFetchState.query.filter_by(url=api_url).first()
+    headers = {}
+    if state is not None and state.etag:
+        headers['If-None-Match'] = state.etag
+    if state is not None and state.last_modified:
+        headers['If-Modified-Since'] = state.last_modified
+
     try:
-        # --- REAL WORLD SCENARIO (uncomment and modify for actual API integration) ---
-        response = requests.get(api_url, timeout=10)  # Add a timeout
+        # The timeout applies to every read; connection errors and 429/5xx answers are retried with backoff
+        response = _session().get(api_url, headers=headers, timeout=10, stream=True)
         response.raise_for_status()  # Raise an exception for HTTP errors (4xx or 5xx)
-        external_data = response.json()  # Assuming the API returns JSON
-        simulated_external_products = external_data  # Use the actual data from the API
-
-    except requests.exceptions.Timeout:
-        raise ConnectionError("Request to the external API has timed out (10 seconds).")
-    except requests.exceptions.ConnectionError:
-        raise ConnectionError(f"Could not connect to the API URL: {api_url}. Check the address or your connection.")
     except requests.exceptions.RequestException as e:
-        raise RuntimeError(f"Error fetching data from API: {e}")
-    except ValueError as e:
-        raise ValueError(f"Error parsing API response as JSON: {e}")
+        raise _request_error(api_url, e) from e
+
+    with response:
+        if response.status_code == 304:
+            return SyncResult(0, 0, 0, 0, not_modified=True)
+        items = iter_json_array(decompressed(response.iter_content(FEED_READ_SIZE)))
+        try:
+            result = sync_products(items, source_feed=api_url, progress=progress)
+        except requests.exceptions.RequestException as e:
+            raise _request_error(api_url, e) from e
+        except (FeedFormatError, json.JSONDecodeError) as e:
+            raise ValueError(f"Error parsing API response as JSON: {e}") from e
+
+    # Only remembered once the whole feed was synced, so a failed run is retried in full
+    if state is None:
+        state = FeedFetchState(url=api_url)
+        db.session.add(state)
+    state.etag = response.headers.get('ETag')
+    state.last_modified = response.headers.get('Last-Modified')
+    state.last_fetched_at = datetime.now(timezone.utc).replace(tzinfo=None)
+    db.session.commit()
+    return result
+
+
+def _session():
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            config = current_app.config
+            retry = Retry(
+                total=config['PRODUCT_SYNC_RETRIES'],
+                backoff_factor=config['PRODUCT_SYNC_BACKOFF'],
+                status_forcelist=(429, 500, 502, 503, 504),
+                allowed_methods=frozenset(['GET']),
+                respect_retry_after_header=True
+            )
+            session = requests.Session()
+            session.mount('https://', HTTPAdapter(max_retries=retry, pool_maxsize=4))
+            session.mount('http://', HTTPAdapter(max_retries=retry, pool_maxsize=4))
+            _http_session = session
+        return _http_session
 
-    # --- SIMULATED EXTERNAL API RESPONSE (for demonstration - REMOVE IN PRODUCTION) ---
+
+def _request_error(api_url, e):
+    if isinstance(e, requests.exceptions.Timeout):
+        return ConnectionError("Request to the external API has timed out (10 seconds).")
+    if isinstance(e, requests.exceptions.ConnectionError):
+        return ConnectionError(f"Could not connect to the API URL: {api_url}. Check the address or your connection.")
+    return RuntimeError(f"Error fetching data from API: {e}")
+
+
+def _simulated_products(api_url):
+    """
+    Sample feeds for the demonstration URLs (containing platformA or
+    platformB), which are not fetched. Returns None for any other URL.
+    """
     if "platformA" in api_url:
-        simulated_external_products = [
+        return [
             {
                 "external_id": "EXT001",
                 "name": "Ultrabook Laptop X1 (Updated from A)",
@@ -45,7 +139,7 @@ def fetch_and_update_products_from_external_api(api_url):
             }
         ]
     elif "platformB" in api_url:
-        simulated_external_products = [
+        return [
             {
                 "external_id": "EXT002",
                 "name": "Bluetooth Headphones Z2 (Updated from B)",
@@ -63,69 +157,225 @@ def fetch_and_update_products_from_external_api(api_url):
                 "external_link": "https://example.com/platformB/teclado-rgb"
             }
         ]
-    else:
-        simulated_external_products = [
-            {
-                "external_id": "EXT001",
-                "name": "Ultrabook Laptop X1 (Default Sim.)",
-                "external_price": "$1150",
-                "external_description": "Powerful professional laptop, now with 1TB SSD.",
-                "external_image": "/static/img/laptop_new.jpg",
-                "external_link": "https://example.com/laptop-x1-updated"
-            },
-            {
-                "external_id": "EXT004",
-                "name": "Smartwatch Pro S",
-                "external_price": "$250",
-                "external_description": "Advanced smartwatch with health monitoring.",
-                "external_image": "/static/img/smartwatch.jpg",
-                "external_link": "https://example.com/smartwatch-pro-s"
-            },
-            {
-                "external_id": "EXT002",
-                "name": "Bluetooth Headphones Z2",
-                "external_price": "$79",
-                "external_description": "Noise-cancelling headphones with 20 hours of battery.",
-                "external_image": "/static/img/headphones.jpg",
-                "external_link": "https://example.com/auriculares-z2"
-            }
-        ]
+    return None
 
-    updated_count = 0
-    default_subcategory = Subcategory.query.first()
 
-    for external_p_data in simulated_external_products:
-        product = Product.query.filter_by(external_id=external_p_data["external_id"]).first()
-        try:
-            processed_price = float(external_p_data['external_price'].replace('$', '').replace('€', '').replace(',', ''))
-        except ValueError:
-            print(f"Warning: Could not convert price '{external_p_data['external_price']}' for product '{external_p_data['name']}'. Using 0.0.")
-            processed_price = 0.0
-
-        if product:
-            product.name = external_p_data['name']
-            product.slug = slugify(external_p_data['name'])
-            product.price = processed_price
-            product.description = external_p_data['external_description']
-            product.image = external_p_data['external_image']
-            product.link = external_p_data['external_link']
-            updated_count += 1
-        else:
-            if not default_subcategory:
-                print("Warning: No subcategories defined. Cannot add new products from the API.")
+class SyncResult(namedtuple('SyncResult', ['inserted', 'updated', 'unchanged', 'removed', 'not_modified'],
+                            defaults=(False,))):
+    @property
+    def written(self):
+        """Products inserted or updated."""
+        return self.inserted + self.updated
+
+
+def sync_products(items, source_feed=None, chunk_size=None, progress=None):
+    """
+    Inserts or updates products from feed items (dicts with external_id,
+    name, external_price, external_description, external_image and
+    external_link), matched by external_id. Returns a SyncResult.
+
+    Items are processed in chunks of PRODUCT_SYNC_CHUNK_SIZE: the existing
+    products of a chunk are found with one IN query, and the chunk is written
+    with one bulk INSERT and one bulk UPDATE and committed on its own, so the
+    cost grows with the number of chunks instead of one query per item.
+
+    Slugs are derived from the names; a product whose name's slug already
+    belongs to another product (or to an earlier item of the chunk) gets
+    its external_id appended, so a repeated name doesn't abort the sync.
+
+    Each row keeps a fingerprint of the item it was written from; items whose
+    fingerprint (and feed) didn't change are not written at all, so their
+    updated_at, change_seq and the caches built on them stay as they are.
+    With `source_feed`, once the whole feed was read, the products last
+    synced from that feed that it no longer lists are removed.
+
+    `progress`, if given, is called with the number of items processed after
+    every committed chunk. An exception raised from it (a cancelled job)
+    stops the sync there: the chunks already committed stay, and nothing is
+    removed, since the feed wasn't read in full.
+    """
+    chunk_size = chunk_size or current_app.config['PRODUCT_SYNC_CHUNK_SIZE']
+    default_subcategory_id = db.session.execute(
+        select(Subcategory.id).order_by(Subcategory.id).limit(1)
+    ).scalar()
+
+    counts = Counter()
+    seen = set()
+    for chunk in _chunks(items, chunk_size):
+        counts.update(_sync_chunk(chunk, default_subcategory_id, source_feed))
+        seen.update(item['external_id'] for item in chunk)
+        if progress is not None:
+            progress(sum(counts.values()))
+    # An empty feed is far more likely a broken export than an empty catalog: nothing is removed
+    removed = _remove_missing(source_feed, seen, chunk_size) if source_feed and seen else 0
+    return SyncResult(counts['inserted'], counts['updated'], counts['unchanged'], removed)
+
+
+def _sync_chunk(chunk, default_subcategory_id, source_feed):
+    # The last occurrence of a repeated external_id wins, as it did item by item
+    incoming = {item['external_id']: _product_values(item) for item in chunk}
+    existing = {
+        row.external_id: row for row in db.session.execute(
+            select(Product.external_id, Product.id, Product.slug, Product.content_hash, Product.source_feed)
+            .where(Product.external_id.in_(list(incoming)))
+        )
+    }
+
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    inserts, updates = [], []
+    unchanged = 0
+    slugs = _SlugAllocator(values['slug'] for values in incoming.values())
+    for external_id, values in incoming.items():
+        content_hash = _fingerprint(values)
+        row = existing.get(external_id)
+        if row is not None:
+            if row.content_hash == content_hash and row.source_feed == source_feed:
+                unchanged += 1
                 continue
+            values = dict(values, slug=slugs.allocate(values['slug'], external_id, row.id, row.slug))
+            # Bulk statements skip the ORM hooks: change_seq is cleared here so
+            # the delta sync sees the change, and updated_at is set explicitly
+            updates.append(dict(values, id=row.id, content_hash=content_hash, source_feed=source_feed,
+                                updated_at=now, change_seq=None))
+        elif default_subcategory_id is None:
+            print(f"Warning: No subcategories defined. Cannot add product '{values['name']}' from the API.")
+        else:
+            values = dict(values, slug=slugs.allocate(values['slug'], external_id))
+            inserts.append(dict(values, external_id=external_id, subcategory_id=default_subcategory_id,
+                                content_hash=content_hash, source_feed=source_feed,
+                                created_at=now, updated_at=now))
+
+    if updates or inserts:
+        try:
+            if updates:
+                db.session.execute(update(Product), updates)
+            if inserts:
+                db.session.execute(insert(Product), inserts)
+            mark_changed(db.session, Product)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+    return {'inserted': len(inserts), 'updated': len(updates), 'unchanged': unchanged}
+
 
-            new_product = Product(
-                name=external_p_data['name'],
-                slug=slugify(external_p_data['name']),
-                price=processed_price,
-                description=external_p_data['external_description'],
-                image=external_p_data['external_image'],
-                link=external_p_data['external_link'],
-                subcategory_id=default_subcategory.id,
-                external_id=external_p_data['external_id']
+def _remove_missing(source_feed, seen, chunk_size):
+    """Deletes the products of `source_feed` whose external_id the feed no longer lists, a chunk per commit."""
+    missing = [
+        row for row in db.session.execute(
+            select(Product.id, Product.slug, Product.external_id)
+            .where(Product.source_feed == source_feed)
+            .execution_options(yield_per=chunk_size)
+        )
+        if row.external_id not in seen
+    ]
+    for chunk in _chunks(missing, chunk_size):
+        ids = [row.id for row in chunk]
+        try:
+            # Ads pointing to a removed product are kept, without their product
+            detached = db.session.execute(
+                update(Advertisement).where(Advertisement.product_id.in_(ids)).values(product_id=None)
             )
-            db.session.add(new_product)
-            updated_count += 1
-    db.session.commit()
-    return updated_count
\ No newline at end of file
+            if detached.rowcount:
+                mark_changed(db.session, Advertisement)
+            db.session.execute(delete(Product).where(Product.id.in_(ids)))
+            record_deleted(db.session, chunk)
+            mark_changed(db.session, Product)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+    return len(missing)
+
+
+class _SlugAllocator:
+    """
+    Hands out the slugs of one chunk's writes, unique against the products
+    table and against each other. The fingerprint keeps the plain slug of
+    the name, so a suffixed slug doesn't make the item look changed.
+    """
+
+    _MAX_LENGTH = Product.__table__.c.slug.type.length
+
+    def __init__(self, slugs):
+        self._claimed = set()
+        # Owners of the plain slugs, read with one IN query; suffixed candidates are looked up one by one
+        wanted = set(slugs)
+        self._owners = dict(db.session.execute(
+            select(Product.slug, Product.id).where(Product.slug.in_(wanted))
+        ).all())
+        self._prefetched = wanted
+
+    def allocate(self, slug, external_id, product_id=None, current_slug=None):
+        suffix = slugify(str(external_id)) or 'item'
+        # A product keeps the slug it already has for this name: the plain slug or one this allocator
+        # suffixed. Any other slug (e.g. of the name before a rename) is replaced.
+        if current_slug and current_slug not in self._claimed \
+                and re.fullmatch(rf'{re.escape(slug)}(?:-(?:{re.escape(suffix)}(?:-\d+)?|\d+))?', current_slug):
+            self._claimed.add(current_slug)
+            return current_slug
+        candidates = [slug, f'{slug[:self._MAX_LENGTH - len(suffix) - 1]}-{suffix}']
+        for candidate in candidates:
+            if self._free(candidate, product_id):
+                return candidate
+        base, counter = candidates[-1], 2
+        while True:
+            candidate = f'{base[:self._MAX_LENGTH - len(str(counter)) - 1]}-{counter}'
+            if self._free(candidate, product_id):
+                return candidate
+            counter += 1
+
+    def _free(self, slug, product_id):
+        if not slug or slug in self._claimed:
+            return False
+        if slug in self._prefetched:
+            owner = self._owners.get(slug)
+        else:
+            owner = db.session.execute(select(Product.id).where(Product.slug == slug)).scalar()
+        if owner is not None and owner != product_id:
+            return False
+        self._claimed.add(slug)
+        return True
+
+
+def _fingerprint(values):
+    data = json.dumps([values[field] for field in _FINGERPRINT_FIELDS], ensure_ascii=False, separators=(',', ':'))
+    return hashlib.blake2b(data.encode('utf-8'), digest_size=16).hexdigest()
+
+
+@event.listens_for(Session, 'before_flush')
+def _forget_edited_fingerprints(session, flush_context, instances):
+    # A product edited by hand no longer matches its feed item: the next sync writes it again
+    for obj in session.dirty:
+        if isinstance(obj, Product) and session.is_modified(obj):
+            obj.content_hash = None
+
+
+def _product_values(item):
+    return {
+        'name': item['name'],
+        'slug': slugify(item['name']),
+        'price': _parse_price(item),
+        'description': item['external_description'],
+        'image': item['external_image'],
+        'link': item['external_link'],
+    }
+
+
+def _parse_price(item):
+    try:
+        return float(item['external_price'].replace('$', '').replace('€', '').replace(',', ''))
+    except ValueError:
+        print(f"Warning: Could not convert price '{item['external_price']}' for product '{item['name']}'. Using 0.0.")
+        return 0.0
+
+
+def _chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
@@ -0,0 +1,140 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import requests
+from flask import current_app
+from sqlalchemy import func, select
+
+from extensions import db
+from models import Product, SyncInfo
+from services.api_sync import fetch_and_update_products_from_external_api
+from services.click_log import click_log
+from services.jobs import jobs
+from services.serializers import PRODUCT, dumps
+
+# Links of a link check requested at the same time, and the timeout of each request
+LINK_CHECK_WORKERS = 8
+LINK_CHECK_TIMEOUT = 10
+# Broken links listed in a link check's result (the count covers all of them)
+LINK_CHECK_MAX_REPORTED = 500
+# Merchants that reject HEAD requests answer with one of these; the link is retried with GET
+_HEAD_REJECTED = (403, 405, 501)
+
+
+@jobs.task('product_sync')
+def sync_product_feed(job, api_url):
+    """Syncs the products of a feed (see fetch_and_update_products_from_external_api) and records it in SyncInfo."""
+    job.progress(0, message='Descargando el feed...')
+    result = fetch_and_update_products_from_external_api(
+        api_url, progress=lambda done: job.progress(done, message=f'{done} productos procesados')
+    )
+    if result.not_modified:
+        job.message = 'El feed no ha cambiado desde la última sincronización; no se modificó ningún producto.'
+        return result._asdict()
+
+    sync_info = SyncInfo.query.first()
+    if not sync_info:
+        sync_info = SyncInfo(last_sync_time="N/A", last_sync_count=0, last_synced_api_url="N/A")
+        db.session.add(sync_info)
+    sync_info.last_sync_time = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    sync_info.last_sync_count = result.written
+    sync_info.last_inserted_count = result.inserted
+    sync_info.last_updated_count = result.updated
+    sync_info.last_unchanged_count = result.unchanged
+    sync_info.last_removed_count = result.removed
+    sync_info.last_synced_api_url = api_url
+    db.session.commit()
+
+    processed = result.written + result.unchanged
+    job.done = job.total = processed
+    job.message = (f'Sincronización API completada. Añadidos: {result.inserted}, actualizados: {result.updated}, '
+                   f'sin cambios: {result.unchanged}, eliminados: {result.removed}.')
+    return result._asdict()
+
+
+@jobs.task('click_rollup')
+def rollup_clicks(job):
+    """Folds the closed click log segments into the affiliate statistics."""
+    click_log.sync()
+    folded = click_log.rollup()
+    job.message = f'{folded} clics consolidados en las estadísticas de afiliados.'
+    return {'folded': folded}
+
+
+@jobs.task('product_export')
+def export_products(job):
+    """
+    Writes every product, serialized as the API does, to an NDJSON file in
+    JOB_EXPORT_DIR. The file only appears under its final name once complete.
+    """
+    directory = current_app.config['JOB_EXPORT_DIR']
+    os.makedirs(directory, exist_ok=True)
+    filename = f'productos-{job.id}.ndjson'
+    path = os.path.join(directory, filename)
+    chunk_size = current_app.config['API_STREAM_CHUNK_SIZE']
+    total = db.session.execute(select(func.count(Product.id))).scalar()
+    serialize = PRODUCT.serializer()
+
+    exported = 0
+    try:
+        with open(path + '.part', 'wb') as export:
+            for row in PRODUCT.select().order_by(Product.id).yield_per(chunk_size):
+                export.write(dumps(serialize(row)) + b'\n')
+                exported += 1
+                if exported % chunk_size == 0:
+                    job.progress(exported, total, f'{exported} de {total} productos exportados')
+        os.replace(path + '.part', path)
+    except BaseException:
+        _remove_quietly(path + '.part')
+        raise
+
+    job.done = job.total = exported
+    job.message = f'{exported} productos exportados.'
+    return {'file': filename, 'products': exported}
+
+
+@jobs.task('link_check')
+def check_product_links(job):
+    """Requests the link of every product and reports the ones that fail or answer with an error status."""
+    products = db.session.execute(
+        select(Product.id, Product.name, Product.link)
+        .where(Product.link.isnot(None), Product.link != '')
+        .order_by(Product.id)
+    ).all()
+    db.session.rollback()  # Nothing else is read: don't hold the transaction while the links are requested
+    total = len(products)
+
+    broken = []
+    checked = 0
+    with requests.Session() as session, ThreadPoolExecutor(LINK_CHECK_WORKERS) as pool:
+        for start in range(0, total, LINK_CHECK_WORKERS * 4):
+            batch = products[start:start + LINK_CHECK_WORKERS * 4]
+            for product, problem in zip(batch, pool.map(lambda p: _link_problem(session, p.link), batch)):
+                if problem is not None:
+                    broken.append({'id': product.id, 'name': product.name, 'link': product.link, 'problem': problem})
+            checked += len(batch)
+            job.progress(checked, total, f'{checked} de {total} enlaces comprobados, {len(broken)} con errores')
+
+    job.done = job.total = checked
+    job.message = f'{checked} enlaces comprobados, {len(broken)} con errores.'
+    return {'checked': checked, 'broken_count': len(broken), 'broken': broken[:LINK_CHECK_MAX_REPORTED]}
+
+
+def _link_problem(session, url):
+    """Returns why `url` doesn't work ('HTTP 404', 'ConnectTimeout', ...), or None if it does."""
+    try:
+        response = session.head(url, timeout=LINK_CHECK_TIMEOUT, allow_redirects=True)
+        if response.status_code in _HEAD_REJECTED:
+            with session.get(url, timeout=LINK_CHECK_TIMEOUT, allow_redirects=True, stream=True) as response:
+                pass
+    except requests.exceptions.RequestException as e:
+        return type(e).__name__
+    return f'HTTP {response.status_code}' if response.status_code >= 400 else None
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
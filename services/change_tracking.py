@@ -0,0 +1,68 @@
+from collections import defaultdict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# Table name -> callbacks to run after a commit that changed that table
+_subscribers = defaultdict(list)
+_SESSION_KEY = 'changed_tables'
+
+
+def on_commit(*models):
+    """
+    Registers a callback that runs after any commit that inserted, updated or
+    deleted rows of one of the given models. The callback receives the set of
+    table names changed by that commit.
+    """
+    def decorator(callback):
+        for model in models:
+            if callback not in _subscribers[model.__tablename__]:
+                _subscribers[model.__tablename__].append(callback)
+        return callback
+    return decorator
+
+
+def mark_changed(session, *models):
+    """
+    Records that the current transaction changed the given models. Needed for
+    bulk statements (session.execute(insert(...)), update(...), ...) because
+    they bypass the unit of work and are not seen by the flush hook.
+    """
+    session.info.setdefault(_SESSION_KEY, set()).update(model.__tablename__ for model in models)
+
+
+def changed_tables(session):
+    """Names of the tables changed so far in the session's current transaction."""
+    return set(session.info.get(_SESSION_KEY, ()))
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changed_tables(session, flush_context):
+    changed = session.info.setdefault(_SESSION_KEY, set())
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        table_name = getattr(obj, '__tablename__', None)
+        if table_name:
+            changed.add(table_name)
+
+
+@event.listens_for(Session, 'after_commit')
+def _notify_subscribers(session):
+    changed = session.info.pop(_SESSION_KEY, None)
+    if not changed:
+        return
+    callbacks = []
+    for table_name in changed:
+        for callback in _subscribers.get(table_name, ()):
+            if callback not in callbacks:
+                callbacks.append(callback)
+    for callback in callbacks:
+        try:
+            callback(changed)
+        except Exception as e:
+            # A failing cache refresh must never turn a successful commit into an error
+            print(f"Error running commit hook {getattr(callback, '__qualname__', callback)}: {e}")
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop(_SESSION_KEY, None)
@@ -0,0 +1,169 @@
+import atexit
+import os
+import threading
+from collections import Counter
+from datetime import date
+
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from services.affiliate_stats import increment_clicks, merge_visitor_sketches
+from services.hyperloglog import HyperLogLog
+
+
+class ClickCounter:
+    """
+    Write-behind accumulator for affiliate clicks.
+
+    Clicks (and a HyperLogLog sketch of the visitors behind them) are buffered
+    in memory per (affiliate_id, day) and written to AffiliateStatistic in bulk by a background thread, either every
+    CLICK_FLUSH_INTERVAL seconds or as soon as CLICK_FLUSH_THRESHOLD clicks
+    are pending. Whatever is still buffered is flushed when the worker exits,
+    so the redirect never waits on the database.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._pending = Counter()
+        self._pending_visitors = {}
+        self._pending_total = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._pid = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CLICK_FLUSH_INTERVAL', 5.0)
+        app.config.setdefault('CLICK_FLUSH_THRESHOLD', 500)
+        app.config.setdefault('CLICK_WRITE_BEHIND', True)
+        self.app = app
+        app.extensions['click_counter'] = self
+        atexit.register(self.shutdown)
+
+    @property
+    def pending(self):
+        """Number of clicks buffered and not yet written to the database."""
+        return self._pending_total
+
+    def record(self, affiliate_id, day=None, count=1, visitor=None):
+        """
+        Buffers `count` clicks for an affiliate. `visitor` is an optional 64-bit
+        visitor fingerprint used for the unique visitors count. Never touches the database.
+        """
+        key = (affiliate_id, day or date.today())
+        with self._lock:
+            self._pending[key] += count
+            self._pending_total += count
+            if visitor is not None:
+                if key not in self._pending_visitors:
+                    self._pending_visitors[key] = HyperLogLog()
+                self._pending_visitors[key].add_hash(visitor)
+            threshold_reached = self._pending_total >= self.app.config['CLICK_FLUSH_THRESHOLD']
+
+        if not self.app.config['CLICK_WRITE_BEHIND']:
+            self.flush()
+            return
+
+        self._ensure_worker()
+        if threshold_reached:
+            self._wakeup.set()
+
+    def flush(self):
+        """
+        Writes every pending click to the database in a single transaction.
+        If the database rejects the batch (e.g. clicks of an affiliate deleted
+        before the flush), each (affiliate_id, day) is written on its own and
+        the rejected ones are dropped, so they can't block the others. Any
+        other failure puts the batch back to be retried on the next flush.
+        Returns the number of clicks written.
+        """
+        with self._lock:
+            batch, self._pending = self._pending, Counter()
+            visitors, self._pending_visitors = self._pending_visitors, {}
+            self._pending_total = 0
+        if not batch:
+            return 0
+
+        try:
+            with self.app.app_context():
+                _write_click_batch(batch, visitors)
+        except IntegrityError as e:
+            print(f"Buffered affiliate clicks rejected by the database, writing them one by one: {e}")
+            return self._write_each(batch, visitors)
+        except Exception as e:
+            print(f"Error writing buffered affiliate clicks, will retry: {e}")
+            self._put_back(batch, visitors)
+            return 0
+        return sum(batch.values())
+
+    def shutdown(self):
+        """Stops the flusher thread and writes any remaining clicks."""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout=10)
+        if self.app is not None:
+            self.flush()
+
+    def _write_each(self, batch, visitors):
+        written = 0
+        retry, retry_visitors = Counter(), {}
+        with self.app.app_context():
+            for key, clicks in batch.items():
+                sketch = {key: visitors[key]} if key in visitors else {}
+                try:
+                    _write_click_batch({key: clicks}, sketch)
+                    written += clicks
+                except IntegrityError as e:
+                    db.session.rollback()
+                    print(f"Dropping {clicks} clicks of affiliate {key[0]} on {key[1]}: {e}")
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Error writing the clicks of affiliate {key[0]} on {key[1]}, will retry: {e}")
+                    retry[key] = clicks
+                    retry_visitors.update(sketch)
+        if retry:
+            self._put_back(retry, retry_visitors)
+        return written
+
+    def _put_back(self, batch, visitors):
+        with self._lock:
+            self._pending.update(batch)
+            self._pending_total += sum(batch.values())
+            for key, sketch in visitors.items():
+                if key in self._pending_visitors:
+                    sketch.merge(self._pending_visitors[key])
+                self._pending_visitors[key] = sketch
+
+    def _ensure_worker(self):
+        # The thread is started lazily so that each gunicorn worker (which may
+        # be forked after create_app) gets its own flusher.
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._stopping.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='click-counter-flusher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        interval = self.app.config['CLICK_FLUSH_INTERVAL']
+        while not self._stopping.is_set():
+            self._wakeup.wait(interval)
+            self._wakeup.clear()
+            self.flush()
+
+
+def _write_click_batch(batch, visitors):
+    """Applies {(affiliate_id, day): clicks} and visitor sketches to AffiliateStatistic."""
+    increment_clicks(batch)
+    merge_visitor_sketches(visitors)
+    db.session.commit()
+
+
+click_counter = ClickCounter()
@@ -0,0 +1,103 @@
+import hashlib
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+
+# Compiled once at import time; matched against every /ref/<id> user agent.
+BOT_USER_AGENT_PATTERN = re.compile(
+    r'bot/|\bbot\b|\+https?://|crawl|spider|slurp|scrap|fetch|preview|monitor|checker|archiver|'
+    r'facebookexternalhit|embedly|quora link|whatsapp|telegram|skypeuripreview|'
+    r'headless|phantomjs|lighthouse|pingdom|uptime|'
+    r'curl/|wget/|python-requests|python-urllib|aiohttp|httpx|go-http-client|java/|okhttp|libwww|'
+    r'node-fetch|axios/|postman',
+    re.IGNORECASE
+)
+
+
+def is_bot(user_agent):
+    """True for empty user agents and those of known crawlers, previews and HTTP libraries."""
+    return not user_agent or BOT_USER_AGENT_PATTERN.search(user_agent) is not None
+
+
+def visitor_fingerprint(remote_addr, user_agent):
+    """Stable 64-bit fingerprint of a visitor, from its IP address and user agent."""
+    digest = hashlib.blake2b(f"{remote_addr}|{user_agent}".encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+class ClickFilter:
+    """
+    Drops bot clicks and repeated clicks before they are counted.
+
+    Duplicates are detected with a sliding window: a click from the same
+    visitor for the same affiliate within CLICK_DEDUPE_WINDOW seconds of the
+    last counted one is ignored. Each remembered click is a 64-bit visitor
+    fingerprint, the affiliate id and a timestamp, and at most
+    CLICK_DEDUPE_MAX_ENTRIES are kept (oldest evicted first), so memory is
+    bounded no matter the traffic. Filtered clicks are only counted in memory
+    and never reach the database.
+    """
+
+    def __init__(self, app=None):
+        self.window = 30.0
+        self.max_entries = 100000
+        self._seen = OrderedDict()
+        self._filtered = Counter()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CLICK_DEDUPE_WINDOW', 30.0)
+        app.config.setdefault('CLICK_DEDUPE_MAX_ENTRIES', 100000)
+        self.window = app.config['CLICK_DEDUPE_WINDOW']
+        self.max_entries = app.config['CLICK_DEDUPE_MAX_ENTRIES']
+        app.extensions['click_filter'] = self
+
+    def accept(self, affiliate_id, user_agent, visitor, now=None):
+        """
+        Returns True if the click should be counted, False if it was filtered out.
+        `visitor` is the fingerprint returned by visitor_fingerprint().
+        """
+        if is_bot(user_agent):
+            self._reject(affiliate_id, 'bot')
+            return False
+
+        now = time.monotonic() if now is None else now
+        key = (visitor, affiliate_id)
+        with self._lock:
+            self._expire(now)
+            last_seen = self._seen.get(key)
+            if last_seen is not None and now - last_seen < self.window:
+                self._filtered[(affiliate_id, 'duplicate')] += 1
+                return False
+            self._seen[key] = now
+            self._seen.move_to_end(key)
+            while len(self._seen) > self.max_entries:
+                self._seen.popitem(last=False)
+        return True
+
+    def filtered_counts(self, affiliate_id=None):
+        """Filtered clicks since the worker started, as {'bot': n, 'duplicate': n}."""
+        with self._lock:
+            counts = Counter()
+            for (filtered_affiliate_id, reason), count in self._filtered.items():
+                if affiliate_id is None or filtered_affiliate_id == affiliate_id:
+                    counts[reason] += count
+        return dict(counts)
+
+    def _reject(self, affiliate_id, reason):
+        with self._lock:
+            self._filtered[(affiliate_id, reason)] += 1
+
+    def _expire(self, now):
+        # Entries are kept in last-counted order, so expired ones are always at the front
+        while self._seen:
+            key, last_seen = next(iter(self._seen.items()))
+            if now - last_seen < self.window:
+                break
+            del self._seen[key]
+
+
+click_filter = ClickFilter()
@@ -0,0 +1,237 @@
+import atexit
+import glob
+import json
+import os
+import shutil
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from extensions import db
+from services.affiliate_stats import increment_clicks, merge_visitor_sketches
+from services.hyperloglog import HyperLogLog
+
+# Segment life cycle: "<name>.open" while a worker appends to it, "<name>"
+# once closed, "<name>.rolling" while a rollup folds it into the database,
+# and finally "archive/<name>" so the history can be replayed.
+_SEGMENT_SUFFIX = '.jsonl'
+_OPEN_SUFFIX = '.open'
+_ROLLING_SUFFIX = '.rolling'
+# A claimed segment whose rollup hasn't finished after this long is assumed abandoned
+_STALE_ROLLUP_SECONDS = 3600
+
+
+class ClickEventLog:
+    """
+    Segmented, append-only log of raw affiliate clicks.
+
+    Every click is appended as one compact JSON line (timestamp, affiliate,
+    visitor fingerprint, product, referrer and user agent) to a segment file
+    owned by the current worker. Writes are fsync'ed in batches every CLICK_LOG_FSYNC_INTERVAL
+    seconds, and segments are closed once they reach CLICK_LOG_SEGMENT_BYTES
+    or CLICK_LOG_SEGMENT_SECONDS. A rollup folds closed segments into
+    AffiliateStatistic and moves them to the archive, so ingestion never
+    depends on the database and the raw history can be replayed later.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.directory = None
+        self._file = None
+        self._segment_path = None
+        self._segment_opened_at = 0.0
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._last_rollup = 0.0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CLICK_LOG_ENABLED', False)
+        app.config.setdefault('CLICK_LOG_DIR', os.path.join(app.instance_path, 'click_log'))
+        app.config.setdefault('CLICK_LOG_SEGMENT_BYTES', 16 * 1024 * 1024)
+        app.config.setdefault('CLICK_LOG_SEGMENT_SECONDS', 300)
+        app.config.setdefault('CLICK_LOG_FSYNC_INTERVAL', 1.0)
+        app.config.setdefault('CLICK_LOG_ROLLUP_INTERVAL', 60)
+        self.app = app
+        self.directory = app.config['CLICK_LOG_DIR']
+        app.extensions['click_log'] = self
+        if self.enabled:
+            os.makedirs(os.path.join(self.directory, 'archive'), exist_ok=True)
+            atexit.register(self.close)
+
+    @property
+    def enabled(self):
+        return self.app is not None and self.app.config['CLICK_LOG_ENABLED']
+
+    def append(self, affiliate_id, product_id=None, referrer=None, user_agent=None, visitor=None, timestamp=None):
+        """Appends one click to the current segment. Never touches the database."""
+        record = {
+            'ts': round(timestamp or time.time(), 3),
+            'a': affiliate_id,
+            'v': f'{visitor:016x}' if visitor is not None else None,
+            'p': product_id,
+            'r': referrer,
+            'ua': user_agent,
+        }
+        line = (json.dumps(record, separators=(',', ':'), ensure_ascii=False) + '\n').encode('utf-8')
+        self._ensure_worker()
+        with self._lock:
+            if self._file is None:
+                self._open_segment()
+            self._file.write(line)
+            if self._file.tell() >= self.app.config['CLICK_LOG_SEGMENT_BYTES']:
+                self._close_segment()
+
+    def sync(self):
+        """Flushes buffered writes to disk and closes the segment if it is too old."""
+        with self._lock:
+            if self._file is None:
+                return
+            if time.time() - self._segment_opened_at >= self.app.config['CLICK_LOG_SEGMENT_SECONDS']:
+                self._close_segment()
+            else:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+
+    def close(self):
+        """Stops the background thread and closes the current segment."""
+        self._stopping.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout=10)
+        with self._lock:
+            if self._file is not None:
+                self._close_segment()
+
+    def rollup(self):
+        """
+        Folds every closed segment into AffiliateStatistic, one transaction per
+        segment, and moves it to the archive. Segments are claimed with an atomic
+        rename, so several workers can run the rollup at the same time.
+        Returns the number of clicks folded.
+        """
+        self._release_orphaned_segments()
+        folded = 0
+        for path in sorted(glob.glob(os.path.join(self.directory, '*' + _SEGMENT_SUFFIX))):
+            claimed = path + _ROLLING_SUFFIX
+            try:
+                os.rename(path, claimed)
+            except OSError:
+                continue  # Another worker claimed it first
+            # The claim time is what marks a rollup as stale, not the last write
+            os.utime(claimed)
+            folded += self._fold_segment(claimed)
+        return folded
+
+    def iter_events(self, include_archive=True):
+        """Yields every logged click, oldest segments first, for replays and audits."""
+        patterns = [os.path.join(self.directory, '*' + _SEGMENT_SUFFIX)]
+        if include_archive:
+            patterns.insert(0, os.path.join(self.directory, 'archive', '*' + _SEGMENT_SUFFIX))
+        for pattern in patterns:
+            for path in sorted(glob.glob(pattern)):
+                yield from _read_segment(path)
+
+    def _fold_segment(self, path):
+        counts = Counter()
+        visitors = {}
+        for event in _read_segment(path):
+            key = (event['a'], datetime.fromtimestamp(event['ts']).date())
+            counts[key] += 1
+            if event.get('v'):
+                if key not in visitors:
+                    visitors[key] = HyperLogLog()
+                visitors[key].add_hash(int(event['v'], 16))
+        try:
+            with self.app.app_context():
+                increment_clicks(counts)
+                merge_visitor_sketches(visitors)
+                db.session.commit()
+        except Exception as e:
+            print(f"Error rolling up click segment {os.path.basename(path)}, will retry: {e}")
+            os.rename(path, path[:-len(_ROLLING_SUFFIX)])
+            return 0
+        archived = os.path.join(self.directory, 'archive', os.path.basename(path)[:-len(_ROLLING_SUFFIX)])
+        shutil.move(path, archived)
+        return sum(counts.values())
+
+    def _release_orphaned_segments(self):
+        # Segments left open by a worker that died, and rollups that never finished
+        now = time.time()
+        max_open_age = 2 * self.app.config['CLICK_LOG_SEGMENT_SECONDS']
+        own_segment = self._segment_path
+        for path in glob.glob(os.path.join(self.directory, '*' + _SEGMENT_SUFFIX + _OPEN_SUFFIX)):
+            if path != own_segment and _age(path, now) > max_open_age:
+                _rename_quietly(path, path[:-len(_OPEN_SUFFIX)])
+        for path in glob.glob(os.path.join(self.directory, '*' + _SEGMENT_SUFFIX + _ROLLING_SUFFIX)):
+            if _age(path, now) > _STALE_ROLLUP_SECONDS:
+                _rename_quietly(path, path[:-len(_ROLLING_SUFFIX)])
+
+    def _open_segment(self):
+        self._segment_opened_at = time.time()
+        name = f"clicks-{int(self._segment_opened_at * 1000)}-{os.getpid()}{_SEGMENT_SUFFIX}{_OPEN_SUFFIX}"
+        self._segment_path = os.path.join(self.directory, name)
+        self._file = open(self._segment_path, 'ab')
+
+    def _close_segment(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.rename(self._segment_path, self._segment_path[:-len(_OPEN_SUFFIX)])
+        self._file = None
+        self._segment_path = None
+
+    def _ensure_worker(self):
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            if self._pid is not None and self._pid != os.getpid():
+                # Forked after a segment was opened: that file belongs to the parent process
+                self._file = None
+                self._segment_path = None
+            self._stopping.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='click-log-writer', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopping.wait(self.app.config['CLICK_LOG_FSYNC_INTERVAL']):
+            try:
+                self.sync()
+                if time.time() - self._last_rollup >= self.app.config['CLICK_LOG_ROLLUP_INTERVAL']:
+                    self._last_rollup = time.time()
+                    self.rollup()
+            except Exception as e:
+                print(f"Error in the click log writer: {e}")
+
+
+def _read_segment(path):
+    with open(path, 'rb') as segment:
+        for line in segment:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # A torn last line from a crashed worker is skipped
+                continue
+
+
+def _age(path, now):
+    try:
+        return now - os.path.getmtime(path)
+    except OSError:
+        return 0
+
+
+def _rename_quietly(source, destination):
+    try:
+        os.rename(source, destination)
+    except OSError:
+        pass
+
+
+click_log = ClickEventLog()
@@ -0,0 +1,148 @@
+import gzip
+import re
+
+from flask import request
+
+from services.shared_cache import shared_cache
+
+try:
+    import brotli
+except ImportError:  # Optional: only gzip is offered without it
+    brotli = None
+
+DEFAULT_MIMETYPES = (
+    'text/html', 'text/css', 'text/plain', 'text/xml', 'text/javascript',
+    'application/javascript', 'application/json', 'application/x-ndjson',
+    'application/xml', 'image/svg+xml',
+)
+# Compressed variants get the resource's ETag plus the encoding: "<etag>-br"
+ENCODINGS = ('br', 'gzip')
+_ENCODED_ETAG = re.compile(r'-(?:br|gzip)"')
+_ORIGINAL_IF_NONE_MATCH = 'compression.if_none_match'
+
+
+class Compression:
+    """
+    Compresses responses with brotli or gzip, as negotiated by Accept-Encoding.
+
+    Only bodies of at least COMPRESS_MIN_SIZE bytes whose mimetype is in
+    COMPRESS_MIMETYPES are compressed; streamed responses and responses that
+    already have a Content-Encoding (the sitemap, which keeps its own gzip
+    copy) are left alone. Static files are read and compressed too.
+
+    Responses with a strong ETag (the API, static files, cached pages) are
+    the same bytes until their ETag changes, so their compressed variants are
+    kept in the shared cache (one copy per host) for COMPRESS_CACHE_TTL
+    seconds and reused instead of being compressed again on every request.
+
+    A strong ETag identifies bytes, so compressed responses get the ETag
+    plus the encoding ("<etag>-gzip"). Before the view runs, the suffix is
+    stripped from If-None-Match, so views keep matching their own ETag, and
+    a 304 answers with the variant the client asked about.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('COMPRESS_ENABLED', True)
+        app.config.setdefault('COMPRESS_MIN_SIZE', 500)
+        app.config.setdefault('COMPRESS_MIMETYPES', DEFAULT_MIMETYPES)
+        app.config.setdefault('COMPRESS_GZIP_LEVEL', 6)
+        app.config.setdefault('COMPRESS_BROTLI_QUALITY', 5)
+        app.config.setdefault('COMPRESS_CACHE_TTL', 24 * 3600)
+        self.app = app
+        app.extensions['compression'] = self
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+
+    def negotiate(self):
+        """Best encoding the client accepts ('br', 'gzip') or None. Brotli wins ties."""
+        accepted = request.accept_encodings
+        candidates = ['br', 'gzip'] if brotli is not None else ['gzip']
+        best, best_quality = None, 0
+        for encoding in candidates:
+            quality = accepted[encoding]
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+    def compress(self, data, encoding):
+        if encoding == 'br':
+            return brotli.compress(data, quality=self.app.config['COMPRESS_BROTLI_QUALITY'])
+        return gzip.compress(data, compresslevel=self.app.config['COMPRESS_GZIP_LEVEL'], mtime=0)
+
+    def before_request(self):
+        header = request.environ.get('HTTP_IF_NONE_MATCH')
+        if header and _ENCODED_ETAG.search(header):
+            request.environ[_ORIGINAL_IF_NONE_MATCH] = header
+            request.environ['HTTP_IF_NONE_MATCH'] = _ENCODED_ETAG.sub('"', header)
+
+    def after_request(self, response):
+        config = self.app.config
+        if response.status_code == 304:
+            return self._not_modified(response)
+        if not config['COMPRESS_ENABLED'] or request.method == 'HEAD':
+            return response
+        if response.status_code != 200 or 'Content-Encoding' in response.headers:
+            return response
+        if response.mimetype not in config['COMPRESS_MIMETYPES']:
+            return response
+        # Content-Length is known for static files before reading them
+        if response.content_length is not None and response.content_length < config['COMPRESS_MIN_SIZE']:
+            return response
+        if response.is_streamed and not response.direct_passthrough:
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = self.negotiate()
+        if encoding is None:
+            return response
+
+        etag, weak = response.get_etag()
+        cacheable = etag and not weak and not response.cache_control.no_store
+        key = f'compressed:{encoding}:{etag}:{request.path}' if cacheable else None
+        compressed = shared_cache.get(key) if key else None
+        if compressed is None:
+            if response.direct_passthrough:
+                # A static file: read it through the regular iterable
+                response.direct_passthrough = False
+            data = response.get_data()
+            if len(data) < config['COMPRESS_MIN_SIZE']:
+                return response
+            compressed = self.compress(data, encoding)
+            if key:
+                shared_cache.set(key, compressed, config['COMPRESS_CACHE_TTL'])
+        else:
+            _close(response)
+
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        response.headers.pop('Accept-Ranges', None)
+        if etag and not weak:
+            response.set_etag(f'{etag}-{encoding}')
+        return response
+
+    def _not_modified(self, response):
+        # The client validated a compressed variant: the 304 carries that variant's ETag
+        original = request.environ.get(_ORIGINAL_IF_NONE_MATCH)
+        etag, weak = response.get_etag()
+        if original and etag and not weak:
+            for encoding in ENCODINGS:
+                if f'"{etag}-{encoding}"' in original:
+                    response.set_etag(f'{etag}-{encoding}')
+                    break
+        response.vary.add('Accept-Encoding')
+        return response
+
+
+def _close(response):
+    # The body is replaced without being read; release its file (static files)
+    close = getattr(response.response, 'close', None)
+    if close is not None:
+        close()
+
+
+compression = Compression()
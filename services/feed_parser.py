@@ -0,0 +1,139 @@
+import codecs
+import json
+import zlib
+
+_GZIP_MAGIC = b'\x1f\x8b'
+_WHITESPACE = ' \t\n\r'
+_decoder = json.JSONDecoder()
+# A feed item bigger than this (in characters) is rejected instead of being buffered without limit
+MAX_ELEMENT_SIZE = 8 * 1024 * 1024
+# A decode error this close to the end of the buffer may be a token cut by a chunk boundary
+# ("tru", "-", "\\u00"); anything earlier is a malformed element
+_INCOMPLETE_TAIL = 32
+_NUMBER_CHARS = frozenset('0123456789.eE+-')
+
+
+class FeedFormatError(ValueError):
+    pass
+
+
+def decompressed(chunks):
+    """
+    Yields the chunks of a byte stream, gunzipped on the fly if the stream is
+    a gzip file (feeds published as .json.gz). Content-Encoding: gzip is
+    already undone by requests' iter_content().
+    """
+    chunks = iter(chunks)
+    first = b''
+    for chunk in chunks:
+        first += chunk
+        if len(first) >= len(_GZIP_MAGIC):
+            break
+    if not first.startswith(_GZIP_MAGIC):
+        if first:
+            yield first
+        yield from chunks
+        return
+
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    for chunk in _prepend(first, chunks):
+        data = decompressor.decompress(chunk)
+        if data:
+            yield data
+    data = decompressor.flush()
+    if data:
+        yield data
+
+
+def _prepend(first, chunks):
+    yield first
+    yield from chunks
+
+
+def iter_json_array(chunks):
+    """
+    Yields the elements of a JSON array read from a stream of byte chunks,
+    one at a time, without ever holding more than the element being parsed
+    and the last chunk in memory. Raises FeedFormatError if the stream isn't
+    a JSON array or an element exceeds MAX_ELEMENT_SIZE, and
+    json.JSONDecodeError for malformed elements, as soon as they are read.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    chunks = iter(chunks)
+    buffer, pos = '', 0
+    exhausted = False
+
+    def fill():
+        # Drops the consumed part of the buffer and appends the next chunk
+        nonlocal buffer, pos, exhausted
+        if exhausted:
+            return False
+        chunk = next(chunks, None)
+        if chunk is None:
+            exhausted = True
+            buffer, pos = buffer[pos:] + decoder.decode(b'', final=True), 0
+        else:
+            buffer, pos = buffer[pos:] + decoder.decode(chunk), 0
+        return True
+
+    def skip_whitespace():
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+                pos += 1
+            if pos < len(buffer) or not fill():
+                return
+
+    skip_whitespace()
+    if pos >= len(buffer) or buffer[pos] != '[':
+        raise FeedFormatError("The feed is not a JSON array")
+    pos += 1
+
+    expect_value = True
+    first = True
+    while True:
+        skip_whitespace()
+        if pos >= len(buffer):
+            raise FeedFormatError("The feed ends before the closing ']'")
+        char = buffer[pos]
+        if char == ']' and (first or not expect_value):
+            return
+        if not expect_value:
+            if char != ',':
+                raise FeedFormatError(f"Expected ',' or ']' in the feed, found {char!r}")
+            pos += 1
+            expect_value = True
+            continue
+
+        while True:
+            try:
+                item, end = _decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError as e:
+                if _maybe_incomplete(e, buffer) and fill():
+                    if len(buffer) > MAX_ELEMENT_SIZE:
+                        raise FeedFormatError(f"A feed item is larger than {MAX_ELEMENT_SIZE} characters") from e
+                    continue  # The element continues in the next chunk
+                raise
+            # An element at the end of the buffer, or a number followed by what could be the rest of
+            # it ("19" then ".", "1e" or "-"), might continue in the next chunk
+            if not exhausted and (end == len(buffer) or _number_may_continue(item, buffer, end)):
+                fill()
+                if len(buffer) > MAX_ELEMENT_SIZE:
+                    raise FeedFormatError(f"A feed item is larger than {MAX_ELEMENT_SIZE} characters")
+                continue
+            break
+        pos = end
+        yield item
+        expect_value = False
+        first = False
+
+
+def _maybe_incomplete(error, buffer):
+    # An unterminated string reports where it starts, however long it is
+    return error.msg.startswith('Unterminated string') or error.pos >= len(buffer) - _INCOMPLETE_TAIL
+
+
+def _number_may_continue(item, buffer, end):
+    # raw_decode("19.") returns 19 and stops before the "."
+    return (isinstance(item, (int, float)) and not isinstance(item, bool)
+            and len(buffer) - end <= _INCOMPLETE_TAIL and all(char in _NUMBER_CHARS for char in buffer[end:]))
@@ -0,0 +1,313 @@
+import atexit
+import json
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select, update
+
+from extensions import db
+from models import Job
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+_MESSAGE_LENGTH = Job.__table__.c.message.type.length
+
+
+class JobCancelled(Exception):
+    """Raised inside a running task once an admin asked to cancel its job."""
+
+
+class JobContext:
+    """
+    Handle passed to a running task as its first argument.
+
+    progress() records how far the task got; it is written to the jobs table
+    at most every JOB_PROGRESS_INTERVAL seconds, and each write also checks
+    whether the job was asked to stop, raising JobCancelled if so. Tasks are
+    therefore cancelled at the points where they report progress, which they
+    should place between units of work that are safe to stop after.
+
+    The runner stores the last done, total and message with the job's result,
+    so a task can set them directly for its final summary.
+    """
+
+    def __init__(self, runner, job_id, params):
+        self.id = job_id
+        self.params = params
+        self.done = 0
+        self.total = None
+        self.message = None
+        self._runner = runner
+        self._last_write = 0.0
+
+    def progress(self, done, total=None, message=None):
+        """Reports `done` units of work out of `total` (None if unknown so far)."""
+        self.done = done
+        if total is not None:
+            self.total = total
+        if message is not None:
+            self.message = message
+        now = time.monotonic()
+        if now - self._last_write < self._runner.app.config['JOB_PROGRESS_INTERVAL']:
+            return
+        self._last_write = now
+        self._runner._update(self.id, progress=self.done, total=self.total,
+                             message=_truncate(self.message), heartbeat_at=_utcnow())
+        self.check_cancelled()
+
+    def check_cancelled(self):
+        if self._runner._cancel_requested(self.id):
+            raise JobCancelled()
+
+
+class JobRunner:
+    """
+    Background job queue persisted in the jobs table, for admin operations
+    too long to run inside a request (feed syncs, click rollups, exports,
+    link checks).
+
+    enqueue() stores a job and returns right away. Worker threads (JOB_WORKERS
+    per process, started lazily so every gunicorn worker gets its own, or in
+    a dedicated `flask run-jobs` process) claim queued jobs with a conditional
+    UPDATE, so a job runs exactly once across processes, and run the task
+    registered for its kind inside an application context. Progress, the
+    result and errors are written back to the job's row, where the admin's
+    status page polls them.
+
+    The jobs of each process are heartbeated every JOB_HEARTBEAT_INTERVAL
+    seconds; a running job whose heartbeat is older than JOB_STALE_AFTER
+    (its process was killed) is marked failed by any other process.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._tasks = {}
+        self._running = set()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._pid = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('JOB_WORKERS', 1)
+        app.config.setdefault('JOB_POLL_INTERVAL', 2.0)
+        app.config.setdefault('JOB_PROGRESS_INTERVAL', 1.0)
+        app.config.setdefault('JOB_HEARTBEAT_INTERVAL', 10.0)
+        app.config.setdefault('JOB_STALE_AFTER', 60)
+        app.config.setdefault('JOB_EXPORT_DIR', os.path.join(app.instance_path, 'exports'))
+        self.app = app
+        app.extensions['jobs'] = self
+        app.before_request(self._ensure_workers)
+        atexit.register(self.shutdown)
+
+    def task(self, kind):
+        """Decorator registering the function run for jobs of `kind`: function(job, **params) -> JSON-able result."""
+        def decorator(function):
+            self._tasks[kind] = function
+            return function
+        return decorator
+
+    def enqueue(self, kind, params=None, unique=False):
+        """
+        Queues a job and returns it. With `unique`, a queued or running job of
+        the same kind and params is returned instead of queuing another one.
+        """
+        if kind not in self._tasks:
+            raise ValueError(f"Unknown job kind: {kind}")
+        encoded = json.dumps(params or {}, sort_keys=True)
+        if unique:
+            existing = Job.query.filter(
+                Job.kind == kind, Job.params == encoded, Job.status.in_((QUEUED, RUNNING))
+            ).order_by(Job.id).first()
+            if existing is not None:
+                return existing
+        job = Job(kind=kind, params=encoded, status=QUEUED)
+        db.session.add(job)
+        db.session.commit()
+        self._ensure_workers()
+        self._wakeup.set()
+        return job
+
+    def cancel(self, job_id):
+        """
+        Cancels a queued job at once, and asks a running one to stop at its
+        next progress report. Returns False if the job had already finished.
+        """
+        if self._update(job_id, Job.status == QUEUED, status=CANCELLED, cancel_requested=True, finished_at=_utcnow()):
+            return True
+        return bool(self._update(job_id, Job.status == RUNNING, cancel_requested=True))
+
+    def start(self, workers=None):
+        """Starts the worker and heartbeat threads of this process (once per process)."""
+        workers = self.app.config['JOB_WORKERS'] if workers is None else workers
+        with self._lock:
+            if self._pid == os.getpid() and any(thread.is_alive() for thread in self._threads):
+                return
+            self._stopping.clear()
+            self._pid = os.getpid()
+            self._running = set()
+            self._threads = [threading.Thread(target=self._work, name=f'job-worker-{n}', daemon=True)
+                             for n in range(workers)]
+            self._threads.append(threading.Thread(target=self._heartbeat, name='job-heartbeat', daemon=True))
+            for thread in self._threads:
+                thread.start()
+
+    def serve(self, workers=None):
+        """Runs jobs in the foreground until interrupted, for a dedicated `flask run-jobs` process."""
+        self.start(workers)
+        try:
+            while not self._stopping.wait(1):
+                pass
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        """
+        Stops the worker threads. Jobs still running in this process are marked
+        failed, since they die with it.
+        """
+        self._stopping.set()
+        self._wakeup.set()
+        if self.app is None or self._pid != os.getpid():
+            return
+        deadline = time.monotonic() + 5
+        for thread in self._threads:
+            thread.join(timeout=max(0.0, deadline - time.monotonic()))
+        with self._lock:
+            running = list(self._running)
+        if running:
+            try:
+                with self.app.app_context(), db.engine.begin() as connection:
+                    connection.execute(
+                        update(Job).where(Job.id.in_(running), Job.status == RUNNING)
+                        .values(status=FAILED, finished_at=_utcnow(),
+                                error="The worker process exited before the job finished")
+                    )
+            except Exception as e:
+                print(f"Error marking the interrupted jobs as failed: {e}")
+
+    def _ensure_workers(self):
+        # Cheap enough to run before every request; does nothing once the threads run
+        if self.app.config['JOB_WORKERS'] > 0 and self._pid != os.getpid():
+            self.start()
+
+    def _work(self):
+        while not self._stopping.is_set():
+            try:
+                with self.app.app_context():
+                    claimed = self._claim()
+                    if claimed is not None:
+                        self._execute(*claimed)
+                        continue
+            except Exception as e:
+                print(f"Error in the job runner: {e}")
+            self._wakeup.wait(self.app.config['JOB_POLL_INTERVAL'])
+            self._wakeup.clear()
+
+    def _claim(self):
+        """Marks the oldest queued job as running by this thread and returns (id, kind, params), or None."""
+        worker = f'{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}'[:64]
+        while not self._stopping.is_set():
+            with db.engine.connect() as connection:
+                row = connection.execute(
+                    select(Job.id, Job.kind, Job.params).where(Job.status == QUEUED).order_by(Job.id).limit(1)
+                ).first()
+            if row is None:
+                return None
+            now = _utcnow()
+            if self._update(row.id, Job.status == QUEUED, status=RUNNING, worker=worker, started_at=now,
+                            heartbeat_at=now):
+                return row.id, row.kind, json.loads(row.params or '{}')
+            # Another worker claimed it first: try the next one
+        return None
+
+    def _execute(self, job_id, kind, params):
+        context = JobContext(self, job_id, params)
+        task = self._tasks.get(kind)
+        if task is None:
+            self._finish(context, FAILED, error=f"No task is registered for job kind '{kind}'")
+            return
+        with self._lock:
+            self._running.add(job_id)
+        try:
+            result = task(context, **params)
+        except JobCancelled:
+            db.session.rollback()
+            self._finish(context, CANCELLED)
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error running job {job_id} ({kind}): {e}")
+            self._finish(context, FAILED, error=str(e))
+        else:
+            self._finish(context, SUCCEEDED, result=result)
+        finally:
+            with self._lock:
+                self._running.discard(job_id)
+
+    def _finish(self, context, status, result=None, error=None):
+        self._update(
+            context.id, status=status, finished_at=_utcnow(), progress=context.done, total=context.total,
+            message=_truncate(context.message), error=error,
+            result=json.dumps(result, default=str) if result is not None else None
+        )
+
+    def _heartbeat(self):
+        while not self._stopping.wait(self.app.config['JOB_HEARTBEAT_INTERVAL']):
+            try:
+                with self.app.app_context():
+                    self._beat()
+            except Exception as e:
+                print(f"Error in the job heartbeat: {e}")
+
+    def _beat(self):
+        """Refreshes the heartbeat of the jobs running in this process and fails the stale jobs of any process."""
+        with self._lock:
+            running = list(self._running)
+        now = _utcnow()
+        stale_before = now - timedelta(seconds=self.app.config['JOB_STALE_AFTER'])
+        with db.engine.begin() as connection:
+            if running:
+                connection.execute(
+                    update(Job).where(Job.id.in_(running), Job.status == RUNNING).values(heartbeat_at=now)
+                )
+            connection.execute(
+                update(Job).where(Job.status == RUNNING, Job.heartbeat_at < stale_before)
+                .values(status=FAILED, finished_at=now,
+                        error="The process running the job stopped before it finished")
+            )
+
+    def _update(self, job_id, *conditions, **values):
+        # Written on a connection of its own, outside the task's session and transaction
+        with db.engine.begin() as connection:
+            return connection.execute(update(Job).where(Job.id == job_id, *conditions).values(**values)).rowcount
+
+    def _cancel_requested(self, job_id):
+        with db.engine.connect() as connection:
+            return bool(connection.execute(select(Job.cancel_requested).where(Job.id == job_id)).scalar())
+
+
+def _utcnow():
+    # Job timestamps are stored as naive UTC datetimes
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _truncate(message):
+    if message is not None and len(message) > _MESSAGE_LENGTH:
+        return message[:_MESSAGE_LENGTH - 1] + '…'
+    return message
+
+
+jobs = JobRunner()
@@ -0,0 +1,141 @@
+import hashlib
+from collections import defaultdict
+from functools import wraps
+from urllib.parse import urlencode
+
+from flask import Response, make_response, request, session
+
+from models import (
+    Product, Article, Category, Subcategory, Advertisement, SocialMediaLink, AdsenseConfig
+)
+from services.change_tracking import on_commit
+from services.shared_cache import shared_cache
+from services.site_context import site_context
+
+# Tag -> models whose committed changes purge the pages with that tag
+TAG_MODELS = {
+    'product': (Product,),
+    'article': (Article,),
+    'category': (Category, Subcategory),
+    'ad': (Advertisement,),
+    'config': (SocialMediaLink, AdsenseConfig),
+}
+# Every page shares the layout, which shows the ads and the site configuration
+LAYOUT_TAGS = ('ad', 'config')
+
+_TABLE_TAGS = defaultdict(set)
+for _tag, _models in TAG_MODELS.items():
+    for _model in _models:
+        _TABLE_TAGS[_model.__tablename__].add(_tag)
+
+
+# Page entries are stored as the ETag followed by the HTML
+_ETAG_LENGTH = 24
+
+
+class PageCache:
+    """
+    Full-page cache for the public pages that look the same to every
+    anonymous visitor.
+
+    Views decorated with cached(*tags) are rendered once per path, query
+    string and locale and then served from the shared cache (one copy for
+    all the workers of the host), without running the view, Jinja or any
+    query, for up to PAGE_CACHE_TTL seconds. Logged-in users and requests
+    with pending flashed messages always get a fresh render, and only 200
+    responses that didn't touch the session are stored.
+
+    Each page is tagged with the kinds of data it shows (plus LAYOUT_TAGS);
+    a commit that changes products, articles, categories, ads or the site
+    configuration invalidates only the pages with the matching tags, in
+    every worker. Cached pages carry a strong ETag, so the compression
+    middleware keeps their compressed variants too.
+    """
+
+    def __init__(self, app=None, locale_selector=None):
+        self.app = None
+        self._locale_selector = None
+        if app is not None:
+            self.init_app(app, locale_selector)
+
+    def init_app(self, app, locale_selector=None):
+        app.config.setdefault('PAGE_CACHE_ENABLED', True)
+        app.config.setdefault('PAGE_CACHE_TTL', 300)
+        self.app = app
+        self._locale_selector = locale_selector
+        app.extensions['page_cache'] = self
+        tables = [model for models in TAG_MODELS.values() for model in models]
+        on_commit(*tables)(self._invalidate_tables)
+
+    def cached(self, *tags):
+        """Decorator caching a GET view's HTML; `tags` are the TAG_MODELS keys the page depends on."""
+        tags = frozenset(tags) | frozenset(LAYOUT_TAGS)
+        unknown = tags - TAG_MODELS.keys()
+        if unknown:
+            raise ValueError(f"Unknown page cache tags: {', '.join(sorted(unknown))}")
+        cache_tags = tuple(sorted(_cache_tag(tag) for tag in tags))
+
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self._cacheable_request():
+                    return view(*args, **kwargs)
+
+                key = self._key()
+                stored = shared_cache.get(key)
+                if stored is not None:
+                    return self._hit(stored)
+
+                generations = shared_cache.generations(*cache_tags)
+                response = make_response(view(*args, **kwargs))
+                if response.status_code == 200 and not response.is_streamed \
+                        and not session.modified and 'Set-Cookie' not in response.headers:
+                    body = response.get_data()
+                    etag = hashlib.blake2b(body, digest_size=_ETAG_LENGTH // 2).hexdigest()
+                    shared_cache.set(key, etag.encode('ascii') + body, self._ttl(), cache_tags, generations)
+                    response.set_etag(etag)
+                response.headers['X-Page-Cache'] = 'MISS'
+                return response
+            return wrapper
+        return decorator
+
+    def invalidate(self, *tags):
+        """Invalidates the pages with any of the given tags (every page if none is given), in every worker."""
+        shared_cache.invalidate(*(_cache_tag(tag) for tag in (tags or TAG_MODELS)))
+
+    def _invalidate_tables(self, changed_tables):
+        tags = set()
+        for table_name in changed_tables:
+            tags |= _TABLE_TAGS.get(table_name, set())
+        if tags:
+            self.invalidate(*tags)
+
+    def _cacheable_request(self):
+        if not self.app.config['PAGE_CACHE_ENABLED'] or request.method != 'GET':
+            return False
+        # Checked on the session itself, so a hit never loads the user from the database
+        return '_user_id' not in session and not session.get('_flashes')
+
+    def _key(self):
+        locale = self._locale_selector() if self._locale_selector else ''
+        query = urlencode(sorted(request.args.items(multi=True)))
+        return f'page:{locale}:{request.path}?{query}'
+
+    def _ttl(self):
+        ttl = self.app.config['PAGE_CACHE_TTL']
+        # Scheduled ads switch on or off at a known instant; the page must not outlive it
+        ads_change_in = site_context.seconds_until_ads_change()
+        return ttl if ads_change_in is None else min(ttl, ads_change_in)
+
+    def _hit(self, stored):
+        response = Response(stored[_ETAG_LENGTH:], mimetype='text/html')
+        response.set_etag(stored[:_ETAG_LENGTH].decode('ascii'))
+        response.headers['X-Page-Cache'] = 'HIT'
+        return response.make_conditional(request)
+
+
+def _cache_tag(tag):
+    return f'page:{tag}'
+
+
+page_cache = PageCache()
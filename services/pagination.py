@@ -0,0 +1,162 @@
+import base64
+import json
+from decimal import Decimal
+from collections import namedtuple
+from datetime import date, datetime
+
+from flask import current_app
+from sqlalchemy import Date, DateTime, func, select, tuple_
+
+from extensions import db
+
+NEXT, PREV = 'n', 'p'
+
+KeysetPage = namedtuple('KeysetPage', ['items', 'next_cursor', 'prev_cursor', 'total', 'total_is_exact'])
+
+
+def encode_cursor(direction, key):
+    """Opaque, URL-safe cursor pointing after (NEXT) or before (PREV) the row with this sort key."""
+    payload = json.dumps([direction, [_dump(value) for value in key]], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, key_columns=None):
+    """
+    Returns (direction, key) for a cursor made by encode_cursor(), or None if
+    it's missing or invalid.
+
+    With `key_columns`, the key must have one value per column, of the
+    column's type; dates are parsed back, and any value that doesn't fit
+    (a tampered cursor, or one from another listing) makes it invalid.
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        direction, key = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError):
+        return None
+    if direction not in (NEXT, PREV) or not isinstance(key, list):
+        return None
+    if key_columns is not None:
+        if len(key) != len(key_columns):
+            return None
+        try:
+            key = tuple(_load(column, value) for column, value in zip(key_columns, key))
+        except (ValueError, TypeError):
+            return None
+    return direction, key
+
+
+def keyset_paginate(query, key_columns, cursor=None, per_page=9, descending=True):
+    """
+    Paginates an ORM query by the given columns without OFFSET, newest first
+    unless `descending` is False.
+
+    `key_columns` must identify a row uniquely, e.g. (Product.created_at,
+    Product.id), and should be covered by an index. Each page only reads
+    per_page + 1 rows after the cursor, so a deep page costs the same as the
+    first one. An invalid cursor is treated as the first page. Rows with a
+    NULL key value are left out (see keyset_query).
+    """
+    decoded = decode_cursor(cursor, key_columns)
+    direction, key = decoded if decoded else (NEXT, None)
+
+    total, total_is_exact = approximate_total(lambda limit: count_rows(query, limit))
+    query = keyset_query(query, key_columns, direction, key, descending)
+    rows = query.limit(per_page + 1).all()
+
+    def row_key(item):
+        return tuple(getattr(item, column.key) for column in key_columns)
+
+    return build_page(rows, per_page, direction, key is not None, row_key, total, total_is_exact)
+
+
+def keyset_query(query, key_columns, direction=NEXT, key=None, descending=True):
+    """
+    Orders `query` by the key columns and keeps only the rows after (NEXT) or
+    before (PREV) `key`, a cursor key decoded with decode_cursor(cursor,
+    key_columns). PREV queries are returned in reverse order, as build_page()
+    expects.
+
+    Rows with a NULL value in a nullable key column are left out of every
+    page: NULL can't be compared with a cursor key (and PostgreSQL would sort
+    it first), and filtering it keeps the index on the key columns usable.
+    """
+    forward = direction == NEXT
+    query = query.filter(*(column.isnot(None) for column in key_columns if column.nullable))
+    if key is not None:
+        key = tuple_(*key)
+        if forward == descending:
+            query = query.filter(tuple_(*key_columns) < key)
+        else:
+            query = query.filter(tuple_(*key_columns) > key)
+    order = [column.desc() if forward == descending else column.asc() for column in key_columns]
+    return query.order_by(None).order_by(*order)
+
+
+def build_page(rows, per_page, direction, has_cursor, row_key, total=None, total_is_exact=False):
+    """
+    Builds a KeysetPage from up to per_page + 1 rows fetched in `direction`
+    order (PREV pages are fetched in reverse and put back in display order).
+    """
+    has_more = len(rows) > per_page
+    rows = list(rows[:per_page])
+    if direction == PREV:
+        rows.reverse()
+    # Going forward, there are more rows if the extra one was fetched; going
+    # back, the extra row means there are rows before the page
+    has_next = has_more if direction == NEXT else True
+    has_prev = has_cursor if direction == NEXT else has_more
+    next_cursor = encode_cursor(NEXT, row_key(rows[-1])) if rows and has_next else None
+    prev_cursor = encode_cursor(PREV, row_key(rows[0])) if rows and has_prev else None
+    return KeysetPage(rows, next_cursor, prev_cursor, total, total_is_exact)
+
+
+def approximate_total(count):
+    """
+    Returns (total, exact) when the opt-in PAGINATION_APPROXIMATE_TOTAL
+    setting is enabled, else (None, False). `count(limit)` must count the
+    matching rows up to `limit`; it's called with PAGINATION_TOTAL_CAP + 1,
+    so the count costs the same on every page. Past the cap the total is the
+    cap and exact is False.
+    """
+    if not current_app.config.get('PAGINATION_APPROXIMATE_TOTAL'):
+        return None, False
+    cap = current_app.config.get('PAGINATION_TOTAL_CAP', 1000)
+    counted = count(cap + 1)
+    return min(counted, cap), counted <= cap
+
+
+def count_rows(query, limit):
+    """Counts the rows of an ORM query, reading at most `limit` of them."""
+    capped = query.order_by(None).limit(limit).subquery()
+    return db.session.execute(select(func.count()).select_from(capped)).scalar()
+
+
+def _dump(value):
+    return value.isoformat() if isinstance(value, (date, datetime)) else value
+
+
+def _load(column, value):
+    """The Python value of a cursor key value for `column`; raises ValueError if it isn't of the column's type."""
+    if value is None:
+        # Rows with NULL keys are never paginated, so no valid cursor holds one
+        raise ValueError(f"Expected a value for {column.key}")
+    if isinstance(column.type, (DateTime, Date)):
+        if not isinstance(value, str):
+            raise ValueError(f"Expected an ISO date for {column.key}")
+        parse = datetime.fromisoformat if isinstance(column.type, DateTime) else date.fromisoformat
+        return parse(value)
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return value
+    # JSON has no separate integer, float and boolean types to tell apart
+    if isinstance(value, bool) != (python_type is bool):
+        raise ValueError(f"Unexpected value type for {column.key}")
+    if python_type in (float, Decimal) and isinstance(value, (int, float)):
+        return value
+    if not isinstance(value, python_type):
+        raise ValueError(f"Unexpected value type for {column.key}")
+    return value
@@ -0,0 +1,124 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import delete, event, select, tuple_, update
+from sqlalchemy.orm import Session
+
+from models import Product, ProductTombstone
+from services.pagination import NEXT, decode_cursor, encode_cursor
+from services.table_versions import on_version_bump
+
+_DELETED_KEY = 'deleted_products'
+
+
+class InvalidChangeToken(ValueError):
+    pass
+
+
+def product_changes(session, since=None, limit=500, query=None):
+    """
+    Products created, updated or deleted after the `since` token (from the
+    start if None), in change order.
+
+    Returns (changed, deleted, next_token, has_more): the changed products,
+    the ProductTombstone rows, the token to pass next time and whether more
+    changes are waiting. `query` selects the changed products (Product
+    instances by default); its rows must have `id` and `change_seq`, e.g. a
+    serializers.PRODUCT.select() with those as extra columns. Raises
+    InvalidChangeToken for a malformed token.
+
+    Every committed change to products gets the products table version as its
+    change_seq (see _stamp_changes), so the cost depends on the number of
+    changes since the token, not on the catalog size.
+    """
+    after = (-1, -1)
+    if since:
+        decoded = decode_cursor(since)
+        if decoded is None or decoded[0] != NEXT or len(decoded[1]) != 2 \
+                or not all(isinstance(value, int) for value in decoded[1]):
+            raise InvalidChangeToken(since)
+        after = tuple(decoded[1])
+
+    if query is None:
+        query = session.query(Product)
+    changed = (
+        query
+        .filter(Product.change_seq.isnot(None), tuple_(Product.change_seq, Product.id) > tuple_(*after))
+        .order_by(Product.change_seq, Product.id)
+        .limit(limit + 1)
+        .all()
+    )
+    deleted = session.execute(
+        select(ProductTombstone)
+        .where(tuple_(ProductTombstone.change_seq, ProductTombstone.product_id) > tuple_(*after))
+        .order_by(ProductTombstone.change_seq, ProductTombstone.product_id)
+        .limit(limit + 1)
+    ).scalars().all()
+
+    # Merge both lists in (change_seq, id) order and keep the first `limit` changes
+    merged = sorted(
+        [((p.change_seq, p.id), False, p) for p in changed]
+        + [((t.change_seq, t.product_id), True, t) for t in deleted],
+        key=lambda entry: entry[0]
+    )
+    has_more = len(merged) > limit
+    merged = merged[:limit]
+    next_token = encode_cursor(NEXT, list(merged[-1][0] if merged else after))
+    return (
+        [row for _, is_tombstone, row in merged if not is_tombstone],
+        [row for _, is_tombstone, row in merged if is_tombstone],
+        next_token,
+        has_more
+    )
+
+
+def record_deleted(session, products):
+    """
+    Records products removed with a bulk DELETE, given as (id, slug,
+    external_id) tuples, so their tombstones are written at commit like those
+    of products deleted through the ORM.
+    """
+    deleted = session.info.setdefault(_DELETED_KEY, {})
+    for product_id, slug, external_id in products:
+        deleted[product_id] = (slug, external_id)
+
+
+@event.listens_for(Session, 'before_flush')
+def _track_product_changes(session, flush_context, instances):
+    for obj in session.dirty:
+        # change_seq is set again at commit time; NULL marks the row as changed
+        if isinstance(obj, Product) and session.is_modified(obj):
+            obj.change_seq = None
+    for obj in session.deleted:
+        if isinstance(obj, Product):
+            session.info.setdefault(_DELETED_KEY, {})[obj.id] = (obj.slug, obj.external_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_deleted(session):
+    session.info.pop(_DELETED_KEY, None)
+
+
+@on_version_bump(Product)
+def _stamp_changes(session, version):
+    """
+    Gives every product changed by the committing transaction the new table
+    version as change_seq, and records tombstones for deleted ones. Bulk
+    writes only have to leave change_seq NULL on the rows they touch.
+    """
+    products = Product.__table__
+    tombstones = ProductTombstone.__table__
+    session.execute(update(products).where(products.c.change_seq.is_(None)).values(change_seq=version))
+
+    deleted = session.info.pop(_DELETED_KEY, None)
+    if deleted:
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        session.execute(delete(tombstones).where(tombstones.c.product_id.in_(list(deleted))))
+        session.execute(tombstones.insert(), [
+            {'product_id': product_id, 'slug': slug, 'external_id': external_id,
+             'change_seq': version, 'deleted_at': now}
+            for product_id, (slug, external_id) in deleted.items()
+        ])
+    # A deleted id reused by a new product (SQLite may do that) is no longer deleted
+    session.execute(delete(tombstones).where(
+        tombstones.c.product_id.in_(select(products.c.id).where(products.c.change_seq == version))
+    ))
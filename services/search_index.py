@@ -0,0 +1,167 @@
+import re
+from collections import namedtuple
+
+from sqlalchemy import case, func, literal, or_, select, text, tuple_, union_all
+
+from extensions import db
+from models import Product, Article
+from services.pagination import NEXT, KeysetPage, approximate_total, build_page, decode_cursor
+
+# Products and guides share one index. On SQLite the FTS5 rowid encodes both
+# the row id and its kind (rowid = id * 2 + kind), so the triggers can
+# replace an entry without scanning the index.
+PRODUCT, ARTICLE = 'product', 'article'
+_SQLITE_KINDS = {0: PRODUCT, 1: ARTICLE}
+_SQLITE_KIND_BITS = {PRODUCT: 0, ARTICLE: 1}
+
+# Matches are ranked higher when they are in the name/title than in the body
+TITLE_WEIGHT = 10.0
+BODY_WEIGHT = 1.0
+
+SearchHit = namedtuple('SearchHit', ['kind', 'item', 'rank'])
+
+_TERM_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+
+def search_terms(query):
+    """Splits a free-text query into the words that will be searched (at most 10)."""
+    return _TERM_PATTERN.findall(query.lower())[:10]
+
+
+def search(query, cursor=None, per_page=9):
+    """
+    Searches products and guides and returns one merged KeysetPage of
+    SearchHit, best matches first. Every word must match, either as a whole
+    word or as the prefix of one ("auric" finds "auriculares").
+
+    Uses the FTS5 index on SQLite and the search_vector columns on PostgreSQL
+    (both created by migrations). Other databases fall back to LIKE scans.
+    Pages are keyset-paginated on (rank, kind, id), so following the cursors
+    never re-reads the rows of previous pages.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return KeysetPage([], None, None, 0, True)
+
+    decoded = decode_cursor(cursor)
+    direction, key = decoded if decoded else (NEXT, None)
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        run = _search_sqlite
+    elif dialect == 'postgresql':
+        run = _search_postgresql
+    else:
+        run = _search_like
+    if key is not None and not _valid_key(key):
+        direction, key = NEXT, None
+
+    total, total_is_exact = approximate_total(lambda limit: run(terms, direction, None, limit, count=True))
+    rows = run(terms, direction, key, per_page + 1)
+    page = build_page(rows, per_page, direction, key is not None, lambda row: row, total, total_is_exact)
+    return page._replace(items=_load_hits(page.items))
+
+
+def _valid_key(key):
+    """Whether a decoded cursor key is a (rank, kind, id) triple; a tampered one falls back to the first page."""
+    if len(key) != 3:
+        return False
+    rank, kind, item_id = key
+    return (isinstance(rank, (int, float)) and not isinstance(rank, bool)
+            and kind in (PRODUCT, ARTICLE)
+            and isinstance(item_id, int) and not isinstance(item_id, bool))
+
+
+def _search_sqlite(terms, direction, key, limit, count=False):
+    # Each term is quoted, so FTS5 operators typed by the user are searched as plain words
+    match = ' '.join('"{}"*'.format(term.replace('"', '""')) for term in terms)
+    if count:
+        return db.session.execute(text(
+            "SELECT count(*) FROM (SELECT 1 FROM search_index WHERE search_index MATCH :match LIMIT :limit)"
+        ), {'match': match, 'limit': limit}).scalar()
+
+    # bm25() is lower for better matches; it's negated so higher is better everywhere.
+    # (score, rowid) is unique, and the rowid gives back the (kind, id) part of the cursor key.
+    params = {'match': match, 'limit': limit,
+              'title_weight': TITLE_WEIGHT, 'body_weight': BODY_WEIGHT}
+    after = ''
+    if key is not None:
+        after = "WHERE (score, rowid) {} (:score, :rowid) ".format('<' if direction == NEXT else '>')
+        params.update(score=key[0], rowid=key[2] * 2 + _SQLITE_KIND_BITS[key[1]])
+    order = 'DESC' if direction == NEXT else 'ASC'
+    rows = db.session.execute(text(
+        "SELECT rowid, score FROM ("
+        "SELECT rowid, -bm25(search_index, :title_weight, :body_weight) AS score "
+        "FROM search_index WHERE search_index MATCH :match) "
+        f"{after}ORDER BY score {order}, rowid {order} LIMIT :limit"
+    ), params).all()
+    return [(score, _SQLITE_KINDS[rowid & 1], rowid >> 1) for rowid, score in rows]
+
+
+def _search_postgresql(terms, direction, key, limit, count=False):
+    tsquery = ' & '.join(f"{term}:*" for term in terms)
+    params = {'tsquery': tsquery, 'limit': limit}
+    matches = (
+        "SELECT 'product' AS kind, id, ts_rank_cd(search_vector, q) AS rank "
+        "FROM products, to_tsquery('simple', :tsquery) q WHERE search_vector @@ q "
+        "UNION ALL "
+        "SELECT 'article' AS kind, id, ts_rank_cd(search_vector, q) AS rank "
+        "FROM articles, to_tsquery('simple', :tsquery) q WHERE search_vector @@ q"
+    )
+    if count:
+        return db.session.execute(
+            text(f"SELECT count(*) FROM ({matches} LIMIT :limit) AS matches"), params
+        ).scalar()
+
+    after = ''
+    if key is not None:
+        after = "WHERE (rank, kind, id) {} (:rank, :kind, :id) ".format('<' if direction == NEXT else '>')
+        params.update(rank=key[0], kind=key[1], id=key[2])
+    order = 'DESC' if direction == NEXT else 'ASC'
+    rows = db.session.execute(text(
+        f"SELECT rank, kind, id FROM ({matches}) AS matches "
+        f"{after}ORDER BY rank {order}, kind {order}, id {order} LIMIT :limit"
+    ), params).all()
+    return [tuple(row) for row in rows]
+
+
+def _search_like(terms, direction, key, limit, count=False):
+    def ranked(model, kind, title, body):
+        title_matches = [title.ilike(f'%{term}%') for term in terms]
+        return select(
+            case(*((matched, TITLE_WEIGHT) for matched in title_matches), else_=BODY_WEIGHT).label('rank'),
+            literal(kind).label('kind'),
+            model.id.label('id')
+        ).where(*(or_(title.ilike(f'%{term}%'), body.ilike(f'%{term}%')) for term in terms))
+
+    matches = union_all(
+        ranked(Product, PRODUCT, Product.name, Product.description),
+        ranked(Article, ARTICLE, Article.title, Article.content)
+    ).subquery()
+    if count:
+        capped = select(matches.c.id).limit(limit).subquery()
+        return db.session.execute(select(func.count()).select_from(capped)).scalar()
+
+    columns = (matches.c.rank, matches.c.kind, matches.c.id)
+    stmt = select(*columns)
+    if key is not None:
+        comparison = tuple_(*columns) < tuple_(*key) if direction == NEXT else tuple_(*columns) > tuple_(*key)
+        stmt = stmt.where(comparison)
+    order = [column.desc() if direction == NEXT else column.asc() for column in columns]
+    return [tuple(row) for row in db.session.execute(stmt.order_by(*order).limit(limit)).all()]
+
+
+def _load_hits(ranked):
+    """Loads the ranked (rank, kind, id) rows with one query per kind, keeping the ranking order."""
+    ids = {PRODUCT: [], ARTICLE: []}
+    for _, kind, row_id in ranked:
+        ids[kind].append(row_id)
+    items = {
+        PRODUCT: {p.id: p for p in Product.query.filter(Product.id.in_(ids[PRODUCT]))} if ids[PRODUCT] else {},
+        ARTICLE: {a.id: a for a in Article.query.filter(Article.id.in_(ids[ARTICLE]))} if ids[ARTICLE] else {},
+    }
+    hits = []
+    for rank, kind, row_id in ranked:
+        item = items[kind].get(row_id)
+        if item is not None:  # Deleted between the two queries
+            hits.append(SearchHit(kind, item, rank))
+    return hits
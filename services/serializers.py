@@ -0,0 +1,133 @@
+import json
+from collections import namedtuple
+
+from flask import Response
+from sqlalchemy import Date, DateTime
+
+from extensions import db
+from models import Product, Category, Subcategory, Article, Testimonial
+
+try:
+    import orjson
+except ImportError:  # Optional: the standard library encoder is used instead
+    orjson = None
+
+# A relation that can be embedded: the related model, its fields (the first
+# one must be the primary key) and the joins needed to reach it.
+Relation = namedtuple('Relation', ['model', 'fields', 'joins'])
+
+
+def dumps(data):
+    """Encodes data as compact UTF-8 JSON bytes, with orjson when it's installed."""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def json_response(data, status=200):
+    return Response(dumps(data), status=status, mimetype='application/json')
+
+
+class Schema:
+    """
+    Serializer for one model, working on column tuples instead of ORM instances.
+
+    columns() gives the columns to select for a field selection, and
+    serializer() returns a function turning one result row of those columns
+    into a dict. That function is generated and compiled once per selection
+    (a single dict literal reading the row by position, dates converted
+    inline), so serializing a row costs no attribute lookups, no loops and
+    no ORM instance.
+    """
+
+    def __init__(self, model, fields, relations=None):
+        self.model = model
+        self.fields = tuple(fields)
+        self.relations = relations or {}
+        self._compiled = {}
+
+    def columns(self, fields=None, include=()):
+        """Columns to select, in the order serializer() expects them."""
+        fields = self.fields if fields is None else fields
+        columns = [getattr(self.model, field) for field in fields]
+        for name in include:
+            relation = self.relations[name]
+            columns += [getattr(relation.model, field).label(f'{name}__{field}') for field in relation.fields]
+        return columns
+
+    def select(self, fields=None, include=(), extra=()):
+        """
+        Query for the given selection, with the joins the included relations
+        need. `extra` columns (pagination keys, ...) are appended after the
+        serialized ones, so they are available on the rows but not in the
+        output. Columns already selected as fields are not added twice.
+        """
+        fields = self.fields if fields is None else fields
+        extra = {column.key: column for column in extra if column.key not in fields}
+        query = db.session.query(*self.columns(fields, include), *extra.values())
+        joined = []
+        for name in include:
+            for target, onclause in self.relations[name].joins:
+                if target not in joined:
+                    query = query.outerjoin(target, onclause)
+                    joined.append(target)
+        return query
+
+    def serializer(self, fields=None, include=()):
+        """Compiled row -> dict function for a field selection (cached)."""
+        fields = self.fields if fields is None else tuple(fields)
+        include = tuple(include)
+        key = (fields, include)
+        function = self._compiled.get(key)
+        if function is None:
+            function = self._compiled[key] = self._compile(fields, include)
+        return function
+
+    def serialize(self, row, fields=None, include=()):
+        return self.serializer(fields, include)(row)
+
+    def _compile(self, fields, include):
+        index = 0
+        items = []
+        for field in fields:
+            items.append(f'{field!r}: {_value(getattr(self.model, field), index)}')
+            index += 1
+        for name in include:
+            relation = self.relations[name]
+            id_index = index
+            nested = []
+            for field in relation.fields:
+                nested.append(f'{field!r}: {_value(getattr(relation.model, field), index)}')
+                index += 1
+            # An outer join without a match gives NULL for every column of the relation
+            items.append(f'{name!r}: {{{", ".join(nested)}}} if row[{id_index}] is not None else None')
+        source = f'def serialize(row):\n    return {{{", ".join(items)}}}\n'
+        namespace = {}
+        exec(compile(source, f'<serializer {self.model.__name__}>', 'exec'), namespace)
+        return namespace['serialize']
+
+
+def _value(column, index):
+    if isinstance(column.type, (DateTime, Date)):
+        return f'(row[{index}].isoformat() if row[{index}] is not None else None)'
+    return f'row[{index}]'
+
+
+PRODUCT = Schema(
+    Product,
+    ('id', 'name', 'slug', 'price', 'description', 'image', 'link',
+     'subcategory_id', 'external_id', 'created_at', 'updated_at'),
+    relations={
+        'subcategory': Relation(Subcategory, ('id', 'name', 'slug'), [
+            (Subcategory, Product.subcategory_id == Subcategory.id),
+        ]),
+        'category': Relation(Category, ('id', 'name', 'slug'), [
+            (Subcategory, Product.subcategory_id == Subcategory.id),
+            (Category, Subcategory.category_id == Category.id),
+        ]),
+    }
+)
+CATEGORY = Schema(Category, ('id', 'name', 'slug'))
+SUBCATEGORY = Schema(Subcategory, ('id', 'name', 'slug', 'category_id'))
+ARTICLE = Schema(Article, ('id', 'title', 'slug', 'content', 'author', 'date_posted', 'image'))
+TESTIMONIAL = Schema(Testimonial, ('id', 'author', 'content', 'date_posted', 'likes', 'dislikes'))
@@ -0,0 +1,379 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+# How stale the recorded last access of an entry may get before a read updates it;
+# keeps reads from turning into writes while still giving a usable LRU order
+_ACCESS_RESOLUTION = 5.0
+
+
+class MemoryBackend:
+    """Process-local backend: an LRU OrderedDict. For development, tests and single-worker deployments."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._generations = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, value, tags, expires_at):
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (value, tags, expires_at)
+            self._size += len(value)
+            now = time.time()
+            # Expired entries go first, then the least recently used ones
+            for old_key, (_, _, old_expires_at) in list(self._entries.items()):
+                if self._size <= self.max_bytes:
+                    break
+                if old_expires_at is not None and old_expires_at <= now:
+                    self._discard(old_key)
+            while self._size > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+
+    def delete(self, key):
+        with self._lock:
+            self._discard(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def generations(self, names):
+        with self._lock:
+            return {name: self._generations[name] for name in names}
+
+    def bump(self, names):
+        with self._lock:
+            for name in names:
+                self._generations[name] += 1
+            return {name: self._generations[name] for name in names}
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= len(entry[0])
+
+
+class SQLiteBackend:
+    """
+    Backend shared by every process of the host: one SQLite file in WAL mode,
+    memory-mapped, so readers never block each other or the writer. The total
+    size of the values is kept in a counter row, and writes that push it past
+    max_bytes evict expired entries first and then the least recently used.
+    """
+
+    def __init__(self, path, max_bytes, mmap_bytes=64 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.mmap_bytes = mmap_bytes
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = self._connection()
+        with connection:
+            connection.executescript(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "  key TEXT PRIMARY KEY, value BLOB NOT NULL, tags TEXT, size INTEGER NOT NULL,"
+                "  expires_at REAL, accessed_at REAL NOT NULL);"
+                "CREATE INDEX IF NOT EXISTS ix_entries_accessed_at ON entries (accessed_at);"
+                "CREATE INDEX IF NOT EXISTS ix_entries_expires_at ON entries (expires_at);"
+                "CREATE TABLE IF NOT EXISTS generations (name TEXT PRIMARY KEY, value INTEGER NOT NULL);"
+                "CREATE TABLE IF NOT EXISTS stats (id INTEGER PRIMARY KEY CHECK (id = 1), total_size INTEGER NOT NULL);"
+                "INSERT OR IGNORE INTO stats (id, total_size) VALUES (1, 0);"
+            )
+
+    def _connection(self):
+        # One connection per thread, and a new one after a fork (gunicorn preload)
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(f'PRAGMA mmap_size={int(self.mmap_bytes)}')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def get(self, key):
+        connection = self._connection()
+        row = connection.execute(
+            "SELECT value, tags, expires_at, accessed_at FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, tags, expires_at, accessed_at = row
+        now = time.time()
+        if now - accessed_at > _ACCESS_RESOLUTION:
+            connection.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+        return value, json.loads(tags) if tags else {}, expires_at
+
+    def set(self, key, value, tags, expires_at):
+        connection = self._connection()
+        now = time.time()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            old = connection.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            connection.execute(
+                "INSERT OR REPLACE INTO entries (key, value, tags, size, expires_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, value, json.dumps(tags) if tags else None, len(value), expires_at, now)
+            )
+            connection.execute(
+                "UPDATE stats SET total_size = total_size + ? WHERE id = 1", (len(value) - (old[0] if old else 0),)
+            )
+            self._evict(connection, now)
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+    def _evict(self, connection, now):
+        total = connection.execute("SELECT total_size FROM stats WHERE id = 1").fetchone()[0]
+        queries = (
+            ("SELECT key, size FROM entries WHERE expires_at <= ? ORDER BY expires_at LIMIT 200", (now,)),
+            ("SELECT key, size FROM entries ORDER BY accessed_at LIMIT 200", ()),
+        )
+        for query, params in queries:
+            while total > self.max_bytes:
+                victims = connection.execute(query, params).fetchall()
+                if not victims:
+                    break
+                for victim_key, size in victims:
+                    connection.execute("DELETE FROM entries WHERE key = ?", (victim_key,))
+                    total -= size
+                    if total <= self.max_bytes:
+                        break
+        connection.execute("UPDATE stats SET total_size = ? WHERE id = 1", (total,))
+
+    def delete(self, key):
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            old = connection.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            if old:
+                connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+                connection.execute("UPDATE stats SET total_size = total_size - ? WHERE id = 1", (old[0],))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+    def clear(self):
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute("DELETE FROM entries")
+            connection.execute("UPDATE stats SET total_size = 0 WHERE id = 1")
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+    def generations(self, names):
+        names = list(names)
+        if not names:
+            return {}
+        placeholders = ', '.join('?' * len(names))
+        rows = self._connection().execute(
+            f"SELECT name, value FROM generations WHERE name IN ({placeholders})", names
+        ).fetchall()
+        found = dict(rows)
+        return {name: found.get(name, 0) for name in names}
+
+    def bump(self, names):
+        names = list(names)
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            for name in names:
+                connection.execute(
+                    "INSERT INTO generations (name, value) VALUES (?, 1) "
+                    "ON CONFLICT (name) DO UPDATE SET value = value + 1", (name,)
+                )
+            generations = self.generations(names)
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return generations
+
+
+class SharedCache:
+    """
+    Byte cache shared by the gunicorn workers of a host, plus an invalidation
+    channel between them.
+
+    With CACHE_BACKEND = 'sqlite' (the default) entries live in one SQLite
+    file (CACHE_PATH, in WAL mode and memory-mapped), so every worker reads
+    and fills the same copy; 'memory' keeps a process-local copy instead.
+    Entries expire after their TTL, and the store never grows past
+    CACHE_MAX_BYTES: expired entries are evicted first, then the least
+    recently used.
+
+    Entries can carry tags. invalidate(*tags) bumps the generation of those
+    tags, which makes every entry stored with an older generation a miss in
+    all workers at once. Caches that keep Python objects in each process
+    subscribe() to a tag instead: their callback runs in the other workers
+    at the start of their next request (checked at most every
+    CACHE_INVALIDATION_POLL seconds) after a worker invalidated it.
+
+    Errors of the store are printed and treated as misses, so a broken cache
+    file never breaks a page.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.backend = None
+        self._subscribers = defaultdict(list)
+        self._seen = {}
+        self._polled_at = 0.0
+        self._poll_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CACHE_BACKEND', 'sqlite')
+        app.config.setdefault('CACHE_PATH', os.path.join(app.instance_path, 'cache.sqlite3'))
+        app.config.setdefault('CACHE_MAX_BYTES', 64 * 1024 * 1024)
+        app.config.setdefault('CACHE_INVALIDATION_POLL', 1.0)
+        self.app = app
+        app.extensions['shared_cache'] = self
+        max_bytes = app.config['CACHE_MAX_BYTES']
+        if app.config['CACHE_BACKEND'] == 'memory':
+            self.backend = MemoryBackend(max_bytes)
+        elif app.config['CACHE_BACKEND'] == 'sqlite':
+            try:
+                self.backend = SQLiteBackend(app.config['CACHE_PATH'], max_bytes)
+            except (sqlite3.Error, OSError) as e:
+                print(f"Could not open the shared cache at {app.config['CACHE_PATH']}, using a process-local one: {e}")
+                self.backend = MemoryBackend(max_bytes)
+        else:
+            raise ValueError(f"Unknown CACHE_BACKEND: {app.config['CACHE_BACKEND']}")
+        self._seen = self._generations(self._subscribers)
+        app.before_request(self.poll)
+
+    def get(self, key):
+        """Returns the bytes stored for key, or None if missing, expired or invalidated by a tag."""
+        try:
+            entry = self.backend.get(key)
+            if entry is None:
+                return None
+            value, tags, expires_at = entry
+            stale = expires_at is not None and expires_at <= time.time()
+            if not stale and tags:
+                stale = self.backend.generations(tags) != tags
+            if stale:
+                self.backend.delete(key)
+                return None
+            return value
+        except sqlite3.Error as e:
+            print(f"Shared cache read failed for {key}: {e}")
+            return None
+
+    def set(self, key, value, ttl=None, tags=(), generations=None):
+        """
+        Stores bytes under key for `ttl` seconds (no expiry if None), tagged
+        with `tags`. Pass the generations() taken before building the value to
+        skip storing it if one of its tags was invalidated in the meantime.
+        """
+        if len(value) > self.app.config['CACHE_MAX_BYTES']:
+            return
+        try:
+            current = self.backend.generations(tags) if tags else {}
+            if generations is not None and any(current[tag] != generations.get(tag) for tag in current):
+                return
+            expires_at = time.time() + ttl if ttl is not None else None
+            self.backend.set(key, value, current, expires_at)
+        except sqlite3.Error as e:
+            print(f"Shared cache write failed for {key}: {e}")
+
+    def delete(self, key):
+        try:
+            self.backend.delete(key)
+        except sqlite3.Error as e:
+            print(f"Shared cache delete failed for {key}: {e}")
+
+    def clear(self):
+        try:
+            self.backend.clear()
+        except sqlite3.Error as e:
+            print(f"Shared cache clear failed: {e}")
+
+    def generations(self, *tags):
+        """Current generation of each tag, to pass to set()."""
+        return self._generations(tags)
+
+    def invalidate(self, *tags):
+        """
+        Invalidates the entries stored with any of the tags, in every worker,
+        and notifies the subscribers of the other workers. Subscribers of this
+        process are not called: the caller already updated its own state.
+        """
+        if not tags:
+            return
+        try:
+            bumped = self.backend.bump(tags)
+        except sqlite3.Error as e:
+            print(f"Shared cache invalidation failed for {', '.join(tags)}: {e}")
+            return
+        with self._poll_lock:
+            for tag, generation in bumped.items():
+                seen = self._seen.get(tag)
+                # Someone else bumped the tag too since the last poll: their change is pending here
+                if tag in self._subscribers and seen is not None and generation != seen + 1:
+                    self._notify(tag)
+                if tag in self._subscribers:
+                    self._seen[tag] = generation
+
+    def subscribe(self, tag, callback):
+        """Registers callback() to run when another worker invalidates `tag`."""
+        if callback not in self._subscribers[tag]:
+            self._subscribers[tag].append(callback)
+        if self.backend is not None and tag not in self._seen:
+            self._seen.update(self._generations([tag]))
+
+    def poll(self):
+        """Runs the subscribers of the tags other workers invalidated. Cheap enough for every request."""
+        if not self._subscribers or time.monotonic() - self._polled_at < self.app.config['CACHE_INVALIDATION_POLL']:
+            return
+        if not self._poll_lock.acquire(blocking=False):
+            return  # Another thread of this worker is already polling
+        try:
+            self._polled_at = time.monotonic()
+            for tag, generation in self._generations(self._subscribers).items():
+                if self._seen.get(tag) != generation:
+                    self._seen[tag] = generation
+                    self._notify(tag)
+        finally:
+            self._poll_lock.release()
+
+    def _notify(self, tag):
+        for callback in self._subscribers[tag]:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Error running cache invalidation callback {getattr(callback, '__qualname__', callback)}: {e}")
+
+    def _generations(self, tags):
+        try:
+            return self.backend.generations(list(tags))
+        except sqlite3.Error as e:
+            print(f"Shared cache generations read failed: {e}")
+            return {}
+
+
+shared_cache = SharedCache()
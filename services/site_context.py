@@ -0,0 +1,179 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from sqlalchemy.orm import joinedload
+
+from models import SocialMediaLink, AdsenseConfig, Advertisement, Product
+from services.change_tracking import on_commit
+from services.shared_cache import shared_cache
+
+_EMPTY_ADSENSE = dict(
+    adsense_client_id='',
+    adsense_slot_header='',
+    adsense_slot_sidebar='',
+    adsense_slot_article_top='',
+    adsense_slot_article_bottom=''
+)
+
+_CONTEXT_TABLES = {SocialMediaLink.__tablename__, AdsenseConfig.__tablename__}
+_ADVERTISEMENT_TABLES = {Advertisement.__tablename__, Product.__tablename__}
+# Invalidation channel tags, so every worker drops its copy of the changed part
+_CONTEXT_TAG = 'site-context'
+_ADVERTISEMENT_TAG = 'site-context-ads'
+
+
+def _snapshot(obj):
+    """Copies the column values of a model instance into a plain, session-independent object."""
+    return SimpleNamespace(**{column.key: getattr(obj, column.key) for column in obj.__table__.columns})
+
+
+class SiteContextCache:
+    """
+    Cache of the data every page's layout needs: visible social media links,
+    the AdSense configuration and the active advertisements.
+
+    The data is loaded on the first render and then served from memory for
+    SITE_CONTEXT_TTL seconds, or until a commit changes social media links,
+    the AdSense configuration, advertisements or products (ads embed their
+    product), in this worker right away and in the other workers at their
+    next request (through the shared cache's invalidation channel). Cached
+    rows are detached snapshots, so templates can read them without touching
+    the database.
+
+    Active advertisements are cached on their own and also expire at the next
+    start_date or end_date of a scheduled ad, so ads switch on and off on time
+    without querying the table on every request.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._context = None
+        self._expires_at = 0.0
+        self._ads = None
+        self._ads_expires_at = 0.0
+        self._ads_valid_until = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SITE_CONTEXT_TTL', 300)
+        self.app = app
+        app.extensions['site_context'] = self
+        on_commit(SocialMediaLink, AdsenseConfig, Advertisement, Product)(self.invalidate)
+        shared_cache.subscribe(_CONTEXT_TAG, self._drop_context)
+        shared_cache.subscribe(_ADVERTISEMENT_TAG, self._drop_advertisements)
+
+    def get(self):
+        """Returns the cached context, reloading the parts that expired or were invalidated."""
+        context, ads = self._context, self._ads
+        if context is None or ads is None or self._expired():
+            with self._lock:
+                if self._context is None or time.monotonic() >= self._expires_at:
+                    self._context = self._load()
+                    self._expires_at = time.monotonic() + self.app.config['SITE_CONTEXT_TTL']
+                if self._ads is None or self._ads_expired():
+                    self._ads, self._ads_valid_until = self._load_advertisements()
+                    self._ads_expires_at = time.monotonic() + self.app.config['SITE_CONTEXT_TTL']
+                context, ads = self._context, self._ads
+        return dict(context, active_advertisements=ads)
+
+    def invalidate(self, changed_tables=None):
+        """
+        Drops the cached data in every worker; with `changed_tables`, only the
+        parts built from those tables.
+        """
+        tags = []
+        if changed_tables is None or changed_tables & _CONTEXT_TABLES:
+            self._drop_context()
+            tags.append(_CONTEXT_TAG)
+        if changed_tables is None or changed_tables & _ADVERTISEMENT_TABLES:
+            self._drop_advertisements()
+            tags.append(_ADVERTISEMENT_TAG)
+        shared_cache.invalidate(*tags)
+
+    def _drop_context(self):
+        self._context = None
+        self._expires_at = 0.0
+
+    def _drop_advertisements(self):
+        self._ads = None
+        self._ads_expires_at = 0.0
+        self._ads_valid_until = None
+
+    def seconds_until_ads_change(self):
+        """Seconds until a scheduled ad starts or ends (None if none is scheduled or nothing is loaded)."""
+        valid_until = self._ads_valid_until
+        if valid_until is None:
+            return None
+        return max(0.0, (valid_until - datetime.now(timezone.utc)).total_seconds())
+
+    def _expired(self):
+        return time.monotonic() >= self._expires_at or self._ads_expired()
+
+    def _ads_expired(self):
+        if time.monotonic() >= self._ads_expires_at:
+            return True
+        valid_until = self._ads_valid_until
+        return valid_until is not None and datetime.now(timezone.utc) >= valid_until
+
+    def _load(self):
+        context = {}
+        links = SocialMediaLink.query.filter_by(is_visible=True).order_by(SocialMediaLink.order_num).all()
+        context['social_media_links'] = [_snapshot(link) for link in links]
+
+        context.update(_EMPTY_ADSENSE)
+        try:
+            config = AdsenseConfig.query.first()
+            if config:
+                context.update(
+                    adsense_client_id=config.adsense_client_id,
+                    adsense_slot_header=config.adsense_slot_header,
+                    adsense_slot_sidebar=config.adsense_slot_sidebar,
+                    adsense_slot_article_top=config.adsense_slot_article_top,
+                    adsense_slot_article_bottom=config.adsense_slot_article_bottom
+                )
+        except Exception:
+            pass
+
+        return context
+
+    def _load_advertisements(self):
+        """
+        Returns the active advertisements and the instant at which that set
+        changes next (None if no ad is scheduled to start or end).
+        """
+        now_utc = datetime.now(timezone.utc)
+        # Ads that haven't started yet are loaded too, to know when they start
+        candidates = Advertisement.query.options(joinedload(Advertisement.product)).filter(
+            Advertisement.is_active,
+            (Advertisement.end_date.is_(None)) | (Advertisement.end_date >= now_utc)
+        ).all()
+
+        active_ads = []
+        boundaries = []
+        for ad in candidates:
+            start_date, end_date = _as_utc(ad.start_date), _as_utc(ad.end_date)
+            if start_date is not None and start_date > now_utc:
+                boundaries.append(start_date)
+                continue
+            if end_date is not None:
+                if end_date < now_utc:
+                    continue
+                # The ad is shown up to and including its end_date
+                boundaries.append(end_date + timedelta(microseconds=1))
+            ad_snapshot = _snapshot(ad)
+            ad_snapshot.product = _snapshot(ad.product) if ad.product else None
+            active_ads.append(ad_snapshot)
+        return active_ads, min(boundaries, default=None)
+
+
+def _as_utc(value):
+    # Schedule dates are stored as naive UTC datetimes
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+site_context = SiteContextCache()
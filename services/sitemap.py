@@ -0,0 +1,179 @@
+import zlib
+from urllib.parse import quote
+from xml.sax.saxutils import escape
+
+from flask import Response, abort, request, stream_with_context, url_for
+from sqlalchemy import func, select
+
+from extensions import db
+from models import Product, Article
+from services.change_tracking import on_commit
+from services.shared_cache import shared_cache
+
+_URLSET_OPEN = '<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+_URLSET_CLOSE = '</urlset>\n'
+_INDEX_OPEN = '<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+_INDEX_CLOSE = '</sitemapindex>\n'
+
+# Static pages: (endpoint, changefreq, priority)
+STATIC_PAGES = [
+    ('public.index', 'daily', '1.0'),
+    ('public.show_categories', 'weekly', '0.8'),
+    ('public.about', 'monthly', '0.7'),
+    ('public.contact', 'monthly', '0.6'),
+    ('public.guides', 'weekly', '0.9'),
+    ('public.privacy_policy', 'monthly', '0.5'),
+    ('public.terms_conditions', 'monthly', '0.5'),
+    ('public.cookie_policy', 'monthly', '0.5'),
+]
+
+# Sitemap kind -> (model, endpoint, lastmod column). Articles have no
+# updated_at, their publication date is used instead.
+_KINDS = {
+    'products': (Product, 'public.product_detail', Product.updated_at),
+    'guides': (Article, 'public.guide_detail', Article.date_posted),
+}
+
+_SLUG_PLACEHOLDER = 'SITEMAP-SLUG'
+_CACHE_TAG = 'sitemap'
+
+
+class SitemapCache:
+    """
+    Streams sitemap.xml and keeps the gzip-compressed result in the shared cache.
+
+    Only the slug and lastmod columns are selected, in batches, and the XML
+    is written as it's read, so memory doesn't grow with the catalog. Up to
+    SITEMAP_MAX_URLS URLs, /sitemap.xml is a single urlset; past that it
+    becomes a sitemap index pointing to /sitemap-pages.xml,
+    /sitemap-products-<n>.xml and /sitemap-guides-<n>.xml. The first request
+    streams the document while compressing it; later ones, in any worker,
+    are served from the cache until a commit changes products or articles.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SITEMAP_MAX_URLS', 50000)
+        app.config.setdefault('SITEMAP_CACHE_MAX_AGE', 3600)
+        self.app = app
+        app.extensions['sitemap'] = self
+        on_commit(Product, Article)(self.invalidate)
+
+    def invalidate(self, changed_tables=None):
+        shared_cache.invalidate(_CACHE_TAG)
+
+    def response(self, name='index'):
+        """Response for /sitemap.xml (name 'index') or /sitemap-<name>.xml. Aborts with 404 for unknown names."""
+        base_url = request.url_root.rstrip('/')
+        key = f'sitemap:{base_url}:{name}'
+        accepts_gzip = 'gzip' in request.accept_encodings
+        cached = shared_cache.get(key)
+        if cached is not None:
+            body = cached if accepts_gzip else zlib.decompress(cached, 31)
+        else:
+            generations = shared_cache.generations(_CACHE_TAG)
+            chunks = self._document(name, base_url)
+            body = stream_with_context(self._compress_and_cache(key, chunks, generations, accepts_gzip))
+
+        response = Response(body, mimetype='application/xml')
+        if accepts_gzip:
+            response.headers['Content-Encoding'] = 'gzip'
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.cache_control.public = True
+        response.cache_control.max_age = self.app.config['SITEMAP_CACHE_MAX_AGE']
+        return response
+
+    def _compress_and_cache(self, key, chunks, generations, compressed):
+        # wbits=31 writes a gzip container
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        parts = []
+        for chunk in chunks:
+            data = chunk.encode('utf-8')
+            gzipped = compressor.compress(data)
+            if gzipped:
+                parts.append(gzipped)
+            yield gzipped if compressed else data
+        gzipped = compressor.flush()
+        parts.append(gzipped)
+        if compressed:
+            yield gzipped
+        # Not stored if products or articles changed while it was being generated
+        shared_cache.set(key, b''.join(parts), tags=(_CACHE_TAG,), generations=generations)
+
+    def _document(self, name, base_url):
+        """Validates the sitemap name and returns a generator of its XML chunks."""
+        max_urls = self.app.config['SITEMAP_MAX_URLS']
+        counts = {kind: _count(model) for kind, (model, _, _) in _KINDS.items()}
+        single = len(STATIC_PAGES) + sum(counts.values()) <= max_urls
+
+        if name == 'index':
+            if single:
+                return self._urlset(base_url, self._all_entries(base_url))
+            return self._index(base_url, counts, max_urls)
+        if single:
+            abort(404)
+        if name == 'pages':
+            return self._urlset(base_url, _static_entries(base_url))
+        kind, _, number = name.rpartition('-')
+        if kind not in _KINDS or not number.isdigit():
+            abort(404)
+        number = int(number)
+        if not 1 <= number <= _shard_count(counts[kind], max_urls):
+            abort(404)
+        return self._urlset(base_url, self._entries(kind, base_url, (number - 1) * max_urls, max_urls))
+
+    def _urlset(self, base_url, entries):
+        yield _URLSET_OPEN
+        for loc, lastmod, changefreq, priority in entries:
+            parts = ['<url><loc>', escape(loc), '</loc>']
+            if lastmod is not None:
+                parts += ['<lastmod>', lastmod.strftime('%Y-%m-%d'), '</lastmod>']
+            parts += ['<changefreq>', changefreq, '</changefreq><priority>', priority, '</priority></url>\n']
+            yield ''.join(parts)
+        yield _URLSET_CLOSE
+
+    def _index(self, base_url, counts, max_urls):
+        yield _INDEX_OPEN
+        names = ['pages']
+        for kind, count in counts.items():
+            names += [f'{kind}-{number}' for number in range(1, _shard_count(count, max_urls) + 1)]
+        for name in names:
+            loc = base_url + url_for('public.sitemap_part', name=name)
+            yield f'<sitemap><loc>{escape(loc)}</loc></sitemap>\n'
+        yield _INDEX_CLOSE
+
+    def _all_entries(self, base_url):
+        yield from _static_entries(base_url)
+        for kind in _KINDS:
+            yield from self._entries(kind, base_url)
+
+    def _entries(self, kind, base_url, offset=0, limit=None):
+        model, endpoint, lastmod_column = _KINDS[kind]
+        prefix, suffix = (base_url + url_for(endpoint, slug=_SLUG_PLACEHOLDER)).split(_SLUG_PLACEHOLDER)
+        stmt = select(model.slug, lastmod_column).order_by(model.id).offset(offset)
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        # Rows are fetched in batches instead of loading the whole table
+        result = db.session.execute(stmt.execution_options(yield_per=1000))
+        for slug, lastmod in result:
+            yield prefix + quote(slug) + suffix, lastmod, 'weekly', '0.8'
+
+
+def _static_entries(base_url):
+    for endpoint, changefreq, priority in STATIC_PAGES:
+        yield base_url + url_for(endpoint), None, changefreq, priority
+
+
+def _count(model):
+    return db.session.execute(select(func.count()).select_from(model)).scalar()
+
+
+def _shard_count(count, max_urls):
+    return max(1, (count + max_urls - 1) // max_urls)
+
+
+sitemaps = SitemapCache()
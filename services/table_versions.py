@@ -0,0 +1,126 @@
+import hashlib
+from collections import defaultdict
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import make_response, request
+from sqlalchemy import event, select, update
+from sqlalchemy.orm import Session
+
+from extensions import db
+from models import TableVersion
+from services.change_tracking import changed_tables
+
+# Tables whose version is kept; registered by conditional_get() and on_version_bump()
+_versioned_tables = set()
+# Table name -> callbacks run in the committing transaction, right after its version is bumped
+_bump_callbacks = defaultdict(list)
+
+
+def on_version_bump(model):
+    """
+    Registers a callback(session, version) that runs inside every transaction
+    that changes `model`, right after its table version was bumped to
+    `version` and before the commit. Since versions are bumped under a row
+    lock held until the commit, they follow the commit order, which makes
+    them usable as change sequence numbers.
+    """
+    _versioned_tables.add(model.__tablename__)
+
+    def decorator(callback):
+        if callback not in _bump_callbacks[model.__tablename__]:
+            _bump_callbacks[model.__tablename__].append(callback)
+        return callback
+    return decorator
+
+
+def versions(*models):
+    """
+    Returns {table_name: (version, changed_at)} for the given models with a
+    single primary key lookup. Tables that never changed have version 0.
+    """
+    names = [model.__tablename__ for model in models]
+    rows = db.session.execute(
+        select(TableVersion.table_name, TableVersion.version, TableVersion.changed_at)
+        .where(TableVersion.table_name.in_(names))
+    ).all()
+    found = {name: (version, changed_at) for name, version, changed_at in rows}
+    return {name: found.get(name, (0, None)) for name in names}
+
+
+def conditional_get(*models, representation=None):
+    """
+    Adds conditional GET support to a view whose output only depends on the
+    given models (and on the request URL).
+
+    For views that negotiate their format from the Accept header,
+    `representation` is a callable returning the format this request will
+    get (e.g. 'json' or 'ndjson'); it is part of the ETag, so one format's
+    ETag never validates the other, and the response gets Vary: Accept.
+
+    The response gets a strong ETag built from the URL and the versions of
+    those tables, and a Last-Modified from their last change. A request with
+    a matching If-None-Match, or an If-Modified-Since not older than the last
+    change, gets a 304 after one query on table_versions, without running
+    the view or loading any row.
+    """
+    _versioned_tables.update(model.__tablename__ for model in models)
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(*args, **kwargs)
+
+            table_versions = versions(*models)
+            parts = [request.full_path]
+            if representation is not None:
+                parts.append(representation())
+            fingerprint = '|'.join(
+                parts + [f'{name}:{version}' for name, (version, _) in sorted(table_versions.items())]
+            )
+            etag = hashlib.blake2b(fingerprint.encode('utf-8'), digest_size=12).hexdigest()
+            changes = [changed_at for _, changed_at in table_versions.values() if changed_at is not None]
+            last_modified = max(changes).replace(microsecond=0) if changes else None
+
+            not_modified = False
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains(etag)
+            elif request.if_modified_since and last_modified is not None:
+                not_modified = last_modified.replace(tzinfo=timezone.utc) <= request.if_modified_since
+
+            response = make_response('', 304) if not_modified else make_response(view(*args, **kwargs))
+            if response.status_code in (200, 304):
+                response.set_etag(etag)
+                if last_modified is not None:
+                    response.last_modified = last_modified.replace(tzinfo=timezone.utc)
+                if representation is not None:
+                    response.vary.add('Accept')
+            return response
+        return wrapper
+    return decorator
+
+
+@event.listens_for(Session, 'before_commit')
+def _bump_versions(session):
+    # Flush first so changes still pending in the unit of work are counted too
+    session.flush()
+    changed = changed_tables(session) & _versioned_tables
+    if not changed:
+        return
+    table = TableVersion.__table__
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    for table_name in sorted(changed):  # Always the same order, so concurrent commits can't deadlock
+        result = session.execute(
+            update(table)
+            .where(table.c.table_name == table_name)
+            .values(version=table.c.version + 1, changed_at=now)
+        )
+        if result.rowcount == 0:
+            session.execute(table.insert().values(table_name=table_name, version=1, changed_at=now))
+        if _bump_callbacks.get(table_name):
+            version = session.execute(
+                select(table.c.version).where(table.c.table_name == table_name)
+            ).scalar()
+            for callback in _bump_callbacks[table_name]:
+                callback(session, version)